@@ -0,0 +1,439 @@
+"""
+Saturation-throughput search for garnet_synth_traffic.py.
+
+For every topology x synthetic pattern pair the driver runs
+garnet_synth_traffic.py at several injection rates, in parallel, and
+locates the latency knee:
+
+- the lowest rate gives the zero-load latency;
+- a point is saturated when its average packet latency exceeds
+  --knee-factor times the zero-load latency, or when the accepted
+  throughput falls more than --tolerance below the offered rate;
+- the saturation throughput is the accepted throughput of the highest
+  unsaturated rate.
+
+With --rates the given rates are simply swept. Otherwise a grid of
+--grid rates between --min-rate and --max-rate is run first, then the
+bracket between the last unsaturated and the first saturated point is
+split into one point per worker until it is narrower than --resolution.
+
+With --phased every round of a pair is a single gem5 run that steps
+through its rates as phases (see --phase-rates in garnet_synth_traffic.py),
+so the configuration and instantiation cost is paid once per round.
+
+Every run gets its own output directory. Results are written to the
+sweep directory:
+
+- ``curves.csv``      one row per simulated point (latency vs. load).
+- ``saturation.csv``  zero-load latency and saturation point per pair.
+
+This script runs on the host with plain Python 3, not inside gem5. The
+gem5 script has to live in the gem5 configs tree (it imports
+``common`` and ``ruby`` from there), as in the README.
+
+Usage:
+------
+
+```
+python3 Garnet_Standalone/garnet_saturation.py \
+    --gem5 build/X86/gem5.opt \
+    --script configs/example/garnet_synth_traffic.py \
+    --topology Mesh_XY --synthetic uniform_random tornado \
+    --num-cpus 16 --mesh-rows 4 --sweep-dir saturation_out
+```
+"""
+import argparse
+import concurrent.futures
+import csv
+import itertools
+import json
+import os
+import sys
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(THIS_DIR, os.pardir, "Tools"))
+
+import stats_parser
+from gem5_runs import execute
+
+NETWORK = "system.ruby.network."
+RUBY_CLOCK = "system.ruby.clk_domain.clock"
+# The testers inject per cycle of the system clock (--sys-clock).
+TESTER_CLOCK = "system.clk_domain.clock"
+
+CURVE_FIELDS = [
+    "topology",
+    "synthetic",
+    "injection_rate",
+    "status",
+    "wallclock",
+    "packets_injected",
+    "packets_received",
+    "throughput",
+    "latency",
+    "network_latency",
+    "queueing_latency",
+    "hops",
+    "saturated",
+]
+
+SATURATION_FIELDS = [
+    "topology",
+    "synthetic",
+    "zero_load_latency",
+    "saturation_rate",
+    "saturation_throughput",
+    "first_saturated_rate",
+    "points",
+]
+
+
+def run_command(args, run):
+    rates = [f"{rate:.{args.precision}f}" for rate in run["injection_rates"]]
+    if args.phased:
+        rate_args = ["--phase-rates"] + rates
+    else:
+        rate_args = ["--injectionrate"] + rates
+    return [
+        args.gem5,
+        f"--outdir={run['outdir']}",
+        args.script,
+        "--network",
+        "garnet",
+        "--topology",
+        run["topology"],
+        "--synthetic",
+        run["synthetic"],
+    ] + rate_args + [
+        "--precision",
+        str(args.precision),
+        "--num-cpus",
+        str(args.num_cpus),
+        "--num-dirs",
+        str(args.num_dirs),
+        "--mesh-rows",
+        str(args.mesh_rows),
+        "--sim-cycles",
+        str(args.sim_cycles),
+    ] + args.script_args
+
+
+def network_metrics(store, dump, num_cpus):
+    """
+    Latencies (in network cycles) and accepted throughput of a dump. The
+    throughput is per tester cycle, like the offered injection rate.
+    """
+    # Latencies are recorded in ticks; convert them with the Ruby clock.
+    period = store.get(dump, RUBY_CLOCK) or 1.0
+    tester_period = store.get(dump, TESTER_CLOCK) or period
+    metrics = {}
+    for field in ("packets_injected", "packets_received"):
+        metrics[field] = store.get(dump, NETWORK + field + "::total")
+    cycles = store.get(dump, "simTicks", 0.0) / tester_period
+    if metrics["packets_received"] is not None and cycles:
+        metrics["throughput"] = metrics["packets_received"] / num_cpus / cycles
+    for field, stat in (
+        ("latency", "average_packet_latency"),
+        ("network_latency", "average_packet_network_latency"),
+        ("queueing_latency", "average_packet_queueing_latency"),
+    ):
+        value = store.get(dump, NETWORK + stat)
+        if value is not None:
+            metrics[field] = value / period
+    metrics["hops"] = store.get(dump, NETWORK + "average_hops")
+    return metrics
+
+
+def measure(run, returncode, wallclock, num_cpus):
+    """Curve rows of one run, one per injection rate."""
+    rates = run["injection_rates"]
+    phases_path = os.path.join(run["outdir"], "phases.json")
+    if os.path.exists(phases_path):
+        # Phased runs dump their phases from the highest rate down.
+        with open(phases_path) as f:
+            rates = json.load(f)["injection_rates"]
+    rows = []
+    for rate in rates:
+        row = {field: run.get(field) for field in CURVE_FIELDS}
+        row["injection_rate"] = rate
+        row["wallclock"] = round(wallclock / len(rates), 2)
+        rows.append(row)
+
+    stats_path = os.path.join(run["outdir"], "stats.txt")
+    if returncode != 0 or not os.path.exists(stats_path):
+        for row in rows:
+            row["status"] = f"failed ({returncode})"
+        return rows
+    if len(rates) > 1 and not os.path.exists(phases_path):
+        # Without it the dumps cannot be matched to their rates.
+        for row in rows:
+            row["status"] = "no phases.json"
+        return rows
+    store = stats_parser.open_store(stats_path)
+    for dump, row in enumerate(rows):
+        if dump >= len(store):
+            row["status"] = "no stats"
+            continue
+        row["status"] = "ok"
+        row.update(network_metrics(store, dump, num_cpus))
+    return rows
+
+
+def is_saturated(row, zero_load, knee_factor, tolerance):
+    if row["status"] != "ok" or None in (row["latency"], row["throughput"]):
+        return True
+    if row["latency"] != row["latency"]:
+        # No packet was received at all.
+        return True
+    if zero_load and row["latency"] > knee_factor * zero_load:
+        return True
+    offered = row["injection_rate"]
+    return row["throughput"] < (1 - tolerance) * offered
+
+
+def linspace(low, high, count, precision):
+    """``count`` distinct rates strictly inside (low, high], rounded."""
+    step = (high - low) / count
+    rates = {round(low + step * (i + 1), precision) for i in range(count)}
+    return sorted(r for r in rates if low < r <= high)
+
+
+class PairSearch:
+    """Simulated points and the current bracket of one topology/pattern."""
+
+    def __init__(self, args, topology, synthetic):
+        self.args = args
+        self.topology = topology
+        self.synthetic = synthetic
+        self.rows = {}
+
+    def runs(self, rates, round_number):
+        """Run descriptions that simulate ``rates``."""
+        if self.args.phased:
+            groups = [(f"round{round_number}", rates)] if rates else []
+        else:
+            groups = [
+                (f"rate{rate:.{self.args.precision}f}", [rate])
+                for rate in rates
+            ]
+        return [
+            {
+                "topology": self.topology,
+                "synthetic": self.synthetic,
+                "injection_rates": group,
+                "outdir": os.path.join(
+                    self.args.sweep_dir, self.topology, self.synthetic, name
+                ),
+            }
+            for name, group in groups
+        ]
+
+    def zero_load(self):
+        rows = [r for r in self.rows.values() if r["status"] == "ok"]
+        if not rows:
+            return None
+        return min(rows, key=lambda r: r["injection_rate"])["latency"]
+
+    def classify(self):
+        """Mark every point; saturation is monotonic in the rate."""
+        zero_load = self.zero_load()
+        saturated = False
+        for rate in sorted(self.rows):
+            row = self.rows[rate]
+            saturated = saturated or is_saturated(
+                row, zero_load, self.args.knee_factor, self.args.tolerance
+            )
+            row["saturated"] = saturated
+
+    def bracket(self):
+        """(last unsaturated, first saturated) rate; either may be None."""
+        self.classify()
+        below = above = None
+        for rate in sorted(self.rows):
+            if self.rows[rate]["saturated"]:
+                above = rate
+                break
+            below = rate
+        return below, above
+
+    def next_rates(self, width):
+        """Rates to simulate next, or [] once the search has converged."""
+        args = self.args
+        if args.rates:
+            rates = [round(r, args.precision) for r in args.rates]
+        elif not self.rows:
+            rates = [round(args.min_rate, args.precision)] + linspace(
+                args.min_rate, args.max_rate, args.grid - 1, args.precision
+            )
+        else:
+            below, above = self.bracket()
+            if below is None or above is None:
+                # Saturated at the lowest rate, or never saturated.
+                return []
+            if above - below <= args.resolution:
+                return []
+            rates = linspace(below, above, width + 1, args.precision)[:-1]
+        return [r for r in rates if r not in self.rows]
+
+    def summary(self):
+        below, above = self.bracket()
+        row = {
+            "topology": self.topology,
+            "synthetic": self.synthetic,
+            "zero_load_latency": self.zero_load(),
+            "saturation_rate": below,
+            "first_saturated_rate": above,
+            "points": len(self.rows),
+        }
+        if below is not None:
+            row["saturation_throughput"] = self.rows[below]["throughput"]
+        return row
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Find the saturation throughput of Garnet topologies "
+        "under synthetic traffic."
+    )
+    parser.add_argument(
+        "--gem5",
+        type=str,
+        default="build/X86/gem5.opt",
+        help="gem5 binary built with Garnet_standalone.",
+    )
+    parser.add_argument(
+        "--script",
+        type=str,
+        default="configs/example/garnet_synth_traffic.py",
+        help="garnet_synth_traffic.py inside the gem5 configs tree.",
+    )
+    parser.add_argument("--topology", nargs="+", default=["Mesh_XY"])
+    parser.add_argument("--synthetic", nargs="+", default=["uniform_random"])
+    parser.add_argument("--num-cpus", type=int, default=16)
+    parser.add_argument("--num-dirs", type=int, default=16)
+    parser.add_argument("--mesh-rows", type=int, default=4)
+    parser.add_argument("--sim-cycles", type=int, default=10000)
+    parser.add_argument(
+        "--rates",
+        nargs="+",
+        type=float,
+        default=None,
+        help="Sweep exactly these injection rates instead of searching.",
+    )
+    parser.add_argument("--min-rate", type=float, default=0.01)
+    parser.add_argument("--max-rate", type=float, default=0.5)
+    parser.add_argument(
+        "--grid",
+        type=int,
+        default=8,
+        help="Rates in the initial coarse sweep.",
+    )
+    parser.add_argument(
+        "--resolution",
+        type=float,
+        default=0.005,
+        help="Stop refining once the saturation bracket is this narrow.",
+    )
+    parser.add_argument(
+        "--precision",
+        type=int,
+        default=3,
+        help="Digits after the decimal point of the injection rates.",
+    )
+    parser.add_argument(
+        "--knee-factor",
+        type=float,
+        default=3.0,
+        help="Latency, as a multiple of the zero-load latency, that "
+        "counts as saturated.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="Fraction of the offered load that may go unaccepted "
+        "before a point counts as saturated.",
+    )
+    parser.add_argument(
+        "--phased",
+        action="store_true",
+        help="Simulate all rates of a pair and round in one gem5 run "
+        "(garnet_synth_traffic.py --phase-rates).",
+    )
+    parser.add_argument("--sweep-dir", type=str, default="saturation_out")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Concurrent runs (default: host cores).",
+    )
+    parser.add_argument(
+        "script_args",
+        nargs=argparse.REMAINDER,
+        help="Extra arguments after '--' are passed to every run.",
+    )
+    args = parser.parse_args()
+    args.script_args = [a for a in args.script_args if a != "--"]
+    args.resolution = max(args.resolution, 10**-args.precision)
+    workers = args.jobs or os.cpu_count() or 1
+
+    searches = [
+        PairSearch(args, topology, synthetic)
+        for topology in args.topology
+        for synthetic in args.synthetic
+    ]
+    # Refine all pairs together so the pool stays busy. Phased runs take
+    # a whole round of a pair each, so the round can be wider.
+    width = max(1, workers // len(searches))
+    if args.phased:
+        width = max(width, args.grid)
+    os.makedirs(args.sweep_dir, exist_ok=True)
+    curves_path = os.path.join(args.sweep_dir, "curves.csv")
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        for round_number in itertools.count(1):
+            pending = {}
+            for search in searches:
+                rates = search.next_rates(width)
+                for run in search.runs(rates, round_number):
+                    future = pool.submit(execute, run, run_command(args, run))
+                    pending[future] = (search, run)
+            if not pending:
+                break
+            print(f"Round {round_number}: {len(pending)} simulation(s)")
+            for future in concurrent.futures.as_completed(pending):
+                search, run = pending[future]
+                for row in measure(run, *future.result(), args.num_cpus):
+                    search.rows[row["injection_rate"]] = row
+                    print(
+                        f"  {search.topology} {search.synthetic} "
+                        f"rate {row['injection_rate']}: {row['status']}, "
+                        f"latency {row['latency']}"
+                    )
+
+    saturation = [search.summary() for search in searches]
+    with open(curves_path, "w", newline="") as curves_file:
+        writer = csv.DictWriter(curves_file, fieldnames=CURVE_FIELDS)
+        writer.writeheader()
+        for search in searches:
+            for rate in sorted(search.rows):
+                writer.writerow(search.rows[rate])
+    saturation_path = os.path.join(args.sweep_dir, "saturation.csv")
+    with open(saturation_path, "w", newline="") as saturation_file:
+        writer = csv.DictWriter(saturation_file, fieldnames=SATURATION_FIELDS)
+        writer.writeheader()
+        writer.writerows(saturation)
+
+    for row in saturation:
+        print(
+            f"{row['topology']:12s} {row['synthetic']:16s} "
+            f"zero-load {row['zero_load_latency']} cycles, "
+            f"saturation at {row['saturation_rate']} "
+            f"(throughput {row.get('saturation_throughput')})"
+        )
+    print(f"Curves written to {curves_path}")
+    print(f"Saturation points written to {saturation_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -27,6 +27,9 @@
 # Author: Tushar Krishna
 
 import argparse
+import atexit
+import json
+import math
 import os
 import sys
 
@@ -34,12 +37,25 @@ import m5
 from m5.defines import buildEnv
 from m5.objects import *
 from m5.util import addToPath
+from m5.util.convert import anyToLatency
 
 addToPath("../")
 
 from common import Options
 from ruby import Ruby
 
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Tools")
+)
+import coherence_trace
+from result_cache import (
+    ResultCache,
+    config_key,
+    file_digest,
+    gem5_identity,
+    script_config,
+)
+
 # Get paths we might need.  It's expected this file is in m5/configs/example.
 config_path = os.path.dirname(os.path.abspath(__file__))
 config_root = os.path.dirname(config_path)
@@ -120,27 +136,236 @@ parser.add_argument(
                         Set to -1 to inject randomly in all vnets.",
 )
 
+parser.add_argument(
+    "--phase-rates",
+    nargs="+",
+    type=float,
+    default=None,
+    metavar="I",
+    help="Simulate one phase of --sim-cycles per injection rate in a \
+                        single run, highest rate first, with one stats \
+                        dump per phase. Replaces --injectionrate.",
+)
+
+parser.add_argument(
+    "--phase-warmup",
+    type=int,
+    default=1000,
+    help="Ruby cycles at the start of every phase that are not measured, \
+                        so packets of the previous phase drain first.",
+)
+
+parser.add_argument(
+    "--trace",
+    type=str,
+    default=None,
+    help="Replay the flows of a coherence trace (Tools/coherence_trace.py) \
+                        instead of --synthetic traffic: one tester per \
+                        source, destination and vnet, at the flow's rate.",
+)
+
+parser.add_argument(
+    "--time-scale",
+    type=float,
+    default=1.0,
+    help="Replay the --trace this many times as fast (its rates are \
+                        multiplied by it).",
+)
+
+parser.add_argument(
+    "--record-coherence",
+    action="store_true",
+    help="Log the messages of the run to <outdir>/coherence.log (needs \
+                        gem5.opt); Tools/latency_hist.py turns it into \
+                        latency percentiles.",
+)
+
+parser.add_argument(
+    "--buffers-per-data-vc",
+    type=int,
+    default=None,
+    help="Garnet buffer depth (flits) of data VCs. Default: Garnet's.",
+)
+
+parser.add_argument(
+    "--buffers-per-ctrl-vc",
+    type=int,
+    default=None,
+    help="Garnet buffer depth (flits) of control VCs. Default: Garnet's.",
+)
+
+parser.add_argument(
+    "--result-cache",
+    type=str,
+    default=None,
+    help="Directory of the result cache. If this exact configuration has \
+                        already been simulated, its stats.txt, config.ini \
+                        (and phases.json) are copied to the outdir instead.",
+)
+
+parser.add_argument(
+    "--force-rerun",
+    action="store_true",
+    help="Ignore and replace any cached result for this configuration.",
+)
+
 #
 # Add the ruby specific and protocol specific options
 #
 Ruby.define_options(parser)
 
 args = parser.parse_args()
+if args.trace and args.phase_rates:
+    parser.error("--trace cannot be combined with --phase-rates")
+if args.record_coherence and args.result_cache:
+    parser.error("--record-coherence cannot be combined with --result-cache")
 
-cpus = [
-    GarnetSyntheticTraffic(
-        num_packets_max=args.num_packets_max,
-        single_sender=args.single_sender_id,
-        single_dest=args.single_dest_id,
-        sim_cycles=args.sim_cycles,
-        traffic_type=args.synthetic,
-        inj_rate=args.injectionrate,
-        inj_vnet=args.inj_vnet,
-        precision=args.precision,
-        num_dest=args.num_dirs,
+# Skip the simulation entirely when this configuration was already run.
+if args.result_cache:
+    result_cache = ResultCache(args.result_cache)
+    result_config = script_config(
+        __file__,
+        args,
+        exclude=("result_cache", "force_rerun"),
+        gem5=gem5_identity(),
+        trace=file_digest(args.trace) if args.trace else None,
+    )
+    result_key = config_key(result_config)
+    if args.force_rerun:
+        result_cache.invalidate(result_key)
+    elif result_cache.restore(
+        result_key,
+        m5.options.outdir,
+        required=["phases.json"] if args.phase_rates else [],
+    ):
+        print(f"Cached result {result_key} copied to {m5.options.outdir}")
+        sys.exit(0)
+
+
+def pattern_destination(traffic, source, num_destinations):
+    """Destination GarnetSyntheticTraffic picks for ``source``."""
+    radix = int(math.sqrt(num_destinations))
+    src_x, src_y = source % radix, source // radix
+    if traffic == "bit_complement":
+        return (radix - src_y - 1) * radix + (radix - src_x - 1)
+    if traffic == "bit_reverse":
+        num_bits = int(math.log2(num_destinations))
+        return int(format(source, f"0{num_bits}b")[::-1], 2)
+    if traffic == "bit_rotation":
+        if source % 2 == 0:
+            return source // 2
+        return source // 2 + num_destinations // 2
+    if traffic == "neighbor":
+        return src_y * radix + (src_x + 1) % radix
+    if traffic == "shuffle":
+        if source < num_destinations // 2:
+            return source * 2
+        return source * 2 - num_destinations + 1
+    if traffic == "transpose":
+        return src_x * radix + src_y
+    if traffic == "tornado":
+        return src_y * radix + (src_x + radix // 2 - 1) % radix
+    return -1
+
+
+if args.trace:
+    # The testers of a trace are one per flow, below.
+    tester_sets = []
+elif args.phase_rates:
+    phase_rates = sorted(
+        {round(rate, args.precision) for rate in args.phase_rates},
+        reverse=True,
+    )
+    # A tester can only stop injecting, never start late, so phases run
+    # from the highest rate down on stacked tester sets: set k stops at
+    # the end of phase k and injects the difference between the rates of
+    # phases k and k + 1.
+    tester_sets = [
+        (round(rate - next_rate, args.precision), args.sim_cycles * (k + 1))
+        for k, (rate, next_rate) in enumerate(
+            zip(phase_rates, phase_rates[1:] + [0])
+        )
+    ]
+else:
+    tester_sets = [(args.injectionrate, args.sim_cycles)]
+
+# Testers draw against 10^precision, so a trace's flows get more digits.
+TRACE_PRECISION = 6
+
+cpus = []
+# Node whose port each tester injects through.
+tester_nodes = []
+for inj_rate, sim_cycles in tester_sets:
+    for i in range(args.num_cpus):
+        single_sender = args.single_sender_id
+        single_dest = args.single_dest_id
+        num_packets_max = args.num_packets_max
+        if args.phase_rates:
+            # Testers pick destinations from their global instance number,
+            # which only matches the node for the first set. Give every
+            # tester its node's destination and sender role explicitly.
+            if single_dest < 0:
+                single_dest = pattern_destination(
+                    args.synthetic, i, args.num_dirs
+                )
+            if single_sender >= 0 and single_sender != i:
+                num_packets_max = 0
+            single_sender = -1
+        cpus.append(
+            GarnetSyntheticTraffic(
+                num_packets_max=num_packets_max,
+                single_sender=single_sender,
+                single_dest=single_dest,
+                sim_cycles=sim_cycles,
+                traffic_type=args.synthetic,
+                inj_rate=inj_rate,
+                inj_vnet=args.inj_vnet,
+                precision=args.precision,
+                num_dest=args.num_dirs,
+            )
+        )
+        tester_nodes.append(i)
+
+if args.trace:
+    # The testers inject per cycle of the system clock, so the flows'
+    # rates are per tester cycle, not per cycle of the recorded run. Ticks
+    # are picoseconds (setGlobalFrequency below).
+    tester_period = round(anyToLatency(args.sys_clock) * 1e12)
+    trace_rates, trace_cycles = coherence_trace.flows(
+        args.trace,
+        args.num_cpus,
+        args.num_dirs,
+        args.time_scale,
+        cycle_ticks=tester_period,
+    )
+    if not trace_rates:
+        parser.error(f"{args.trace} has no messages")
+    dropped = 0
+    for (source, destination, vnet), rate in sorted(trace_rates.items()):
+        if round(rate, TRACE_PRECISION) <= 0:
+            dropped += rate
+            continue
+        cpus.append(
+            GarnetSyntheticTraffic(
+                num_packets_max=-1,
+                single_sender=-1,
+                single_dest=destination,
+                sim_cycles=args.sim_cycles,
+                traffic_type="uniform_random",
+                inj_rate=min(round(rate, TRACE_PRECISION), 1),
+                inj_vnet=vnet,
+                precision=TRACE_PRECISION,
+                num_dest=args.num_dirs,
+            )
+        )
+        tester_nodes.append(source)
+    total = sum(trace_rates.values())
+    print(
+        f"Replaying {len(cpus)} flows of {args.trace} "
+        f"({trace_cycles} tester cycles recorded, x{args.time_scale}): "
+        f"{total / args.num_cpus:.4f} packets/node/cycle"
+        + (f", {dropped / total:.2%} of them dropped" if dropped else "")
     )
-    for i in range(args.num_cpus)
-]
 
 # create the desired simulated system
 system = System(cpu=cpus, mem_ranges=[AddrRange(args.mem_size)])
@@ -155,18 +380,23 @@ system.clk_domain = SrcClockDomain(
 
 Ruby.create_system(args, False, system)
 
+# Buffer depths are not among gem5's network options.
+if args.network == "garnet":
+    if args.buffers_per_data_vc is not None:
+        system.ruby.network.buffers_per_data_vc = args.buffers_per_data_vc
+    if args.buffers_per_ctrl_vc is not None:
+        system.ruby.network.buffers_per_ctrl_vc = args.buffers_per_ctrl_vc
+
 # Create a seperate clock domain for Ruby
 system.ruby.clk_domain = SrcClockDomain(
     clock=args.ruby_clock, voltage_domain=system.voltage_domain
 )
 
-i = 0
-for ruby_port in system.ruby._cpu_ports:
+for cpu, node in zip(cpus, tester_nodes):
     #
-    # Tie the cpu test ports to the ruby cpu port
+    # Tie the cpu test ports to the ruby cpu port of their node
     #
-    cpus[i].test = ruby_port.in_ports
-    i += 1
+    cpu.test = system.ruby._cpu_ports[node].in_ports
 
 # -----------------------
 # run simulation
@@ -181,7 +411,73 @@ m5.ticks.setGlobalFrequency("1ps")
 # instantiate configuration
 m5.instantiate()
 
-# simulate until program terminates
-exit_event = m5.simulate(args.abs_max_tick)
+# gem5 registers its stats dump at exit on the first m5.simulate(), and
+# exit handlers run in reverse order, so the result is cached after it.
+simulation_completed = False
+
+
+def store_result():
+    if simulation_completed:
+        result_cache.store(result_key, m5.options.outdir, result_config)
+
+
+if args.result_cache:
+    atexit.register(store_result)
+
+if args.record_coherence:
+    from m5 import debug, trace
+
+    trace.output(coherence_trace.LOG_FILE)
+    debug.flags[coherence_trace.DEBUG_FLAG].enable()
+
+
+def run_until_testers_done(phase_start, max_ticks):
+    """
+    Simulate for at most ``max_ticks``. Returns the exit event and whether
+    it was the testers of the current phase completing.
+    """
+    end = m5.curTick() + max_ticks
+    while True:
+        exit_event = m5.simulate(end - m5.curTick())
+        if exit_event.getCause() == "simulate() limit reached":
+            return exit_event, False
+        # Every tester of a set exits in the same tick; the exits left
+        # over from the previous phase are seen again at its start.
+        if m5.curTick() > phase_start:
+            return exit_event, True
+
+
+if args.phase_rates:
+    warmup_ticks = args.phase_warmup * m5.ticks.fromSeconds(
+        anyToLatency(args.ruby_clock)
+    )
+    with open(os.path.join(m5.options.outdir, "phases.json"), "w") as f:
+        json.dump(
+            {
+                "synthetic": args.synthetic,
+                "sim_cycles": args.sim_cycles,
+                "phase_warmup": args.phase_warmup,
+                "injection_rates": phase_rates,
+            },
+            f,
+            indent=2,
+        )
+    for phase, rate in enumerate(phase_rates):
+        phase_start = m5.curTick()
+        exit_event, done = run_until_testers_done(phase_start, warmup_ticks)
+        if done:
+            sys.exit(f"Phase {phase} ended within its --phase-warmup")
+        m5.stats.reset()
+        exit_event, done = run_until_testers_done(
+            phase_start, args.abs_max_tick
+        )
+        m5.stats.dump()
+        print(f"Phase {phase} (rate {rate}) ended @ tick {m5.curTick()}")
+        if not done:
+            break
+else:
+    # simulate until program terminates
+    exit_event = m5.simulate(args.abs_max_tick)
+simulation_completed = True
 
 print("Exiting @ tick", m5.curTick(), "because", exit_event.getCause())
@@ -0,0 +1,379 @@
+"""
+Garnet router/VC/buffer parameter tuner for garnet_synth_traffic.py.
+
+Searches the product of VCs per vnet, buffer depths, router pipeline
+latencies and link widths with successive halving: every configuration is
+first simulated for --min-cycles, then only the best 1/--eta of them are
+simulated again for --eta times as many cycles, and so on until one
+configuration is left or --max-cycles is reached. All runs of a rung are
+simulated in parallel.
+
+Objectives:
+
+- ``saturation``: the accepted throughput at the highest unsaturated rate
+  of a phased run over --rates (as in garnet_saturation.py), maximized.
+- ``latency``: the average packet latency at --target-rate, minimized.
+  Saturated points count as infinitely slow.
+
+The buffer cost of a configuration is the buffer storage of one router
+input port, in bits: VCs per vnet x (control vnets x control VC depth +
+data vnets x data VC depth) x link width. ``pareto.csv`` lists, for
+every rung, the configurations that no other configuration of the same
+rung beats in both the objective and the cost. Results from runs of
+different lengths are never compared with each other. Rung 0 compares
+all configurations, later rungs compare the survivors more accurately.
+``tuning.csv`` has every run.
+
+This script runs on the host with plain Python 3, not inside gem5; see
+garnet_saturation.py for where the gem5 script has to live.
+
+Usage:
+------
+
+```
+python3 Garnet_Standalone/garnet_tuner.py \
+    --gem5 build/X86/gem5.opt \
+    --script configs/example/garnet_synth_traffic.py \
+    --topology Mesh_XY --synthetic uniform_random --objective saturation \
+    --vcs 2 4 8 --data-buffers 4 8 --router-latency 1 2 \
+    --link-width-bits 64 128 --tune-dir tuning_out
+```
+"""
+import argparse
+import concurrent.futures
+import csv
+import itertools
+import math
+import os
+
+from garnet_saturation import (
+    is_saturated,
+    linspace,
+    measure,
+)
+from gem5_runs import execute
+
+# garnet_synth_traffic.py injects control packets in vnets 0 and 1 and
+# data packets in vnet 2.
+CTRL_VNETS, DATA_VNETS = 2, 1
+
+PARAMETERS = [
+    "vcs_per_vnet",
+    "buffers_per_ctrl_vc",
+    "buffers_per_data_vc",
+    "router_latency",
+    "link_width_bits",
+]
+
+TUNING_FIELDS = ["config", "rung", "sim_cycles"] + PARAMETERS + [
+    "buffer_bits",
+    "objective",
+    "zero_load_latency",
+    "wallclock",
+    "status",
+]
+
+
+def buffer_bits(config):
+    """Buffer storage of one router input port, in bits."""
+    flits = config["vcs_per_vnet"] * (
+        CTRL_VNETS * config["buffers_per_ctrl_vc"]
+        + DATA_VNETS * config["buffers_per_data_vc"]
+    )
+    return flits * config["link_width_bits"]
+
+
+def config_name(config):
+    return (
+        f"vc{config['vcs_per_vnet']}_cb{config['buffers_per_ctrl_vc']}"
+        f"_db{config['buffers_per_data_vc']}_rl{config['router_latency']}"
+        f"_w{config['link_width_bits']}"
+    )
+
+
+def run_command(args, run, config):
+    if args.objective == "saturation":
+        rate_args = ["--phase-rates"] + [
+            f"{rate:.{args.precision}f}" for rate in run["injection_rates"]
+        ]
+    else:
+        rate_args = ["--injectionrate", f"{args.target_rate}"]
+    return [
+        args.gem5,
+        f"--outdir={run['outdir']}",
+        args.script,
+        "--network",
+        "garnet",
+        "--topology",
+        args.topology,
+        "--synthetic",
+        args.synthetic,
+    ] + rate_args + [
+        "--precision",
+        str(args.precision),
+        "--num-cpus",
+        str(args.num_cpus),
+        "--num-dirs",
+        str(args.num_dirs),
+        "--mesh-rows",
+        str(args.mesh_rows),
+        "--sim-cycles",
+        str(run["sim_cycles"]),
+        "--vcs-per-vnet",
+        str(config["vcs_per_vnet"]),
+        "--buffers-per-ctrl-vc",
+        str(config["buffers_per_ctrl_vc"]),
+        "--buffers-per-data-vc",
+        str(config["buffers_per_data_vc"]),
+        "--router-latency",
+        str(config["router_latency"]),
+        "--link-width-bits",
+        str(config["link_width_bits"]),
+    ] + args.script_args
+
+
+def evaluate(args, rows):
+    """Objective value and zero-load latency of the curve rows of a run."""
+    rows = sorted(rows, key=lambda row: row["injection_rate"])
+    ok = [row for row in rows if row["status"] == "ok"]
+    zero_load = ok[0]["latency"] if ok else None
+    if args.objective == "latency":
+        row = rows[0]
+        if is_saturated(row, None, args.knee_factor, args.tolerance):
+            return math.inf, zero_load
+        return row["latency"], zero_load
+    # Saturation is monotonic in the rate, as in garnet_saturation.py.
+    throughput = 0.0
+    for row in rows:
+        if is_saturated(row, zero_load, args.knee_factor, args.tolerance):
+            break
+        throughput = row["throughput"]
+    return throughput, zero_load
+
+
+def better(args, a, b):
+    return a > b if args.objective == "saturation" else a < b
+
+
+def pareto_frontier(args, results):
+    """Results not dominated in both the objective and the buffer cost."""
+    frontier = []
+    for result in results:
+        dominated = any(
+            other["buffer_bits"] <= result["buffer_bits"]
+            and not better(args, result["objective"], other["objective"])
+            and (
+                other["buffer_bits"] < result["buffer_bits"]
+                or better(args, other["objective"], result["objective"])
+            )
+            for other in results
+        )
+        if not dominated:
+            frontier.append(result)
+    return sorted(frontier, key=lambda result: result["buffer_bits"])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Tune Garnet router, VC and buffer parameters with "
+        "successive halving."
+    )
+    parser.add_argument(
+        "--gem5",
+        type=str,
+        default="build/X86/gem5.opt",
+        help="gem5 binary built with Garnet_standalone.",
+    )
+    parser.add_argument(
+        "--script",
+        type=str,
+        default="configs/example/garnet_synth_traffic.py",
+        help="garnet_synth_traffic.py inside the gem5 configs tree.",
+    )
+    parser.add_argument("--topology", type=str, default="Mesh_XY")
+    parser.add_argument("--synthetic", type=str, default="uniform_random")
+    parser.add_argument("--num-cpus", type=int, default=16)
+    parser.add_argument("--num-dirs", type=int, default=16)
+    parser.add_argument("--mesh-rows", type=int, default=4)
+    parser.add_argument(
+        "--objective",
+        type=str,
+        default="saturation",
+        choices=["saturation", "latency"],
+    )
+    parser.add_argument(
+        "--target-rate",
+        type=float,
+        default=0.1,
+        help="Injection rate of the latency objective.",
+    )
+    parser.add_argument(
+        "--rates",
+        nargs="+",
+        type=float,
+        default=None,
+        help="Injection rates of the saturation objective (default: "
+        "--grid rates from --min-rate to --max-rate).",
+    )
+    parser.add_argument("--min-rate", type=float, default=0.02)
+    parser.add_argument("--max-rate", type=float, default=0.5)
+    parser.add_argument("--grid", type=int, default=12)
+    parser.add_argument("--vcs", nargs="+", type=int, default=[2, 4, 8])
+    parser.add_argument(
+        "--ctrl-buffers", nargs="+", type=int, default=[1]
+    )
+    parser.add_argument(
+        "--data-buffers", nargs="+", type=int, default=[2, 4, 8]
+    )
+    parser.add_argument(
+        "--router-latency", nargs="+", type=int, default=[1, 2]
+    )
+    parser.add_argument(
+        "--link-width-bits", nargs="+", type=int, default=[64, 128]
+    )
+    parser.add_argument("--min-cycles", type=int, default=2000)
+    parser.add_argument("--max-cycles", type=int, default=50000)
+    parser.add_argument(
+        "--eta",
+        type=int,
+        default=3,
+        help="Survivors of a rung are 1/eta of its runs, simulated eta "
+        "times longer.",
+    )
+    parser.add_argument("--precision", type=int, default=3)
+    parser.add_argument("--knee-factor", type=float, default=3.0)
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--tune-dir", type=str, default="tuning_out")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Concurrent runs (default: host cores).",
+    )
+    parser.add_argument(
+        "script_args",
+        nargs=argparse.REMAINDER,
+        help="Extra arguments after '--' are passed to every run.",
+    )
+    args = parser.parse_args()
+    args.script_args = [a for a in args.script_args if a != "--"]
+    if args.eta < 2:
+        parser.error("--eta must be at least 2")
+    rates = args.rates or [round(args.min_rate, args.precision)] + linspace(
+        args.min_rate, args.max_rate, args.grid - 1, args.precision
+    )
+    workers = args.jobs or os.cpu_count() or 1
+
+    configs = [
+        dict(zip(PARAMETERS, values))
+        for values in itertools.product(
+            args.vcs,
+            args.ctrl_buffers,
+            args.data_buffers,
+            args.router_latency,
+            args.link_width_bits,
+        )
+    ]
+    os.makedirs(args.tune_dir, exist_ok=True)
+    evaluations = []
+    frontier = []
+    survivors = configs
+    cycles = args.min_cycles
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        for rung in itertools.count():
+            print(
+                f"Rung {rung}: {len(survivors)} configuration(s) x "
+                f"{cycles} cycles"
+            )
+            pending = {}
+            for config in survivors:
+                run = {
+                    "topology": args.topology,
+                    "synthetic": args.synthetic,
+                    "injection_rates": (
+                        rates
+                        if args.objective == "saturation"
+                        else [args.target_rate]
+                    ),
+                    "sim_cycles": cycles,
+                    "outdir": os.path.join(
+                        args.tune_dir, f"rung{rung}", config_name(config)
+                    ),
+                }
+                future = pool.submit(
+                    execute, run, run_command(args, run, config)
+                )
+                pending[future] = (config, run)
+            results = []
+            for future in concurrent.futures.as_completed(pending):
+                config, run = pending[future]
+                returncode, wallclock = future.result()
+                rows = measure(run, returncode, wallclock, args.num_cpus)
+                objective, zero_load = evaluate(args, rows)
+                result = dict(
+                    config,
+                    config=config_name(config),
+                    rung=rung,
+                    sim_cycles=cycles,
+                    buffer_bits=buffer_bits(config),
+                    objective=objective,
+                    zero_load_latency=zero_load,
+                    wallclock=round(wallclock, 2),
+                    status=rows[0]["status"],
+                )
+                print(
+                    f"  {result['config']}: {args.objective} "
+                    f"{objective:.4g}, {result['buffer_bits']} buffer bits"
+                )
+                results.append(result)
+            evaluations += results
+            frontier += pareto_frontier(args, results)
+
+            # Best first; ties go to the cheaper configuration.
+            results.sort(
+                key=lambda r: (
+                    -r["objective"]
+                    if args.objective == "saturation"
+                    else r["objective"],
+                    r["buffer_bits"],
+                )
+            )
+            if len(results) <= 1 or cycles >= args.max_cycles:
+                break
+            keep = max(1, len(results) // args.eta)
+            survivors = [
+                {name: result[name] for name in PARAMETERS}
+                for result in results[:keep]
+            ]
+            cycles = min(cycles * args.eta, args.max_cycles)
+
+    tuning_path = os.path.join(args.tune_dir, "tuning.csv")
+    with open(tuning_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=TUNING_FIELDS)
+        writer.writeheader()
+        writer.writerows(evaluations)
+    pareto_path = os.path.join(args.tune_dir, "pareto.csv")
+    with open(pareto_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=TUNING_FIELDS)
+        writer.writeheader()
+        writer.writerows(frontier)
+
+    best = results[0]
+    print(
+        f"Best: {best['config']} ({args.objective} {best['objective']:.4g} "
+        f"after {best['sim_cycles']} cycles)"
+    )
+    print("Pareto frontiers (rung, buffer bits, objective, cycles):")
+    for result in frontier:
+        print(
+            f"  {result['rung']:4d}  {result['buffer_bits']:8d}  "
+            f"{result['objective']:10.4g}  {result['sim_cycles']:8d}  "
+            f"{result['config']}"
+        )
+    print(f"Runs written to {tuning_path}")
+    print(f"Pareto frontiers written to {pareto_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,528 @@
+"""
+Per-link and per-router utilization heatmaps of Garnet runs, with the
+hottest links and routers flagged.
+
+For every stats dump of every run (one per injection rate, see
+garnet_saturation.py), the script places the routers on the grid of the
+topology and reports:
+
+- routers: flits through the crossbar per cycle, and input buffer
+  writes and reads per cycle, from the routers' own stats;
+- links: flits per cycle of every link between routers. Garnet only
+  counts link flits in total (``int_link_utilization``), but it counts
+  the packets between every pair of routers
+  (``ctrl_traffic_distribution`` and ``data_traffic_distribution``).
+  Those are routed over the links of the run's config.ini along the
+  shortest weighted routes, which is what the table-based routing and
+  Mesh_XY's weighted XY routes follow, and compared with the total;
+- the average load of every VC across links (``avg_vc_load``), Garnet's
+  only buffer occupancy stat.
+
+A router or link is hot when its load is at least --hot-factor times the
+mean over all routers or links. Each dump is printed as a shaded map,
+routers in brackets and the heavier direction of every link between grid
+neighbours in between, followed by the --top busiest routers and links.
+With --out-dir the maps are also drawn as SVG files, one per run and
+rate, and every value is written to ``heatmap.csv``.
+
+Routing, placement and link loads are computed once per network as
+index arrays, so a 16x16 mesh (256 routers, 65536 router pairs) takes
+well under a second per dump.
+
+Runs are outdirs with a stats.txt and config.ini, or directories that
+contain them, e.g. a garnet_saturation.py sweep directory. Routers sit
+on ``--mesh-rows`` rows, as in Mesh_XY; the run.json of a sweep run
+gives its rows, pattern and rates. This script runs on the host and
+needs NumPy.
+
+Usage:
+------
+
+```
+python3 Garnet_Standalone/link_heatmap.py saturation_out --out-dir heat
+python3 Garnet_Standalone/link_heatmap.py m5out --mesh-rows 4 --top 8
+```
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import re
+import sys
+
+import numpy as np
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(THIS_DIR, os.pardir, "Tools"))
+
+import coherence_trace
+import noc_topologies
+import stats_parser
+from latency_hist import read_links
+
+ROUTER_STATS = ["crossbar_activity", "buffer_writes", "buffer_reads"]
+
+TRAFFIC = re.compile(
+    r"\.(ctrl|data)_traffic_distribution(?:_|::)(\d+)::(\d+)$"
+)
+
+# Map shades, from idle to the busiest router or link of a dump.
+SHADES = " .:-=+*#%@"
+
+CSV_FIELDS = [
+    "run",
+    "topology",
+    "synthetic",
+    "injection_rate",
+    "kind",
+    "name",
+    "src",
+    "dst",
+    "x",
+    "y",
+    "flits_per_cycle",
+    "buffer_writes_per_cycle",
+    "buffer_reads_per_cycle",
+    "hot",
+]
+
+
+class Network:
+    """
+    Routers, links and routes of the network of a config.ini, as arrays:
+    link ``l`` goes from router ``link_src[l]`` to ``link_dst[l]``, and the
+    route between routers s and d uses links ``route_link[k]`` for every k
+    with ``route_pair[k] == s * num_routers + d``.
+    """
+
+    def __init__(self, config, mesh_rows=None):
+        routers, links, _ = read_links(config)
+        self.router_names = sorted(routers, key=routers.get)
+        self.num_routers = len(routers)
+        self.link_names = [link[0] for link in links]
+        self.link_src = np.array([link[1] for link in links], dtype=np.int64)
+        self.link_dst = np.array([link[2] for link in links], dtype=np.int64)
+        self.prefix = next(
+            (
+                name
+                for name, section in config.items()
+                if section.get("type") in ("GarnetNetwork", "SimpleNetwork")
+            ),
+            "system.ruby.network",
+        )
+        network = coherence_trace.Network(config)
+        self.cycle_ticks = network.cycle_ticks or 1000
+        flit_bytes = int(config.get(self.prefix, {}).get("ni_flit_size", 16))
+        # Flits per packet of the control and data traffic distributions.
+        self.flits = {
+            "ctrl": math.ceil(coherence_trace.CONTROL_BYTES / flit_bytes),
+            "data": math.ceil(
+                (coherence_trace.CONTROL_BYTES + network.block_bytes)
+                / flit_bytes
+            ),
+        }
+
+        rows = mesh_rows or math.ceil(math.sqrt(self.num_routers))
+        self.cols = max(1, math.ceil(self.num_routers / rows))
+        self.rows = math.ceil(self.num_routers / self.cols)
+        ids = np.arange(self.num_routers)
+        self.x, self.y = ids % self.cols, ids // self.cols
+
+        self.route_pair, self.route_link = self._routes(links)
+
+    def _routes(self, links):
+        table = noc_topologies.routing_table(
+            self.num_routers, [link[1:] for link in links]
+        )
+        next_hop = np.array(
+            [[-1 if hop is None else hop for hop in row] for row in table],
+            dtype=np.int64,
+        )
+        link_id = np.full_like(next_hop, -1)
+        # The first of parallel links carries the route.
+        link_id[self.link_src[::-1], self.link_dst[::-1]] = np.arange(
+            len(self.link_src)
+        )[::-1]
+        # Advance every router pair one hop at a time.
+        pair = np.arange(self.num_routers**2)
+        current, dst = np.divmod(pair, self.num_routers)
+        pairs, hops = [], []
+        while True:
+            moving = (current != dst) & (next_hop[current, dst] >= 0)
+            pair, current, dst = pair[moving], current[moving], dst[moving]
+            if not len(pair):
+                break
+            following = next_hop[current, dst]
+            pairs.append(pair)
+            hops.append(link_id[current, following])
+            current = following
+        if not pairs:
+            return np.zeros(0, np.int64), np.zeros(0, np.int64)
+        return np.concatenate(pairs), np.concatenate(hops)
+
+    def link_flits(self, traffic):
+        """Flits over every link for ``traffic[s * num_routers + d]``."""
+        return np.bincount(
+            self.route_link,
+            weights=traffic[self.route_pair],
+            minlength=len(self.link_names),
+        )
+
+
+def find_runs(paths):
+    """
+    Outdirs with a stats.txt and config.ini under ``paths``, and those
+    with a stats.txt but no config.ini to route over.
+    """
+    runs, skipped = [], []
+    for path in paths:
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            if "stats.txt" in files:
+                if "config.ini" in files:
+                    runs.append(root)
+                else:
+                    skipped.append(root)
+    return runs, skipped
+
+
+def run_info(outdir, mesh_rows):
+    """Topology, pattern, rates and mesh rows of a run, where known."""
+    info = {"topology": None, "synthetic": None, "injection_rates": []}
+    run_path = os.path.join(outdir, "run.json")
+    if os.path.exists(run_path):
+        with open(run_path) as f:
+            run = json.load(f)
+        for key in ("topology", "synthetic", "injection_rates"):
+            info[key] = run.get(key) or info[key]
+        command = run.get("command", [])
+        if mesh_rows is None and "--mesh-rows" in command:
+            mesh_rows = int(command[command.index("--mesh-rows") + 1])
+    phases_path = os.path.join(outdir, "phases.json")
+    if os.path.exists(phases_path):
+        with open(phases_path) as f:
+            phases = json.load(f)
+        info["synthetic"] = phases.get("synthetic", info["synthetic"])
+        info["injection_rates"] = phases["injection_rates"]
+    info["mesh_rows"] = mesh_rows
+    return info
+
+
+def dump_loads(network, dump):
+    """Per-cycle router and link loads of one stats dump."""
+    cycles = dump.get("simTicks", 0.0) / network.cycle_ticks
+    if not cycles:
+        return None
+    routers = {
+        stat: np.array(
+            [
+                dump.get(f"{name}.{stat}", np.nan)
+                for name in network.router_names
+            ]
+        )
+        / cycles
+        for stat in ROUTER_STATS
+    }
+    traffic = np.zeros(network.num_routers**2)
+    counted = False
+    for key, value in dump.items():
+        match = TRAFFIC.search(key)
+        if match and key.startswith(network.prefix):
+            kind, src, dst = match.groups()
+            src, dst = int(src), int(dst)
+            if src < network.num_routers and dst < network.num_routers:
+                traffic[src * network.num_routers + dst] += (
+                    value * network.flits[kind]
+                )
+                counted = True
+    links = network.link_flits(traffic) / cycles if counted else None
+    measured = dump.get(f"{network.prefix}.int_link_utilization")
+    vc_load = stats_parser.group_stat(dump, f"{network.prefix}.avg_vc_load")
+    return {
+        "cycles": cycles,
+        "routers": routers,
+        "links": links,
+        "measured_link_flits": measured,
+        "vc_load": [
+            vc_load[sub]
+            for sub in sorted(
+                (sub for sub in vc_load if sub and sub.isdigit()), key=int
+            )
+        ],
+    }
+
+
+def hot(values, factor):
+    """Mask of the values at least ``factor`` times their mean."""
+    mean = np.nanmean(values) if len(values) else 0.0
+    return (values >= factor * mean) & (values > 0)
+
+
+def shade(value, peak):
+    if not peak or value != value:
+        return SHADES[0]
+    return SHADES[min(len(SHADES) - 1, int(value / peak * len(SHADES)))]
+
+
+def text_map(network, router_load, link_load):
+    """Routers in brackets, grid-neighbour links between them."""
+    peak_router = np.nanmax(router_load) if len(router_load) else 0.0
+    peak_link = link_load.max() if link_load is not None else 0.0
+    # Heavier direction of the link between two grid neighbours.
+    between = {}
+    if link_load is not None:
+        for src, dst, load in zip(
+            network.link_src, network.link_dst, link_load
+        ):
+            dx = network.x[dst] - network.x[src]
+            dy = network.y[dst] - network.y[src]
+            if abs(dx) + abs(dy) == 1:
+                key = min(src, dst), max(src, dst)
+                between[key] = max(between.get(key, 0.0), load)
+    lines = []
+    for y in range(network.rows):
+        routers, below = "", ""
+        for x in range(network.cols):
+            router = y * network.cols + x
+            if router >= network.num_routers:
+                break
+            routers += f"[{shade(router_load[router], peak_router)}]"
+            east = between.get((router, router + 1))
+            south = between.get((router, router + network.cols))
+            routers += shade(east, peak_link) if east is not None else " "
+            below += f" {shade(south, peak_link)}  " if south else "    "
+        lines.append(routers.rstrip())
+        if below.strip():
+            lines.append(below.rstrip())
+    return lines
+
+
+def svg_map(network, title, router_load, link_load):
+    """The routers and links of a dump, red by load, as an SVG image."""
+    step, size, offset = 80, 30, 5
+    width = network.cols * step + step // 2
+    height = network.rows * step + step
+    peak_router = np.nanmax(router_load) if len(router_load) else 0.0
+    peak_link = link_load.max() if link_load is not None else 0.0
+
+    def color(value, peak):
+        level = 0 if not peak or value != value else min(1, value / peak)
+        fade = round(255 * (1 - level))
+        return f"rgb(255,{fade},{fade})"
+
+    def center(router):
+        return (
+            step // 2 + network.x[router] * step,
+            step + network.y[router] * step,
+        )
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" '
+        f'height="{height}" font-family="monospace" font-size="10">',
+        f'<text x="10" y="20" font-size="14">{title}</text>',
+    ]
+    if link_load is not None:
+        for name, src, dst, load in zip(
+            network.link_names, network.link_src, network.link_dst, link_load
+        ):
+            (x1, y1), (x2, y2) = center(src), center(dst)
+            # Shift the two directions of a link apart.
+            length = math.hypot(x2 - x1, y2 - y1) or 1
+            nx, ny = (y2 - y1) / length * offset, (x1 - x2) / length * offset
+            parts.append(
+                f'<line x1="{x1 + nx:.1f}" y1="{y1 + ny:.1f}" '
+                f'x2="{x2 + nx:.1f}" y2="{y2 + ny:.1f}" stroke-width="4" '
+                f'stroke="{color(load, peak_link)}">'
+                f"<title>{name}: {load:.4f} flits/cycle</title></line>"
+            )
+    for router, load in enumerate(router_load):
+        x, y = center(router)
+        parts.append(
+            f'<rect x="{x - size // 2}" y="{y - size // 2}" width="{size}" '
+            f'height="{size}" stroke="black" '
+            f'fill="{color(load, peak_router)}">'
+            f"<title>{network.router_names[router]}: {load:.4f} "
+            "flits/cycle</title></rect>"
+            f'<text x="{x - size // 2 + 2}" y="{y + 3}">{router}</text>'
+        )
+    parts.append("</svg>")
+    return "\n".join(parts) + "\n"
+
+
+def report(network, label, loads, args, writer, row_base):
+    routers = loads["routers"]["crossbar_activity"]
+    links = loads["links"]
+    hot_routers = hot(routers, args.hot_factor)
+    print(f"\n{label} ({loads['cycles']:.0f} cycles)")
+    if links is not None:
+        hot_links = hot(links, args.hot_factor)
+        line = (
+            f"  links: mean {links.mean():.4f}, max {links.max():.4f} "
+            "flits/cycle"
+        )
+        if loads["measured_link_flits"] is not None:
+            routed = links.sum() * loads["cycles"]
+            line += (
+                f"; {routed:.0f} routed flit hops, Garnet counted "
+                f"{loads['measured_link_flits']:.0f}"
+            )
+        print(line)
+    else:
+        hot_links = None
+        print("  links: no traffic distribution in the stats")
+    print(
+        f"  routers: mean {np.nanmean(routers):.4f}, "
+        f"max {np.nanmax(routers):.4f} crossbar flits/cycle"
+    )
+    if loads["vc_load"]:
+        print(
+            "  avg_vc_load: "
+            + " ".join(f"{value:.3f}" for value in loads["vc_load"])
+        )
+    for line in text_map(network, routers, links):
+        print("    " + line)
+    print(f"    shades '{SHADES}' from idle to the busiest")
+
+    print(f"  busiest routers (hot: >= {args.hot_factor:g}x mean):")
+    for router in np.argsort(-np.nan_to_num(routers))[: args.top]:
+        flag = "  HOT" if hot_routers[router] else ""
+        print(
+            f"    {router:4d} ({network.x[router]},{network.y[router]}) "
+            f"{routers[router]:.4f}{flag}"
+        )
+    if links is not None:
+        print("  busiest links:")
+        for link in np.argsort(-links)[: args.top]:
+            flag = "  HOT" if hot_links[link] else ""
+            print(
+                f"    {network.link_src[link]:4d} -> "
+                f"{network.link_dst[link]:4d} {links[link]:.4f}{flag}"
+            )
+
+    if writer is not None:
+        for router, name in enumerate(network.router_names):
+            writer.writerow(
+                dict(
+                    row_base,
+                    kind="router",
+                    name=name,
+                    src=router,
+                    x=network.x[router],
+                    y=network.y[router],
+                    flits_per_cycle=routers[router],
+                    buffer_writes_per_cycle=loads["routers"]["buffer_writes"][
+                        router
+                    ],
+                    buffer_reads_per_cycle=loads["routers"]["buffer_reads"][
+                        router
+                    ],
+                    hot=int(hot_routers[router]),
+                )
+            )
+        for link, name in enumerate(network.link_names):
+            if links is None:
+                break
+            writer.writerow(
+                dict(
+                    row_base,
+                    kind="link",
+                    name=name,
+                    src=network.link_src[link],
+                    dst=network.link_dst[link],
+                    flits_per_cycle=links[link],
+                    hot=int(hot_links[link]),
+                )
+            )
+    if args.out_dir:
+        filename = re.sub(r"[^\w.-]+", "_", label) + ".svg"
+        with open(os.path.join(args.out_dir, filename), "w") as f:
+            f.write(svg_map(network, label, routers, links))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Link and router utilization heatmaps of Garnet runs."
+    )
+    parser.add_argument(
+        "runs",
+        type=str,
+        nargs="+",
+        help="Outdirs, or directories containing them (e.g. a sweep dir).",
+    )
+    parser.add_argument(
+        "--mesh-rows",
+        type=int,
+        default=None,
+        help="Router rows (default: from run.json, else the most square "
+        "grid).",
+    )
+    parser.add_argument(
+        "--hot-factor",
+        type=float,
+        default=2.0,
+        help="Flag routers and links with at least this times the mean "
+        "load.",
+    )
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument(
+        "--out-dir",
+        type=str,
+        default=None,
+        help="Write one SVG heatmap per run and rate, and heatmap.csv.",
+    )
+    args = parser.parse_args()
+
+    outdirs, skipped = find_runs(args.runs)
+    for outdir in skipped:
+        print(f"Warning: skipping {outdir}, which has no config.ini")
+    if not outdirs:
+        sys.exit("No outdir with stats.txt and config.ini found")
+    writer = None
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+        csv_file = open(os.path.join(args.out_dir, "heatmap.csv"), "w")
+        writer = csv.DictWriter(csv_file, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+
+    # Sweeps repeat the same network; build its routes once.
+    networks = {}
+    for outdir in outdirs:
+        info = run_info(outdir, args.mesh_rows)
+        config = coherence_trace.read_config(
+            os.path.join(outdir, "config.ini")
+        )
+        key = tuple(read_links(config)[1]), info["mesh_rows"]
+        if key not in networks:
+            networks[key] = Network(config, info["mesh_rows"])
+        network = networks[key]
+        name = os.path.normpath(outdir)
+        rates = info["injection_rates"]
+        title = " ".join(
+            part for part in (info["topology"], info["synthetic"]) if part
+        )
+        for dump_index, dump in enumerate(
+            stats_parser.iter_dumps(os.path.join(outdir, "stats.txt"))
+        ):
+            loads = dump_loads(network, dump)
+            if loads is None:
+                continue
+            rate = rates[dump_index] if dump_index < len(rates) else None
+            if rate is not None:
+                label = f"{title or name} rate {rate}"
+            else:
+                label = f"{title or name} dump {dump_index}"
+            row_base = {
+                "run": name,
+                "topology": info["topology"],
+                "synthetic": info["synthetic"],
+                "injection_rate": rate,
+            }
+            report(network, label, loads, args, writer, row_base)
+    if writer is not None:
+        csv_file.close()
+        print(f"\nHeatmaps and heatmap.csv written to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
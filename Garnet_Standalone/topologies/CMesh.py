@@ -0,0 +1,12 @@
+"""
+Concentrated mesh: every 4 CPUs share a router.
+
+See Grid_Topology.py.
+"""
+
+from topologies.Grid_Topology import Grid_Topology
+
+
+class CMesh(Grid_Topology):
+    description = "CMesh"
+    grid = "cmesh"
@@ -0,0 +1,12 @@
+"""
+Mesh with express links that skip routers along rows and columns.
+
+See Grid_Topology.py.
+"""
+
+from topologies.Grid_Topology import Grid_Topology
+
+
+class Express_Mesh(Grid_Topology):
+    description = "Express_Mesh"
+    grid = "express"
@@ -0,0 +1,13 @@
+"""
+Flattened butterfly: every 4 CPUs share a router, linked to all
+routers of its row and column.
+
+See Grid_Topology.py.
+"""
+
+from topologies.Grid_Topology import Grid_Topology
+
+
+class Flattened_Butterfly(Grid_Topology):
+    description = "Flattened_Butterfly"
+    grid = "fbfly"
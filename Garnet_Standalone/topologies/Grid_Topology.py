@@ -0,0 +1,70 @@
+"""
+Garnet topologies built from the grids of Tools/noc_topologies.py.
+
+Like garnet_synth_traffic.py, these modules live in the gem5 configs tree:
+copy them to configs/topologies/ and select one with --topology, e.g.
+``--topology CMesh``. Grid_Topology itself is a mesh of one router per
+CPU; CMesh, Express_Mesh and Flattened_Butterfly are its concentrated,
+express-link and flattened-butterfly variants.
+
+There are --num-cpus endpoints. Controller i attaches to endpoint
+i % num_cpus, as Mesh_XY attaches it to router i % num_cpus, so each
+endpoint has one CPU's controllers and possibly a directory. The grid is
+the most square one; --mesh-rows is not used. Links carry the routing
+weights of noc_topologies (X before Y, never away from the destination),
+which the default table-based routing follows.
+"""
+
+import os
+import sys
+
+from m5.objects import *
+from m5.params import *
+
+from topologies.BaseTopology import SimpleTopology
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Tools")
+)
+import noc_topologies
+
+
+class Grid_Topology(SimpleTopology):
+    description = "Grid_Topology"
+    grid = "mesh"
+
+    def __init__(self, controllers):
+        self.nodes = controllers
+
+    def makeTopology(self, options, network, IntLink, ExtLink, Router):
+        grid = noc_topologies.Grid(options.num_cpus, self.grid)
+        link_latency = options.link_latency
+        router_latency = options.router_latency
+
+        routers = [
+            Router(router_id=i, latency=router_latency)
+            for i in range(grid.num_routers)
+        ]
+        network.routers = routers
+
+        ext_links = [
+            ExtLink(
+                link_id=i,
+                ext_node=node,
+                int_node=routers[grid.endpoint_router(i % options.num_cpus)],
+                latency=link_latency,
+            )
+            for i, node in enumerate(self.nodes)
+        ]
+        network.ext_links = ext_links
+
+        network.int_links = [
+            IntLink(
+                link_id=len(ext_links) + i,
+                src_node=routers[src],
+                dst_node=routers[dst],
+                latency=link_latency,
+                weight=weight,
+            )
+            for i, (src, dst, weight) in enumerate(grid.links)
+        ]
@@ -7,61 +7,169 @@ from m5.util import (
     panic,
 )
 
+from chiplet_topology import INTER, LINK_CLASSES
+
+
+L3_POLICIES = ("local", "interleaved")
+
+
+def interleaved_ranges(mem_range, count, granularity):
+    """
+    Split ``mem_range`` into ``count`` ranges interleaved every
+    ``granularity`` bytes, one per memory controller and directory.
+    """
+    if count == 1:
+        return [mem_range]
+    bits = int(math.log(count, 2))
+    if 2**bits != count:
+        raise Exception("The number of directories is not a power of 2!")
+    low_bit = int(math.log(granularity, 2))
+    if 2**low_bit != granularity:
+        raise Exception("The interleaving granularity is not a power of 2!")
+    return [
+        AddrRange(
+            start=mem_range.start,
+            size=mem_range.size(),
+            intlvHighBit=low_bit + bits - 1,
+            intlvBits=bits,
+            intlvMatch=i,
+        )
+        for i in range(count)
+    ]
+
+
+def block_size_bits(system):
+    bits = int(math.log(system.cache_line_size, 2))
+    if 2**bits != int(system.cache_line_size):
+        raise Exception("Cache line size is not a power of 2!")
+    return bits
+
 
 class MyCacheSystem(RubySystem):
+    """
+    MESI Three Level hierarchy of a multi-chiplet system: private L1 and L2
+    caches per core, and ``l3_banks`` L3 banks per chiplet, on the chiplet's
+    gateway router. The L3 placement policy (``L3_POLICIES``) decides which
+    banks hold a line:
+
+    - ``local``: each chiplet is one MESI Three Level cluster, so its cores
+      only use its own L3 banks and the directories keep the chiplets
+      coherent. Every L3 hit is local. Coherence is two-level: the L3
+      tracks the sharers on its chiplet, the directories only which
+      chiplets' L3s hold a line.
+    - ``interleaved``: the banks of all chiplets form a single cluster, one
+      shared L3 interleaved by line address. A line is cached once, but
+      only 1 / num_chiplets of the L3 accesses stay on the chiplet.
+
+    The bank of a line is picked by the protocol from the line address
+    bits, so page-granular (first-touch) placement needs protocol changes;
+    Tools/cache_sim.py --chiplets evaluates it on memory traces.
+
+    There is one directory per memory controller, for the address range of
+    the controller's DRAM (see interleaved_ranges). Directory d sits on the
+    gateway of chiplet d modulo the chiplet count.
+    """
+
     def __init__(self):
-        if buildEnv["PROTOCOL"] != "MSI":
-            fatal("This system assumes MSI from learning gem5!")
+        if buildEnv["PROTOCOL"] != "MESI_Three_Level":
+            fatal("This system assumes MESI_Three_Level!")
 
         super().__init__()
 
-    def setup(self, system, cpus, mem_ctrls):
-        
+    def setup(self, system, cpus, mem_ctrls, topology, network="simple",
+              l3_banks=1, l3_policy="local", link_classes=LINK_CLASSES):
+        """
+        network is "simple", "garnet", or "bridged": Garnet between the
+        chiplets on a bridged topology, whose chiplets are local routers
+        with point-to-point links to their cores. link_classes maps INTRA
+        and INTER to the LinkClass of on-die and die-to-die links.
+        """
+        if len(cpus) != topology.num_cores:
+            panic("The topology does not match the number of CPUs")
+        if (network == "bridged") != topology.bridged:
+            panic("The bridged network needs a bridged topology")
+        if l3_policy not in L3_POLICIES:
+            panic(f"Unknown L3 policy {l3_policy}")
+
+        # Clusters of the protocol and L3 banks in each.
+        if l3_policy == "local":
+            cluster_of_chiplet = list(range(topology.num_chiplets))
+            cluster_banks = l3_banks
+        else:
+            cluster_of_chiplet = [0] * topology.num_chiplets
+            cluster_banks = l3_banks * topology.num_chiplets
+
         # Ruby's global network.
-        self.intra_network = IntraChiplet(self)
-        self.inter_network = InterChiplet(self)
+        if network in ("garnet", "bridged"):
+            self.network = ChipletGarnetNetwork(self)
+        else:
+            self.network = ChipletSimpleNetwork(self)
 
+        # MESI Three Level uses 3 virtual networks.
         self.number_of_virtual_networks = 3
-        self.intra_network.number_of_virtual_networks = 3
-        self.inter_network.number_of_virtual_networks = 3
+        self.network.number_of_virtual_networks = 3
 
-        self.dir_controller = [
-            DirController(self, system.mem_ranges, mem_ctrls)
+        self.l1_controllers = [
+            L1Cache(system, self, cpu) for cpu in cpus
+        ]
+        self.l2_controllers = [
+            L2Cache(
+                system,
+                self,
+                cpu,
+                cluster_of_chiplet[topology.chiplet_of_core(i)],
+                cluster_banks,
+            )
+            for i, cpu in enumerate(cpus)
         ]
-        self.intra_controllers = [L1Cache(system, self, cpu, math.floor(i/4)) for i, cpu in enumerate(cpus)] + [
-            L2Cache(system, self, cpu, math.floor(i/4)) for i, cpu in enumerate(cpus)
-        ] + self.dir_controller
-        self.inter_controllers =  [
-            L3Cache(system, self, cpu, math.floor(i)) for i, cpu in enumerate(cpus/4)
-        ] + self.dir_controller
-
-        # Create one sequencer per CPU. In many systems this is more
-        # complicated since you have to create sequencers for DMA controllers
-        # and other controllers, too.
+        # L3 bank b of chiplet c is bank c * l3_banks + b of the protocol,
+        # under both policies.
+        self.l3_controllers = [
+            L3Cache(system, self, cluster_of_chiplet[chiplet], cluster_banks)
+            for chiplet in range(topology.num_chiplets)
+            for _ in range(l3_banks)
+        ]
+        self.dir_controllers = [
+            DirController(self, [ctrl.dram.range], ctrl)
+            for ctrl in mem_ctrls
+        ]
+
+        # The L1 and L2 of a core share a private link.
+        for l1, l2 in zip(self.l1_controllers, self.l2_controllers):
+            l2.bufferFromL0 = l1.bufferToL1
+            l2.bufferToL0 = l1.bufferFromL1
+
+        # Create one sequencer per CPU.
         self.sequencers = [
             RubySequencer(
                 version=i,
-                # I/D cache is combined and grab from ctrl
-                dcache=self.controllers[i].cacheMemory,
-                clk_domain=self.controllers[i].clk_domain,
+                dcache=l1.Dcache,
+                clk_domain=l1.clk_domain,
             )
-            for i in range(len(cpus))
+            for i, l1 in enumerate(self.l1_controllers)
         ]
-
-        # We know that we put the controllers in an order such that the first
-        # N of them are the L1 caches which need a sequencer pointer
-        for i, c in enumerate(self.intra_controllers[0 : len(self.sequencers)]):
-            c.sequencer = self.sequencers[i]
+        for l1, sequencer in zip(self.l1_controllers, self.sequencers):
+            l1.sequencer = sequencer
 
         self.num_of_sequencers = len(self.sequencers)
 
-        # Create the network and connect the controllers.
-        # NOTE: This is quite different if using Garnet!
-        self.intra_network.connectControllers(self.intra_controllers)
-        self.intra_network.setup_buffers()
+        # The private caches sit on their core's tile router, the L3 banks
+        # and the directories on the chiplet gateways.
+        attachments = []
+        for i in range(len(cpus)):
+            router = topology.tile_routers[i]
+            latency = topology.access_latency[i]
+            attachments.append((self.l1_controllers[i], router, latency))
+            attachments.append((self.l2_controllers[i], router, latency))
+        for i, bank in enumerate(self.l3_controllers):
+            gateway = topology.gateways[i // l3_banks]
+            attachments.append((bank, gateway, 1))
+        for i, directory in enumerate(self.dir_controllers):
+            gateway = topology.gateways[i % topology.num_chiplets]
+            attachments.append((directory, gateway, 1))
+        self.network.connectTopology(topology, attachments, link_classes)
+        self.network.setup_buffers()
 
-        self.inter_network.connectControllers(self.inter_controllers)
-        self.inter_network.setup_buffers()
         # Set up a proxy port for the system_port. Used for load binaries and
         # other functional-only things.
         self.sys_port_proxy = RubyPortProxy()
@@ -80,47 +188,44 @@ class L1Cache(L0Cache_Controller):
         cls._version += 1
         return cls._version - 1
 
-    def __init__(self, system, ruby_system, cpu, cluster_id):
+    def __init__(self, system, ruby_system, cpu):
         super().__init__()
 
         self.Icache = RubyCache(
             size="32kB",
             assoc=4,
             is_icache=True,
-            start_index_bit=self.getBlockSizeBits(system),
+            start_index_bit=block_size_bits(system),
             replacement_policy=LRURP()
         )
         self.Dcache = RubyCache(
             size="32kB",
             assoc=8,
             is_icache=False,
-            start_index_bit=self.getBlockSizeBits(system),
+            start_index_bit=block_size_bits(system),
             replacement_policy=LRURP()
         )
 
-        self.cluster_id = cluster_id
         self.clk_domain = cpu.clk_domain
         self.send_evictions = True
-        
+        self.prefetcher = RubyPrefetcher()
+        self.enable_prefetch = False
+        self.transitions_per_cycle = 4
+
         self.ruby_system = ruby_system
         self.version = self.versionCount()
         self.connectQueues(ruby_system)
 
-    def getBlockSizeBits(self, cache_line_size):
-        bits = int(math.log(cache_line_size, 2))
-        if 2**bits != int(cache_line_size):
-            raise Exception("Cache line size is not a power of 2!")
-        return bits
-
     def connectQueues(self, network):
         self.prefetchQueue = MessageBuffer()
         self.mandatoryQueue = MessageBuffer()
         self.optionalQueue = MessageBuffer()
 
-        
+        # Private link to this core's L2.
         self.bufferToL1 = MessageBuffer(ordered=True)
         self.bufferFromL1 = MessageBuffer(ordered=True)
 
+
 class L2Cache(L1Cache_Controller):
     _version = 0
 
@@ -129,29 +234,49 @@ class L2Cache(L1Cache_Controller):
         cls._version += 1
         return cls._version - 1
 
-    def __init__(self, system, ruby_system, cpu, cluster_id):
+    def __init__(self, system, ruby_system, cpu, cluster_id, l3_banks):
         super().__init__()
 
         # This is the cache memory object that stores the cache data and tags
         self.cache = RubyCache(
             size="256kB",
             assoc=4,
-            start_index_bit=self.getBlockSizeBits(system),
+            start_index_bit=block_size_bits(system),
             is_icache=False,
         )
-        
-        self.l2_select_num_bits = int(math.log(4, 2))
+
+        # Bits selecting one of the l3_banks L3 banks of this cluster.
+        self.l2_select_num_bits = int(math.log(l3_banks, 2))
         self.cluster_id = cluster_id
         self.clk_domain = cpu.clk_domain
         self.prefetcher = RubyPrefetcher()
+        self.enable_prefetch = False
         self.transitions_per_cycle = 32
-        
+
         self.l1_request_latency = 2
         self.l1_response_latency = 2
         self.to_l2_latency = 1
 
+        self.ruby_system = ruby_system
         self.version = self.versionCount()
-        self.connectQueues(ruby_system)
+        self.connectQueues(ruby_system.network)
+
+    def connectQueues(self, network):
+        # In the below terms, L1 and L2 are ruby backend terminology.
+        # Here, they are the L2 and L3 caches respectively.
+        self.mandatoryQueue = MessageBuffer()
+        self.optionalQueue = MessageBuffer()
+        self.requestToL2 = MessageBuffer()
+        self.requestToL2.out_port = network.in_port
+        self.responseToL2 = MessageBuffer()
+        self.responseToL2.out_port = network.in_port
+        self.unblockToL2 = MessageBuffer()
+        self.unblockToL2.out_port = network.in_port
+        self.requestFromL2 = MessageBuffer()
+        self.requestFromL2.in_port = network.out_port
+        self.responseFromL2 = MessageBuffer()
+        self.responseFromL2.in_port = network.out_port
+
 
 class L3Cache(L2Cache_Controller):
     _version = 0
@@ -161,14 +286,13 @@ class L3Cache(L2Cache_Controller):
         cls._version += 1
         return cls._version - 1
 
-    def __init__(self, system, ruby_system, cpu, cluster_id):
+    def __init__(self, system, ruby_system, cluster_id, l3_banks):
         super().__init__()
 
-
         self.L2cache = RubyCache(
             size="4MB",
             assoc=16,
-            start_index_bit=self.getIndexBit(4, system),
+            start_index_bit=self.getIndexBit(l3_banks, system),
         )
 
         self.transitions_per_cycle = 4
@@ -177,17 +301,17 @@ class L3Cache(L2Cache_Controller):
         self.l2_response_latency = 2
         self.to_l1_latency = 1
 
+        self.ruby_system = ruby_system
         self.version = self.versionCount()
-        self.connectQueues(ruby_system)
+        self.connectQueues(ruby_system.network)
 
-    def getIndexBit(self, num_l3Caches, cache_line_size):
+    def getIndexBit(self, num_l3Caches, system):
         l3_bits = int(math.log(num_l3Caches, 2))
-        bits = int(math.log(cache_line_size, 2)) + l3_bits
-        return bits
+        return block_size_bits(system) + l3_bits
 
     def connectQueues(self, network):
         # In the below terms, L1 and L2 are ruby backend terminology.
-        # In stdlib, they are L2 and L3 caches respectively.
+        # Here, they are the L2 and L3 caches respectively.
         self.DirRequestFromL2Cache = MessageBuffer()
         self.DirRequestFromL2Cache.out_port = network.in_port
         self.L1RequestFromL2Cache = MessageBuffer()
@@ -210,100 +334,166 @@ class DirController(Directory_Controller):
         cls._version += 1  # Use count for this particular type
         return cls._version - 1
 
-    def __init__(self, ruby_system, ranges, mem_ctrls):
+    def __init__(self, ruby_system, ranges, mem_ctrl):
         """ranges are the memory ranges assigned to this controller."""
-        # if len(mem_ctrls) > 1:
-            # panic("This cache system can only be connected to one mem ctrl")
         super().__init__()
         self.version = self.versionCount()
         self.addr_ranges = ranges
         self.ruby_system = ruby_system
         self.directory = RubyDirectoryMemory()
         # Connect this directory to the memory side.
-        self.memory = mem_ctrls[0].port
-        self.connectQueues(ruby_system)
+        self.memory_out_port = mem_ctrl.port
+        self.connectQueues(ruby_system.network)
 
-    def connectQueues(self, ruby_system):
-        self.requestFromCache = MessageBuffer(ordered=True)
-        self.requestFromCache.in_port = ruby_system.network.out_port
-        self.responseFromCache = MessageBuffer(ordered=True)
-        self.responseFromCache.in_port = ruby_system.network.out_port
-
-        self.responseToCache = MessageBuffer(ordered=True)
-        self.responseToCache.out_port = ruby_system.network.in_port
-        self.forwardToCache = MessageBuffer(ordered=True)
-        self.forwardToCache.out_port = ruby_system.network.in_port
+    def connectQueues(self, network):
+        self.requestToDir = MessageBuffer()
+        self.requestToDir.in_port = network.out_port
+        self.responseToDir = MessageBuffer()
+        self.responseToDir.in_port = network.out_port
+        self.responseFromDir = MessageBuffer()
+        self.responseFromDir.out_port = network.in_port
 
-       
         self.requestToMemory = MessageBuffer()
         self.responseFromMemory = MessageBuffer()
 
 
-class IntraChiplet(SimpleNetwork):
-    """A simple point-to-point network. This doesn't not use garnet."""
+class ChipletNetwork:
+    """
+    Builds the routers and links of a ChipletTopology, with the parameters
+    of each link class (see chiplet_topology.LinkClass). Subclasses map
+    them to the router and link classes of their network model.
+    """
 
-    def __init__(self, ruby_system):
-        super().__init__()
-        self.netifs = []
-        self.ruby_system = ruby_system
-
-    def connectControllers(self, controllers):
-        
-        self.intra_routers = [Switch(router_id=i) for i in range(len(controllers))]
+    def connectTopology(self, topology, attachments, link_classes):
+        """attachments are (controller, router id, link latency) tuples."""
+        self._link_classes = link_classes
+        router_classes = [
+            link_classes[topology.router_tier(i)]
+            for i in range(len(topology.routers))
+        ]
+        self.routers = [
+            self.makeRouter(i, link_class)
+            for i, link_class in enumerate(router_classes)
+        ]
 
-        
-        self.intra_ext_links = [
-            SimpleExtLink(link_id=i, ext_node=c, int_node=self.routers[i])
-            for i, c in enumerate(controllers)
+        # Make a link from each controller to its router. The link goes
+        # externally to the network.
+        self.ext_links = [
+            self.makeExtLink(
+                i,
+                controller,
+                self.routers[router],
+                latency,
+                router_classes[router],
+            )
+            for i, (controller, router, latency) in enumerate(attachments)
         ]
 
-        
-        link_count = 0
-        int_links = []
-        for i, ri in enumerate(self.intra_routers):
-            for j, rj in enumerate(self.intra_routers):
-                if ri == rj:
-                    continue  # Don't connect a router to itself!
-                if (i / 4 == j / 4):
-                    link_count += 1
-                    int_links.append(
-                        SimpleIntLink(link_id=link_count, src_node=ri, dst_node=rj)
-                    )
-        self.int_links = int_links
+        self.int_links = [
+            self.makeIntLink(
+                i,
+                self.routers[src],
+                self.routers[dst],
+                link_classes[tier],
+                router_classes[src],
+                router_classes[dst],
+                weight,
+            )
+            for i, ((src, dst, tier), weight) in enumerate(
+                zip(topology.links, topology.weights)
+            )
+        ]
+        self._link_tiers = [tier for _, _, tier in topology.links]
 
-class InterChiplet(GarnetNetwork):
 
+class ChipletSimpleNetwork(ChipletNetwork, SimpleNetwork):
+    """Point-to-point links between switches. This doesn't use garnet."""
 
     def __init__(self, ruby_system):
         super().__init__()
         self.netifs = []
         self.ruby_system = ruby_system
 
-    def connectControllers(self, controllers):
-        
-        self.inter_routers = [GarnetRouter(router_id=i, router_latency=13) for i in range(len(controllers[:16]))]
+    def makeRouter(self, router_id, link_class):
+        return Switch(router_id=router_id, latency=link_class.router_latency)
 
-        # Make a link from each controller to the router. The link goes
-        # externally to the network.
-        self.inter_ext_links = [
-            GarnetExtLink(link_id=i, ext_node=c, int_node=self.routers[i], latency = 12)
-            for i, c in enumerate(controllers[:16])
-        ]
+    def makeExtLink(self, link_id, controller, router, latency, link_class):
+        return SimpleExtLink(
+            link_id=link_id,
+            ext_node=controller,
+            int_node=router,
+            latency=latency,
+        )
 
-        
-        link_count = 0
-        int_links = []
-        for i, ri in enumerate(self.inter_routers):
-            for j, rj in enumerate(self.inter_routers):
-                if ri == rj:
-                    continue  
-                if (i / 4 == j / 4):
-                    link_count += 1
-                    int_links.append(
-                        GarnetIntLink(link_id=link_count, src_node=ri, dst_node=rj, latency = 12)
-                    )
-        self.int_links = int_links
+    def makeIntLink(self, link_id, src, dst, link_class, src_class,
+                    dst_class, weight):
+        return SimpleIntLink(
+            link_id=link_id,
+            src_node=src,
+            dst_node=dst,
+            latency=link_class.latency,
+            bandwidth_factor=link_class.bandwidth_factor,
+            weight=weight,
+        )
 
+    def setup_buffers(self):
+        super().setup_buffers()
+        # Bound the buffers at the end of each link by its class.
+        for link, tier in zip(self.int_links, self._link_tiers):
+            depth = self._link_classes[tier].buffer_depth
+            for buffer in link.buffers:
+                buffer.buffer_size = depth
 
 
+class ChipletGarnetNetwork(ChipletNetwork, GarnetNetwork):
+    """
+    Garnet routers with table-based (shortest path) routing. Routers and
+    links take the flit width and VC count of their class, with
+    serializer-deserializer units between different widths.
+    """
 
+    def __init__(self, ruby_system):
+        super().__init__()
+        self.ruby_system = ruby_system
+        self.vcs_per_vnet = 4
+        self.ni_flit_size = 16
+        self.routing_algorithm = 0
+
+    def makeRouter(self, router_id, link_class):
+        return GarnetRouter(
+            router_id=router_id,
+            latency=link_class.router_latency,
+            vcs_per_vnet=link_class.vcs,
+            width=link_class.width,
+        )
+
+    def makeExtLink(self, link_id, controller, router, latency, link_class):
+        # Network interfaces use flits of ni_flit_size bytes.
+        return GarnetExtLink(
+            link_id=link_id,
+            ext_node=controller,
+            int_node=router,
+            latency=latency,
+            width=self.ni_flit_size,
+            int_serdes=link_class.width != self.ni_flit_size,
+        )
+
+    def makeIntLink(self, link_id, src, dst, link_class, src_class,
+                    dst_class, weight):
+        return GarnetIntLink(
+            link_id=link_id,
+            src_node=src,
+            dst_node=dst,
+            latency=link_class.latency,
+            width=link_class.width,
+            src_serdes=src_class.width != link_class.width,
+            dst_serdes=dst_class.width != link_class.width,
+            weight=weight,
+        )
+
+    def setup_buffers(self):
+        # Garnet keeps its buffers in the routers; it only needs one
+        # network interface per controller.
+        self.netifs = [
+            GarnetNetworkInterface(id=i) for i in range(len(self.ext_links))
+        ]
@@ -0,0 +1,279 @@
+"""
+Router and link graph of a multi-chiplet system.
+
+A system has ``num_chiplets`` chiplets of ``cores_per_chiplet`` cores. Each
+chiplet has one router per core tile (for the core's private caches) and a
+gateway router (for the chiplet's shared L3 banks and the links to other
+chiplets). The tiles and the gateway of a chiplet are joined by the
+intra-chiplet topology, and the gateways of all chiplets by the
+inter-chiplet topology:
+
+- ``crossbar``: one switch router linked to every member.
+- ``ring``: members linked in a cycle. From 4 members on, the link that
+  closes the cycle is a dateline that routes do not cross: shortest
+  routes around a ring have cyclic channel dependencies, and Ruby's
+  networks have no virtual channels to break them with.
+- ``mesh``: members on the most square grid, linked to their neighbours.
+- ``cmesh``: concentrated mesh; every 4 members share a switch router,
+  and the switches form a mesh.
+- ``express``: mesh with express links that skip routers along the rows
+  and columns.
+- ``fbfly``: flattened butterfly; concentrated like ``cmesh``, with every
+  switch linked to all switches of its row and column.
+
+The grid topologies come from Tools/noc_topologies.py, which also builds
+them for the Garnet standalone topologies. Apart from the flattened
+butterfly, every topology adds O(members) links, so a graph is built in
+time linear in the core count. Links are unidirectional, as gem5's Ruby
+networks expect, so each connection is a pair of links. Each link has a
+routing weight, 1 except for the ring's dateline and the links of the
+grids, whose weights make routes take X before Y (see noc_topologies);
+``routing_table`` gives the resulting routes, and ``dependency_cycle``
+checks that they cannot deadlock.
+
+A ``bridged`` graph keeps only the routers that carry traffic between
+chiplets in detail: each chiplet becomes one local router, for all of its
+cores, linked to its gateway. The intra-chiplet topology then only sets
+``access_latency``, the hops from each core's tile to the gateway, which
+the core's point-to-point link to the local router takes instead. The
+router count is then proportional to the chiplet count, not the core
+count.
+
+Links come in two classes, on-die (``INTRA``) and die-to-die over the
+interposer (``INTER``), each with its own ``LinkClass``. Gateways and
+inter-chiplet switches are routers of the inter class, the others of the
+intra class (``router_tier``).
+
+This module is plain Python; cache_system.py turns a graph into the
+routers and links of a Ruby network.
+"""
+
+import os
+import sys
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Tools")
+)
+import noc_topologies
+
+TOPOLOGIES = ("crossbar", "ring") + noc_topologies.TOPOLOGIES
+
+INTRA, INTER = "intra", "inter"
+
+# Written into the outdir of multi_core_multi_chiplet.py runs.
+TOPOLOGY_FILE = "chiplet_topology.json"
+
+
+class LinkClass:
+    """
+    Parameters of one class of links and of its routers:
+
+    - ``latency``: link latency, in cycles.
+    - ``router_latency``: pipeline latency of the routers, in cycles.
+    - ``width``: Garnet flit width of the links and routers, in bytes.
+      Serializer-deserializer units are added where widths differ.
+    - ``bandwidth_factor``: SimpleNetwork link bandwidth, in bytes/cycle.
+    - ``vcs``: Garnet virtual channels per virtual network of the routers.
+    - ``buffer_depth``: SimpleNetwork messages buffered per link and
+      virtual network (0: unbounded). Garnet only has a network-wide depth.
+    """
+
+    FIELDS = (
+        "latency",
+        "router_latency",
+        "width",
+        "bandwidth_factor",
+        "vcs",
+        "buffer_depth",
+    )
+
+    def __init__(self, latency=1, router_latency=1, width=16,
+                 bandwidth_factor=16, vcs=4, buffer_depth=0):
+        self.latency = latency
+        self.router_latency = router_latency
+        self.width = width
+        self.bandwidth_factor = bandwidth_factor
+        self.vcs = vcs
+        self.buffer_depth = buffer_depth
+
+    def replace(self, spec):
+        """
+        Copy with the fields of ``spec`` replaced, a comma-separated list
+        of ``field=value`` (e.g. ``latency=20,width=8``).
+        """
+        fields = self.to_dict()
+        for item in filter(None, spec.split(",")):
+            name, _, value = item.partition("=")
+            name = name.strip()
+            if name not in self.FIELDS or not value.strip().isdigit():
+                raise ValueError(f"invalid link class field {item!r}")
+            fields[name] = int(value)
+        return LinkClass(**fields)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+
+# Defaults: 1-cycle on-die links, and the 12-cycle links and 13-cycle
+# gateway routers of the original inter-chiplet network.
+LINK_CLASSES = {
+    INTRA: LinkClass(),
+    INTER: LinkClass(latency=12, router_latency=13),
+}
+
+
+class ChipletTopology:
+    def __init__(self, num_chiplets, cores_per_chiplet, intra="crossbar",
+                 inter="crossbar", bridged=False):
+        for topology in (intra, inter):
+            if topology not in TOPOLOGIES:
+                raise ValueError(f"unknown topology {topology!r}")
+        self.num_chiplets = num_chiplets
+        self.cores_per_chiplet = cores_per_chiplet
+        self.intra = intra
+        self.inter = inter
+        self.bridged = bridged
+        # (chiplet, role) per router; role is "tile", "local", "gateway" or
+        # "switch".
+        # Inter-chiplet switches have chiplet None.
+        self.routers = []
+        # (src, dst, tier) per unidirectional link; tier is INTRA or INTER.
+        self.links = []
+        # Routing weight of each link.
+        self.weights = []
+        self.tile_routers = []
+        self.gateways = []
+        # Link latency (in hops) from each core to its tile router.
+        self.access_latency = [1] * self.num_cores
+        if bridged:
+            # Hops from each tile to the gateway in the full intra-chiplet
+            # topology, the same for every chiplet.
+            chiplet = ChipletTopology(1, cores_per_chiplet, intra, inter)
+            hops = chiplet.hop_counts(chiplet.gateways[0])
+            self.access_latency = [
+                hops[chiplet.tile_routers[core % cores_per_chiplet]]
+                for core in range(self.num_cores)
+            ]
+        for chiplet in range(num_chiplets):
+            if bridged:
+                tiles = [self._router(chiplet, "local")]
+                self.tile_routers += tiles * cores_per_chiplet
+            else:
+                tiles = [
+                    self._router(chiplet, "tile")
+                    for _ in range(cores_per_chiplet)
+                ]
+                self.tile_routers += tiles
+            gateway = self._router(chiplet, "gateway")
+            self.gateways.append(gateway)
+            if bridged:
+                self._link(tiles[0], gateway, INTRA)
+            else:
+                self._connect(tiles + [gateway], intra, INTRA, chiplet)
+        self._connect(self.gateways, inter, INTER, None)
+
+    @property
+    def num_cores(self):
+        return self.num_chiplets * self.cores_per_chiplet
+
+    def chiplet_of_core(self, core):
+        return core // self.cores_per_chiplet
+
+    def _router(self, chiplet, role):
+        self.routers.append((chiplet, role))
+        return len(self.routers) - 1
+
+    def _link(self, a, b, tier, weight=1):
+        self.links += [(a, b, tier), (b, a, tier)]
+        self.weights += [weight, weight]
+
+    def _connect(self, members, topology, tier, chiplet):
+        n = len(members)
+        if n < 2:
+            return
+        if topology == "crossbar":
+            switch = self._router(chiplet, "switch")
+            for member in members:
+                self._link(member, switch, tier)
+        elif topology == "ring":
+            for i in range(n - 1):
+                self._link(members[i], members[i + 1], tier)
+            if n == 3:
+                self._link(members[-1], members[0], tier)
+            elif n > 3:
+                # Heavier than the n - 1 hops the other way round.
+                self._link(members[-1], members[0], tier, weight=n)
+        else:
+            grid = noc_topologies.Grid(n, topology)
+            if grid.concentration > 1:
+                routers = [
+                    self._router(chiplet, "switch")
+                    for _ in range(grid.num_routers)
+                ]
+                for i, member in enumerate(members):
+                    self._link(member, routers[grid.endpoint_router(i)], tier)
+            else:
+                routers = members
+            for src, dst, weight in grid.links:
+                self.links.append((routers[src], routers[dst], tier))
+                self.weights.append(weight)
+
+    def hop_counts(self, source):
+        """Router hops from ``source`` to every router along its routes."""
+        table = self.routing_table()
+        return [
+            sum(1 for _ in noc_topologies.route(table, source, router))
+            for router in range(len(self.routers))
+        ]
+
+    def _weighted_links(self):
+        return [
+            (src, dst, weight)
+            for (src, dst, _), weight in zip(self.links, self.weights)
+        ]
+
+    def routing_table(self):
+        """
+        ``table[router][destination]``: next router on the route from
+        router to destination (see noc_topologies.routing_table).
+        """
+        return noc_topologies.routing_table(
+            len(self.routers), self._weighted_links()
+        )
+
+    def dependency_cycle(self):
+        """
+        A cycle of the channel dependencies of the routes, as the routers
+        it passes through, or None (see noc_topologies.dependency_cycle).
+        """
+        return noc_topologies.dependency_cycle(
+            len(self.routers), self._weighted_links()
+        )
+
+    def router_tier(self, router):
+        """Link class of a router: INTER for gateways and inter-chiplet
+        switches, INTRA otherwise."""
+        chiplet, role = self.routers[router]
+        return INTER if chiplet is None or role == "gateway" else INTRA
+
+    def to_dict(self):
+        """The graph as plain data, e.g. to store next to a run's stats."""
+        return {
+            "num_chiplets": self.num_chiplets,
+            "cores_per_chiplet": self.cores_per_chiplet,
+            "intra": self.intra,
+            "inter": self.inter,
+            "bridged": self.bridged,
+            "routers": self.routers,
+            "links": self.links,
+            "weights": self.weights,
+        }
+
+    def summary(self):
+        tiers = [tier for _, _, tier in self.links]
+        return {
+            "cores": self.num_cores,
+            "routers": len(self.routers),
+            "intra_links": tiers.count(INTRA),
+            "inter_links": tiers.count(INTER),
+        }
@@ -0,0 +1,168 @@
+"""
+Inter-chiplet coherence traffic and link utilization of multi-chiplet
+runs.
+
+The multi-chiplet cache system keeps coherence in two levels with
+``--l3-policy local`` (the default): each chiplet's L3 tracks the private
+caches of its cores that share a line, and the global directories only
+track which chiplet's L3 holds it, so misses and invalidations between
+cores of one chiplet stay on the chiplet. With ``--l3-policy interleaved``
+the L3 banks of all chiplets form one flat home for every line, whichever
+chiplets share it. This script compares runs of the two:
+
+- inter-chiplet link traversals (messages times inter-chiplet hops), in
+  total and per thousand instructions,
+- intra-chiplet link traversals and all network messages,
+- the utilization of each link class, in messages per link per cycle,
+  with the class parameters of the run (see chiplet_topology.LinkClass),
+- the mean Ruby request latency and miss latency, and Garnet's mean
+  packet latency.
+
+Each run directory needs its stats.txt and the chiplet_topology.json
+written by multi_core_multi_chiplet.py. Link traversals are read from the
+SimpleNetwork link buffers; Garnet runs only report latencies.
+
+```
+python3 Multi_Chiplet_Multi_Core/coherence_report.py flat_out \
+    hierarchical_out
+```
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Tools")
+)
+import stats_parser
+
+from chiplet_topology import INTER, INTRA, TOPOLOGY_FILE
+
+NETWORK = "system.caches.network"
+
+# Rows of the report: (key, label, format).
+ROWS = [
+    ("inter_traversals", "inter-chiplet link traversals", "{:.0f}"),
+    ("inter_per_kinst", "  per 1000 instructions", "{:.3f}"),
+    ("intra_traversals", "intra-chiplet link traversals", "{:.0f}"),
+    ("inter_utilization", "inter-chiplet link utilization", "{:.4f}"),
+    ("intra_utilization", "intra-chiplet link utilization", "{:.4f}"),
+    ("messages", "network messages", "{:.0f}"),
+    ("latency", "mean request latency (cycles)", "{:.2f}"),
+    ("miss_latency", "mean miss latency (cycles)", "{:.2f}"),
+    ("packet_latency", "mean Garnet packet latency", "{:.2f}"),
+    ("sim_ticks", "simTicks", "{:.0f}"),
+]
+
+
+def coherence_traffic(run_dir):
+    """Report values of one run (None where the stats lack them)."""
+    with open(os.path.join(run_dir, TOPOLOGY_FILE)) as f:
+        topology = json.load(f)
+    store = stats_parser.open_store(os.path.join(run_dir, "stats.txt"))
+    traversals = {INTER: None, INTRA: None}
+    links = {INTER: 0, INTRA: 0}
+    for link, (_, _, tier) in enumerate(topology["links"]):
+        links[tier] += 1
+        counts = store.query(
+            0, f"{NETWORK}.int_links{link}.buffers*.m_msg_count"
+        )
+        if counts:
+            traversals[tier] = (traversals[tier] or 0) + sum(counts.values())
+    messages = store.query(0, f"{NETWORK}.msg_count.*")
+    insts = store.get(0, "simInsts")
+    inter = traversals[INTER]
+    cycles = store.get(0, "simTicks", 0) / topology.get("cycle_ticks", 1000)
+    utilization = {
+        tier: (
+            count / (links[tier] * cycles)
+            if count is not None and links[tier] and cycles
+            else None
+        )
+        for tier, count in traversals.items()
+    }
+    return {
+        "l3_policy": topology.get("l3_policy"),
+        "network": topology.get("network"),
+        "inter_traversals": inter,
+        "inter_per_kinst": (
+            inter * 1000 / insts if inter is not None and insts else None
+        ),
+        "intra_traversals": traversals[INTRA],
+        "inter_utilization": utilization[INTER],
+        "intra_utilization": utilization[INTRA],
+        "link_classes": topology.get("link_classes"),
+        "messages": sum(messages.values()) if messages else None,
+        "latency": store.get(0, "system.caches.m_latencyHistSeqr::mean"),
+        "miss_latency": store.get(
+            0, "system.caches.m_missLatencyHistSeqr::mean"
+        ),
+        "packet_latency": store.get(0, f"{NETWORK}.average_packet_latency"),
+        "sim_ticks": store.get(0, "simTicks"),
+    }
+
+
+def print_report(names, reports):
+    width = max(16, *(len(name) + 2 for name in names))
+    print(f"{'':32s}" + "".join(f"{name:>{width}s}" for name in names))
+    print(
+        f"{'L3 policy':32s}"
+        + "".join(f"{str(r['l3_policy']):>{width}s}" for r in reports)
+    )
+    for key, label, fmt in ROWS:
+        values = [report[key] for report in reports]
+        if all(value is None for value in values):
+            continue
+        print(
+            f"{label:32s}"
+            + "".join(
+                f"{fmt.format(value) if value is not None else '-':>{width}s}"
+                for value in values
+            )
+        )
+    for tier in (INTER, INTRA):
+        for name, report in zip(names, reports):
+            if report["link_classes"]:
+                fields = ", ".join(
+                    f"{field}={value}"
+                    for field, value in report["link_classes"][tier].items()
+                )
+                print(f"{name} {tier} links: {fields}")
+    baseline = reports[0]["inter_traversals"]
+    if baseline:
+        for name, report in zip(names[1:], reports[1:]):
+            if report["inter_traversals"] is not None:
+                change = report["inter_traversals"] / baseline - 1
+                print(
+                    f"{name}: {change:+.1%} inter-chiplet traversals "
+                    f"against {names[0]}"
+                )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare the inter-chiplet coherence traffic of runs."
+    )
+    parser.add_argument(
+        "run_dirs",
+        type=str,
+        nargs="+",
+        help="Outdirs of multi_core_multi_chiplet.py; the first is the "
+        "baseline.",
+    )
+    parser.add_argument("--json", type=str, default=None)
+    args = parser.parse_args(argv)
+
+    reports = [coherence_traffic(run_dir) for run_dir in args.run_dirs]
+    names = [os.path.basename(os.path.normpath(d)) for d in args.run_dirs]
+    print_report(names, reports)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(dict(zip(args.run_dirs, reports)), f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
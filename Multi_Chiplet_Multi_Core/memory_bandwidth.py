@@ -0,0 +1,143 @@
+"""
+Memory bandwidth of the multi-chiplet system against its directory count.
+
+Runs multi_core_multi_chiplet.py once per directory count (each directory
+with its own memory controller), in parallel, and reports the bandwidth
+delivered by all memory controllers together, the run time, and how
+evenly the interleaving spreads the traffic (the busiest controller's
+share of the bytes).
+
+The threads test moves little data; a memory-bound multi-threaded SE
+binary, e.g. STREAM, shows the scaling better. Arguments after ``--`` are
+passed on to the script:
+
+```
+python3 Multi_Chiplet_Multi_Core/memory_bandwidth.py \
+    --gem5 build/X86_MESI_Three_Level/gem5.opt --dirs 1 2 4 --per-chiplet \
+    -- --num-chiplets 4 --cores-per-chiplet 4 --binary stream \
+    --options "16"
+```
+"""
+
+import argparse
+import concurrent.futures
+import csv
+import fnmatch
+import os
+import subprocess
+import sys
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Tools")
+)
+import stats_parser
+
+SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "multi_core_multi_chiplet.py"
+)
+
+CTRL_BYTES = (
+    "system.mem_ctrls*.bytesReadSys",
+    "system.mem_ctrls*.bytesWrittenSys",
+)
+
+FIELDS = [
+    "config",
+    "dirs",
+    "sim_seconds",
+    "bytes",
+    "bandwidth_GBps",
+    "busiest_share",
+]
+
+
+def run(gem5, outdir, script_args):
+    command = [gem5, "--outdir", outdir, SCRIPT] + script_args
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    return next(stats_parser.iter_dumps(os.path.join(outdir, "stats.txt")))
+
+
+def bandwidth(stats):
+    """Simulated seconds, bytes per controller, and total bandwidth."""
+    per_ctrl = {}
+    for name, value in stats.items():
+        if any(fnmatch.fnmatchcase(name, pattern) for pattern in CTRL_BYTES):
+            ctrl = name.rsplit(".", 1)[0]
+            per_ctrl[ctrl] = per_ctrl.get(ctrl, 0) + value
+    seconds = stats["simSeconds"]
+    total = sum(per_ctrl.values())
+    return {
+        "sim_seconds": seconds,
+        "bytes": total,
+        "bandwidth_GBps": total / seconds / 1e9 if seconds else None,
+        "busiest_share": max(per_ctrl.values()) / total if total else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Memory bandwidth against the number of directories."
+    )
+    parser.add_argument(
+        "--gem5", type=str, required=True, help="MESI_Three_Level gem5 binary."
+    )
+    parser.add_argument("--dirs", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument(
+        "--per-chiplet",
+        action="store_true",
+        help="Also run with one directory per chiplet.",
+    )
+    parser.add_argument("--jobs", type=int, default=os.cpu_count())
+    parser.add_argument("--outdir", type=str, default="memory_bandwidth")
+    parser.add_argument("script_args", nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+    script_args = args.script_args
+    if script_args[:1] == ["--"]:
+        script_args = script_args[1:]
+
+    configs = {f"dirs{n}": ["--num-dirs", str(n)] for n in args.dirs}
+    if args.per_chiplet:
+        configs["per-chiplet"] = ["--dir-per-chiplet"]
+
+    rows = []
+    with concurrent.futures.ThreadPoolExecutor(args.jobs) as pool:
+        futures = {
+            pool.submit(
+                run,
+                args.gem5,
+                os.path.join(args.outdir, name),
+                script_args + extra,
+            ): name
+            for name, extra in configs.items()
+        }
+        for future in concurrent.futures.as_completed(futures):
+            name = futures[future]
+            stats = future.result()
+            row = dict(bandwidth(stats), config=name)
+            row["dirs"] = sum(
+                fnmatch.fnmatchcase(stat, "system.mem_ctrls*.bytesReadSys")
+                for stat in stats
+            )
+            rows.append(row)
+    rows.sort(key=lambda row: (row["dirs"], row["config"]))
+
+    print(
+        f"{'config':12s}{'dirs':>5s}{'sim ms':>10s}{'GB/s':>9s}"
+        f"{'busiest':>9s}"
+    )
+    for row in rows:
+        print(
+            f"{row['config']:12s}{row['dirs']:5d}"
+            f"{row['sim_seconds'] * 1e3:10.3f}"
+            f"{row['bandwidth_GBps'] or 0:9.3f}"
+            f"{row['busiest_share'] or 0:9.1%}"
+        )
+    with open(os.path.join(args.outdir, "bandwidth.csv"), "w") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,30 @@
+"""
+SE-mode threads test on a multi-chiplet MESI Three Level system.
+
+The chiplet count, the cores per chiplet and the intra- and inter-chiplet
+topologies are parameters (see chiplet_topology.py). With --config-only
+the script stops after m5.instantiate() and prints the time each
+configuration step took, as a ``CONFIG_TIMING`` JSON line; the host-side
+topology_benchmark.py collects these across system sizes.
+
+Usage:
+------
+
+```
+build/X86_MESI_Three_Level/gem5.opt \
+    Multi_Chiplet_Multi_Core/multi_core_multi_chiplet.py \
+    --num-chiplets 8 --cores-per-chiplet 8 --intra-topology mesh \
+    --inter-topology ring --network garnet
+```
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
 import m5
+from m5.util.convert import toFrequency
 
 # import all of the SimObjects
 from m5.objects import *
@@ -7,42 +33,198 @@ from m5.objects import *
 m5.util.addToPath("../../")
 from common.FileSystemConfig import config_filesystem
 
-# You can import ruby_caches_MI_example to use the MI_example protocol instead
-# of the MSI protocol
-from cache_system import MyCacheSystem
+# The MESI Three Level chiplet hierarchy and its network
+from cache_system import (
+    L3_POLICIES,
+    MyCacheSystem,
+    interleaved_ranges,
+)
+from chiplet_topology import (
+    INTER,
+    INTRA,
+    LINK_CLASSES,
+    TOPOLOGIES,
+    TOPOLOGY_FILE,
+    ChipletTopology,
+)
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Tools")
+)
+import coherence_trace
+
+parser = argparse.ArgumentParser(
+    description="Threads test on a multi-chiplet system."
+)
+parser.add_argument("--num-chiplets", type=int, default=4)
+parser.add_argument("--cores-per-chiplet", type=int, default=4)
+parser.add_argument(
+    "--intra-topology", type=str, default="crossbar", choices=TOPOLOGIES
+)
+parser.add_argument(
+    "--inter-topology", type=str, default="crossbar", choices=TOPOLOGIES
+)
+parser.add_argument(
+    "--network",
+    type=str,
+    default="simple",
+    choices=["simple", "garnet", "bridged"],
+    help="bridged: Garnet between the chiplets only, point-to-point links "
+    "from the cores to one router per chiplet.",
+)
+parser.add_argument(
+    "--intra-link",
+    type=str,
+    default="",
+    help="On-die link class fields to override, as field=value,... of "
+    "latency, router_latency, width, bandwidth_factor, vcs, buffer_depth "
+    f"(default: {LINK_CLASSES[INTRA].to_dict()}).",
+)
+parser.add_argument(
+    "--inter-link",
+    type=str,
+    default="",
+    help="Die-to-die link class fields to override, as for --intra-link "
+    f"(default: {LINK_CLASSES[INTER].to_dict()}).",
+)
+parser.add_argument(
+    "--l3-banks",
+    type=int,
+    default=1,
+    help="Shared L3 banks per chiplet (a power of 2).",
+)
+parser.add_argument(
+    "--l3-policy",
+    type=str,
+    default="local",
+    choices=L3_POLICIES,
+    help="local: each chiplet caches lines in its own L3 banks; "
+    "interleaved: one L3 over the banks of all chiplets.",
+)
+parser.add_argument(
+    "--num-dirs",
+    type=int,
+    default=1,
+    help="Directories, each with its own memory controller (a power of 2).",
+)
+parser.add_argument(
+    "--dir-per-chiplet",
+    action="store_true",
+    help="One directory and memory controller per chiplet.",
+)
+parser.add_argument(
+    "--interleave-size",
+    type=int,
+    default=4096,
+    help="Bytes of consecutive addresses mapped to the same directory.",
+)
+parser.add_argument(
+    "--binary",
+    type=str,
+    default=None,
+    help="SE binary to run on every core (default: gem5's threads test).",
+)
+parser.add_argument(
+    "--options",
+    type=str,
+    default="",
+    help="Arguments of --binary.",
+)
+parser.add_argument(
+    "--record-coherence",
+    action="store_true",
+    help="Log the coherence messages of the run to <outdir>/coherence.log "
+    "(needs gem5.opt); convert it with Tools/coherence_trace.py.",
+)
+parser.add_argument(
+    "--config-only",
+    action="store_true",
+    help="Print the configuration timing and exit before simulating.",
+)
+args = parser.parse_args()
+if args.l3_banks & (args.l3_banks - 1):
+    parser.error("--l3-banks must be a power of 2")
+if args.l3_policy == "interleaved" and args.num_chiplets & (
+    args.num_chiplets - 1
+):
+    parser.error("an interleaved L3 needs a power-of-2 number of chiplets")
+try:
+    link_classes = {
+        INTRA: LINK_CLASSES[INTRA].replace(args.intra_link),
+        INTER: LINK_CLASSES[INTER].replace(args.inter_link),
+    }
+except ValueError as error:
+    parser.error(str(error))
+if args.dir_per_chiplet:
+    args.num_dirs = args.num_chiplets
+if args.num_dirs & (args.num_dirs - 1):
+    parser.error("the number of directories must be a power of 2")
+if args.interleave_size & (args.interleave_size - 1):
+    parser.error("--interleave-size must be a power of 2")
+if args.interleave_size < 64:
+    parser.error("--interleave-size must be at least a cache line")
+
+# Clock of the CPUs and of Ruby
+CLOCK = "1GHz"
+
+timing = {}
+start = time.time()
+topology = ChipletTopology(
+    args.num_chiplets,
+    args.cores_per_chiplet,
+    args.intra_topology,
+    args.inter_topology,
+    bridged=args.network == "bridged",
+)
+timing["topology"] = time.time() - start
 
 # create the system we are going to simulate
 system = System()
 
 # Set the clock frequency of the system (and all of its children)
 system.clk_domain = SrcClockDomain()
-system.clk_domain.clock = "1GHz"
+system.clk_domain.clock = CLOCK
 system.clk_domain.voltage_domain = VoltageDomain()
 
 # Set up the system
 system.mem_mode = "timing"  # Use timing accesses
 system.mem_ranges = [AddrRange("4096MB")]  # Create an address range
 
-# Create a pair of simple CPUs
-system.cpu = [X86TimingSimpleCPU() for i in range(16)]
+# Create one simple CPU per core
+system.cpu = [X86TimingSimpleCPU() for i in range(topology.num_cores)]
 
-# Create a DDR3 memory controller and connect it to the membus
-system.mem_ctrl = [MemCtrl() for i in range(4)]
-system.mem_ctrl.dram = DualChannelDDR4_2400(size="4GiB")
-system.mem_ctrl.dram.range = system.mem_ranges[0]
+# Create one DDR4 memory controller per directory, each for every
+# num_dirs-th block of interleave_size bytes
+system.mem_ctrls = [
+    MemCtrl(dram=DDR4_2400_8x8(range=mem_range))
+    for mem_range in interleaved_ranges(
+        system.mem_ranges[0], args.num_dirs, args.interleave_size
+    )
+]
 
 # create the interrupt controller for the CPU and connect to the membus
 for cpu in system.cpu:
     cpu.createInterruptController()
 
 # Create the Ruby System
+start = time.time()
 system.caches = MyCacheSystem()
-system.caches.setup(system, system.cpu, [system.mem_ctrl])
+system.caches.setup(
+    system,
+    system.cpu,
+    system.mem_ctrls,
+    topology,
+    network=args.network,
+    l3_banks=args.l3_banks,
+    l3_policy=args.l3_policy,
+    link_classes=link_classes,
+)
+timing["setup"] = time.time() - start
 
 # Run application and use the compiled ISA to find the binary
 # grab the specific path to the binary
 thispath = os.path.dirname(os.path.realpath(__file__))
-binary = os.path.join(
+binary = args.binary or os.path.join(
     thispath,
     "../../../",
     "tests/test-progs/threads/bin/x86/linux/threads",
@@ -52,7 +234,7 @@ binary = os.path.join(
 process = Process()
 # Set the command
 # cmd is a list which begins with the executable (like argv)
-process.cmd = [binary]
+process.cmd = [binary] + args.options.split()
 # Set the cpu to use the process as its workload and create thread contexts
 for cpu in system.cpu:
     cpu.workload = process
@@ -66,8 +248,44 @@ config_filesystem(system)
 # set up the root SimObject and start the simulation
 root = Root(full_system=False, system=system)
 # instantiate all of the objects we've created above
+start = time.time()
 m5.instantiate()
+timing["instantiate"] = time.time() - start
+
+if args.config_only:
+    print(
+        "CONFIG_TIMING "
+        + json.dumps(
+            dict(topology.summary(), network=args.network, **timing)
+        )
+    )
+    sys.exit(0)
+
+# Inter-chiplet links are told apart from the stats by this
+# (see coherence_report.py).
+with open(os.path.join(m5.options.outdir, TOPOLOGY_FILE), "w") as f:
+    json.dump(
+        dict(
+            topology.to_dict(),
+            network=args.network,
+            l3_policy=args.l3_policy,
+            num_dirs=args.num_dirs,
+            link_classes={
+                tier: link_class.to_dict()
+                for tier, link_class in link_classes.items()
+            },
+            cycle_ticks=int(1e12 / toFrequency(CLOCK)),
+        ),
+        f,
+        indent=2,
+    )
+
+if args.record_coherence:
+    from m5 import debug, trace
+
+    trace.output(coherence_trace.LOG_FILE)
+    debug.flags[coherence_trace.DEBUG_FLAG].enable()
 
 print("Beginning simulation!")
 exit_event = m5.simulate()
-print(f"Exiting @ tick {m5.curTick()} because {exit_event.getCause()}")
\ No newline at end of file
+print(f"Exiting @ tick {m5.curTick()} because {exit_event.getCause()}")
@@ -0,0 +1,210 @@
+"""
+Configuration-time benchmark of the chiplet topology builder.
+
+For each system size, times the construction of the router and link graph
+(chiplet_topology.py) against the all-pairs link loop the cache system
+used before, and optionally the full gem5 configuration (cache system
+setup and m5.instantiate) of multi_core_multi_chiplet.py --config-only.
+
+With --check it instead checks the routes of every intra- and
+inter-chiplet topology pair, at each size, for channel dependency cycles
+(deadlocks; see ChipletTopology.dependency_cycle).
+
+Usage:
+------
+
+```
+python3 Multi_Chiplet_Multi_Core/topology_benchmark.py \
+    --cores 16 64 128 256 --cores-per-chiplet 8 --intra mesh \
+    --gem5 build/X86_MESI_Three_Level/gem5.opt
+python3 Multi_Chiplet_Multi_Core/topology_benchmark.py --check \
+    --cores 16 64 256 --network bridged
+```
+"""
+
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+
+from chiplet_topology import TOPOLOGIES, ChipletTopology
+
+SCRIPT = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "multi_core_multi_chiplet.py"
+)
+
+
+def legacy_links(num_cores, cores_per_chiplet):
+    """The all-pairs loop of the former cache system, with integer
+    chiplets so that it creates the intended links."""
+    links = []
+    for i in range(num_cores):
+        for j in range(num_cores):
+            if i != j and i // cores_per_chiplet == j // cores_per_chiplet:
+                links.append((i, j))
+    return links
+
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def gem5_timing(gem5, num_chiplets, cores_per_chiplet, args):
+    """CONFIG_TIMING of one --config-only gem5 run."""
+    command = [
+        gem5,
+        "--outdir",
+        os.path.join(args.outdir, f"m5out_{num_chiplets * cores_per_chiplet}"),
+        SCRIPT,
+        "--num-chiplets",
+        str(num_chiplets),
+        "--cores-per-chiplet",
+        str(cores_per_chiplet),
+        "--intra-topology",
+        args.intra,
+        "--inter-topology",
+        args.inter,
+        "--network",
+        args.network,
+        "--config-only",
+    ]
+    start = time.time()
+    output = subprocess.run(
+        command, capture_output=True, text=True, check=True
+    ).stdout
+    for line in output.splitlines():
+        if line.startswith("CONFIG_TIMING "):
+            timing = json.loads(line[len("CONFIG_TIMING ") :])
+            timing["total"] = time.time() - start
+            return timing
+    raise RuntimeError(f"no CONFIG_TIMING in the output of {command}")
+
+
+def check(args):
+    """Check every topology pair for dependency cycles; 1 if any has."""
+    failures = 0
+    for num_cores in args.cores:
+        num_chiplets = num_cores // args.cores_per_chiplet
+        for intra, inter in itertools.product(TOPOLOGIES, TOPOLOGIES):
+            cycle = ChipletTopology(
+                num_chiplets,
+                args.cores_per_chiplet,
+                intra,
+                inter,
+                bridged=args.network == "bridged",
+            ).dependency_cycle()
+            if cycle is not None:
+                failures += 1
+                print(
+                    f"{num_cores} cores, {intra} in {inter}: dependency "
+                    f"cycle {' -> '.join(map(str, cycle))}"
+                )
+    print(f"{failures} topology pair(s) with dependency cycles")
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time the multi-chiplet topology configuration."
+    )
+    parser.add_argument(
+        "--cores", type=int, nargs="+", default=[16, 32, 64, 128, 256]
+    )
+    parser.add_argument("--cores-per-chiplet", type=int, default=4)
+    parser.add_argument(
+        "--intra", type=str, default="crossbar", choices=TOPOLOGIES
+    )
+    parser.add_argument(
+        "--inter", type=str, default="crossbar", choices=TOPOLOGIES
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--gem5",
+        type=str,
+        default=None,
+        help="gem5 binary (MESI_Three_Level) to also time the configuration "
+        "of the simulated system with.",
+    )
+    parser.add_argument(
+        "--network",
+        type=str,
+        default="simple",
+        choices=["simple", "garnet", "bridged"],
+    )
+    parser.add_argument("--outdir", type=str, default="topology_benchmark")
+    parser.add_argument("--json", type=str, default=None)
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Check the routes of all topology pairs for deadlock instead.",
+    )
+    args = parser.parse_args(argv)
+
+    for num_cores in args.cores:
+        if num_cores % args.cores_per_chiplet:
+            parser.error(
+                f"{num_cores} cores are not a multiple of "
+                f"--cores-per-chiplet {args.cores_per_chiplet}"
+            )
+    if args.check:
+        return check(args)
+
+    rows = []
+    header = f"{'cores':>6s}{'routers':>9s}{'links':>8s}"
+    header += f"{'graph ms':>10s}{'all-pairs ms':>14s}"
+    if args.gem5:
+        header += f"{'setup s':>9s}{'inst s':>8s}{'total s':>9s}"
+    print(header)
+    for num_cores in args.cores:
+        num_chiplets = num_cores // args.cores_per_chiplet
+
+        def build():
+            return ChipletTopology(
+                num_chiplets,
+                args.cores_per_chiplet,
+                args.intra,
+                args.inter,
+                bridged=args.network == "bridged",
+            )
+
+        row = dict(build().summary())
+        row["graph_seconds"] = best_time(build, args.repeat)
+        row["all_pairs_seconds"] = best_time(
+            lambda: legacy_links(num_cores, args.cores_per_chiplet),
+            args.repeat,
+        )
+        line = (
+            f"{num_cores:6d}{row['routers']:9d}"
+            f"{row['intra_links'] + row['inter_links']:8d}"
+            f"{row['graph_seconds'] * 1e3:10.3f}"
+            f"{row['all_pairs_seconds'] * 1e3:14.3f}"
+        )
+        if args.gem5:
+            row["gem5"] = gem5_timing(
+                args.gem5, num_chiplets, args.cores_per_chiplet, args
+            )
+            line += (
+                f"{row['gem5']['setup']:9.2f}"
+                f"{row['gem5']['instantiate']:8.2f}"
+                f"{row['gem5']['total']:9.2f}"
+            )
+        print(line)
+        rows.append(row)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
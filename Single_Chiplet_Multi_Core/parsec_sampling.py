@@ -0,0 +1,423 @@
+"""
+Sampled simulation of the PARSEC ROI with the x86-parsec-mesi2/mesi3
+scripts.
+
+Instead of simulating an arbitrary prefix of the ROI in detail, the ROI is
+split into intervals of --interval instructions and only a few
+representative intervals are simulated in detail:
+
+1. profile:    the ROI runs on Timing cores and stats are dumped once
+               per interval.
+2. select:     every interval gets a signature (the stats matching
+               --feature, normalized by the instructions of the
+               interval), signatures are clustered with k-means, and
+               the interval closest to each centroid represents its
+               cluster, weighted by the cluster's instructions.
+3. checkpoint: a second Timing pass checkpoints the start of the
+               selected intervals (skipped with --single-pass, which
+               checkpoints every interval during the profile pass).
+4. detail:     each selected interval is restored on the detailed CPU,
+               warmed up and measured, all in parallel.
+5. combine:    per-instruction rates of the samples are weighted by the
+               instructions of the intervals they represent.
+
+Per-thread basic-block vectors are not used: PARSEC runs one thread per
+core in full-system mode, so per-interval stats of the whole system are
+used as the signature instead.
+
+With --reference (stats.txt of a full detailed run, e.g. on simsmall) the
+estimated error of every metric is reported.
+
+This script runs on the host with plain Python 3, not inside gem5.
+
+Usage:
+------
+
+```
+python3 Single_Chiplet_Multi_Core/parsec_sampling.py \
+    --gem5 build/X86_MESI_Two_Level/gem5.opt --hierarchy mesi2 \
+    --benchmark bodytrack --size simsmall --num-cores 4 \
+    --interval 50000000 --clusters 6 --sample-dir sampling_out
+```
+"""
+import argparse
+import concurrent.futures
+import json
+import math
+import os
+import random
+import sys
+
+from parsec_sweep import (
+    GiB,
+    SCRIPTS,
+    THIS_DIR,
+    pool_size,
+)
+
+sys.path.insert(0, os.path.join(THIS_DIR, os.pardir, "Tools"))
+
+import stats_parser
+from gem5_runs import L2_PATTERNS, execute
+
+DEFAULT_FEATURES = [
+    "board.processor.cores*.core.commitStats0.numInsts",
+    "*.m_demand_misses",
+]
+
+
+def gem5_run(args, outdir, extra):
+    """Run description and command line for one gem5 invocation."""
+    run = {
+        "hierarchy": args.hierarchy,
+        "benchmark": args.benchmark,
+        "size": args.size,
+        "num_cores": args.num_cores,
+        "num_threads": args.num_threads,
+        "outdir": outdir,
+    }
+    command = [
+        args.gem5,
+        f"--outdir={outdir}",
+        SCRIPTS[args.hierarchy],
+        "--benchmark",
+        args.benchmark,
+        "--size",
+        args.size,
+        "--num-cores",
+        str(args.num_cores),
+        "--num-threads",
+        str(args.num_threads),
+    ]
+    if args.checkpoint_store:
+        command += ["--checkpoint-store", args.checkpoint_store]
+    return run, command + extra + args.script_args
+
+
+def run_or_die(run, command):
+    print(" ".join(command))
+    returncode, wallclock = execute(run, command)
+    if returncode != 0:
+        sys.exit(f"gem5 failed ({returncode}), see {run['outdir']}/gem5.log")
+    return wallclock
+
+
+def load_profile(profile_dir, features):
+    """Instructions and raw signature of every profiled interval."""
+    with open(os.path.join(profile_dir, "profile.json")) as f:
+        profile = json.load(f)
+    num_intervals = profile["num_intervals"]
+    expected = profile.get("expected_intervals")
+    if expected is not None and abs(num_intervals - expected) > 1:
+        sys.exit(
+            f"{profile_dir} has {num_intervals} intervals for "
+            f"{profile['roi_insts']} ROI instructions, expected {expected}"
+        )
+    store = stats_parser.open_store(os.path.join(profile_dir, "stats.txt"))
+    insts, signatures = [], []
+    for dump in range(min(num_intervals, len(store))):
+        insts.append(store.get(dump, "simInsts", 0.0))
+        signature = {}
+        for pattern in features:
+            signature.update(store.query(dump, pattern))
+        signatures.append(signature)
+    return insts, signatures
+
+
+def normalize(insts, signatures):
+    """Signature vectors in a common key order, per instruction."""
+    keys = sorted(set().union(*signatures))
+    vectors = []
+    for n, signature in zip(insts, signatures):
+        scale = 1.0 / n if n else 0.0
+        vectors.append(
+            [
+                0.0 if math.isnan(v) else v * scale
+                for v in (signature.get(key, 0.0) for key in keys)
+            ]
+        )
+    # Scale every dimension to unit range so no single stat dominates.
+    for d in range(len(keys)):
+        column = [v[d] for v in vectors]
+        span = max(column) - min(column)
+        if span:
+            low = min(column)
+            for v in vectors:
+                v[d] = (v[d] - low) / span
+    return vectors
+
+
+def distance(a, b):
+    return sum((x - y) ** 2 for x, y in zip(a, b))
+
+
+def kmeans(vectors, k, seed=0, iterations=100):
+    """Plain k-means with k-means++ seeding; returns the assignment."""
+    rng = random.Random(seed)
+    centroids = [vectors[rng.randrange(len(vectors))]]
+    while len(centroids) < k:
+        weights = [min(distance(v, c) for c in centroids) for v in vectors]
+        if not sum(weights):
+            break
+        centroids.append(rng.choices(vectors, weights)[0])
+
+    assignment = None
+    for _ in range(iterations):
+        new = [
+            min(range(len(centroids)), key=lambda c: distance(v, centroids[c]))
+            for v in vectors
+        ]
+        if new == assignment:
+            break
+        assignment = new
+        for c in range(len(centroids)):
+            members = [v for v, a in zip(vectors, assignment) if a == c]
+            if members:
+                centroids[c] = [sum(x) / len(members) for x in zip(*members)]
+    return assignment, centroids
+
+
+def select(insts, signatures, clusters, seed):
+    """Representative interval and weight of every cluster."""
+    vectors = normalize(insts, signatures)
+    assignment, centroids = kmeans(
+        vectors, min(clusters, len(vectors)), seed
+    )
+    total = sum(insts)
+    selection = []
+    for c, centroid in enumerate(centroids):
+        members = [i for i, a in enumerate(assignment) if a == c]
+        if not members:
+            continue
+        representative = min(
+            members, key=lambda i: distance(vectors[i], centroid)
+        )
+        selection.append(
+            {
+                "interval": representative,
+                "members": members,
+                "weight": sum(insts[i] for i in members) / total,
+            }
+        )
+    return selection
+
+
+def sample_metrics(stats_path, hierarchy):
+    """Per-instruction rates measured in one detailed sample."""
+    # The first dump is the sample (or the ROI of a full run); gem5 may
+    # append another one at exit.
+    store = stats_parser.open_store(stats_path)
+    pattern = L2_PATTERNS[hierarchy]
+    return {
+        "insts": store.get(0, "simInsts"),
+        "ticks": store.get(0, "simTicks"),
+        "l2_hits": sum(store.query(0, pattern.format("hits")).values()),
+        "l2_misses": sum(store.query(0, pattern.format("misses")).values()),
+    }
+
+
+def combine(insts, selection, samples):
+    """Weighted estimate of the whole ROI from the detailed samples."""
+    total_insts = sum(insts)
+    estimate = {"simInsts": total_insts, "simTicks": 0.0}
+    hits = misses = 0.0
+    for entry in selection:
+        sample = samples[entry["interval"]]
+        if not sample["insts"]:
+            continue
+        represented = entry["weight"] * total_insts
+        per_inst = represented / sample["insts"]
+        estimate["simTicks"] += sample["ticks"] * per_inst
+        hits += sample["l2_hits"] * per_inst
+        misses += sample["l2_misses"] * per_inst
+    estimate["l2_hit_rate"] = hits / (hits + misses) if hits + misses else 0
+    estimate["l2_mpki"] = 1000 * misses / total_insts if total_insts else 0
+    return estimate
+
+
+def reference_metrics(stats_path, hierarchy):
+    full = sample_metrics(stats_path, hierarchy)
+    hits, misses = full["l2_hits"], full["l2_misses"]
+    return {
+        "simInsts": full["insts"],
+        "simTicks": full["ticks"],
+        "l2_hit_rate": hits / (hits + misses) if hits + misses else 0,
+        "l2_mpki": 1000 * misses / full["insts"] if full["insts"] else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Sampled simulation of the PARSEC ROI."
+    )
+    parser.add_argument("--gem5", type=str, required=True)
+    parser.add_argument(
+        "--hierarchy", type=str, default="mesi2", choices=sorted(SCRIPTS)
+    )
+    parser.add_argument("--benchmark", type=str, required=True)
+    parser.add_argument("--size", type=str, default="simsmall")
+    parser.add_argument("--num-cores", type=int, default=2)
+    parser.add_argument(
+        "--num-threads",
+        type=int,
+        default=None,
+        help="PARSEC threads (default: --num-cores).",
+    )
+    parser.add_argument("--cpu-type", type=str, default="o3")
+    parser.add_argument(
+        "--interval",
+        type=int,
+        default=50000000,
+        help="Interval length in instructions of the first core.",
+    )
+    parser.add_argument("--clusters", type=int, default=6)
+    parser.add_argument("--warmup", type=int, default=1000000)
+    parser.add_argument(
+        "--length",
+        type=int,
+        default=None,
+        help="Detailed instructions per sample (default: --interval).",
+    )
+    parser.add_argument(
+        "--feature",
+        action="append",
+        default=None,
+        help="Stat glob used in interval signatures (repeatable).",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--single-pass",
+        action="store_true",
+        help="Checkpoint every interval in the profile pass instead of "
+        "re-running the selected ones.",
+    )
+    parser.add_argument(
+        "--checkpoint-store",
+        type=str,
+        default=None,
+        help="Post-boot checkpoint store passed to the profile passes.",
+    )
+    parser.add_argument(
+        "--reference",
+        type=str,
+        default=None,
+        help="stats.txt of a full detailed run to estimate the error.",
+    )
+    parser.add_argument("--sample-dir", type=str, default="sampling_out")
+    parser.add_argument("--mem-per-run", type=float, default=4.0)
+    parser.add_argument("-j", "--jobs", type=int, default=None)
+    parser.add_argument(
+        "script_args",
+        nargs=argparse.REMAINDER,
+        help="Extra arguments after '--' are passed to every run script.",
+    )
+    args = parser.parse_args()
+    args.script_args = [a for a in args.script_args if a != "--"]
+    if args.num_threads is None:
+        args.num_threads = args.num_cores
+    features = args.feature or DEFAULT_FEATURES
+    length = args.length or args.interval
+
+    profile_dir = os.path.join(args.sample_dir, "profile")
+    profile_extra = [
+        "--cpu-type",
+        "timing",
+        "--sample-interval",
+        str(args.interval),
+    ]
+    if args.single_pass:
+        profile_extra += ["--sample-checkpoints", "all"]
+    wallclock = {
+        "profile": run_or_die(*gem5_run(args, profile_dir, profile_extra))
+    }
+
+    insts, signatures = load_profile(profile_dir, features)
+    selection = select(insts, signatures, args.clusters, args.seed)
+    with open(os.path.join(args.sample_dir, "selection.json"), "w") as f:
+        json.dump(selection, f, indent=2)
+    chosen = sorted(entry["interval"] for entry in selection)
+    print(f"{len(insts)} intervals, simulating {chosen} in detail")
+
+    checkpoint_dir = profile_dir
+    if not args.single_pass:
+        checkpoint_dir = os.path.join(args.sample_dir, "checkpoints")
+        wallclock["checkpoint"] = run_or_die(
+            *gem5_run(
+                args,
+                checkpoint_dir,
+                profile_extra
+                + ["--sample-checkpoints", ",".join(map(str, chosen))],
+            )
+        )
+    with open(os.path.join(checkpoint_dir, "samples", "samples.json")) as f:
+        checkpoints = json.load(f)
+
+    # The post-boot checkpoint store only applies to the profile passes.
+    args.checkpoint_store = None
+    detail = {}
+    for interval in chosen:
+        detail[interval] = gem5_run(
+            args,
+            os.path.join(args.sample_dir, "detail", f"interval{interval}"),
+            [
+                "--cpu-type",
+                args.cpu_type,
+                "--sample-restore",
+                checkpoints[str(interval)],
+                "--sample-warmup",
+                str(args.warmup),
+                "--sample-length",
+                str(length),
+            ],
+        )
+    workers = pool_size(args.mem_per_run * GiB, args.jobs)
+    samples = {}
+    sample_wallclock = []
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        futures = {
+            pool.submit(execute, *detail[interval]): interval
+            for interval in chosen
+        }
+        for future in concurrent.futures.as_completed(futures):
+            interval = futures[future]
+            returncode, seconds = future.result()
+            outdir = detail[interval][0]["outdir"]
+            if returncode != 0:
+                sys.exit(f"Sample {interval} failed, see {outdir}/gem5.log")
+            sample_wallclock.append(seconds)
+            samples[interval] = sample_metrics(
+                os.path.join(outdir, "stats.txt"), args.hierarchy
+            )
+            print(f"Sample {interval} done in {seconds:.1f}s")
+    wallclock["detail (max)"] = max(sample_wallclock)
+    wallclock["detail (sum)"] = sum(sample_wallclock)
+
+    report = {
+        "estimate": combine(insts, selection, samples),
+        "wallclock": wallclock,
+    }
+    if args.reference:
+        reference = reference_metrics(args.reference, args.hierarchy)
+        report["reference"] = reference
+        report["relative_error"] = {
+            name: abs(value - reference[name]) / reference[name]
+            for name, value in report["estimate"].items()
+            if reference.get(name)
+        }
+    with open(os.path.join(args.sample_dir, "estimate.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    for name, value in report["estimate"].items():
+        line = f"{name:12s} {value:16.6g}"
+        if args.reference:
+            line += f"   reference {report['reference'][name]:16.6g}"
+            if name in report["relative_error"]:
+                error = 100 * report["relative_error"][name]
+                line += f"   error {error:6.2f}%"
+        print(line)
+    for phase, seconds in wallclock.items():
+        print(f"wallclock {phase:14s} {seconds:10.1f}s")
+
+
+if __name__ == "__main__":
+    main()
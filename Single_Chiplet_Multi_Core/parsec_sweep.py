@@ -0,0 +1,265 @@
+"""
+Sweep runner for the x86-parsec-mesi2.py / x86-parsec-mesi3.py scripts.
+
+The sweep expands the matrix benchmark x size x num_cores x num_threads x
+hierarchy into independent gem5 runs, each with its own output directory,
+and runs them on a bounded pool of gem5 processes. The PARSEC thread count
+is always passed explicitly, since the two scripts default to different
+ones; without --num-threads it equals the core count of the run.
+
+The pool size is limited by both the host core count and the available
+host memory, since every full-system run needs about 3.9 GB (see
+`hostMemory` in Experiments_Stat_Files).
+
+Stats are collected as runs finish and appended to `summary.csv` in the
+sweep directory, so partial results are usable while the sweep is still
+running.
+
+This script runs on the host with plain Python 3, not inside gem5.
+
+Usage:
+------
+
+```
+python3 Single_Chiplet_Multi_Core/parsec_sweep.py \
+    --gem5-mesi2 build/X86_MESI_Two_Level/gem5.opt \
+    --gem5-mesi3 build/X86_MESI_Three_Level/gem5.opt \
+    --benchmark bodytrack ferret --size simsmall \
+    --num-cores 2 4 8 16 --hierarchy mesi2 mesi3 \
+    --sweep-dir sweep_out
+```
+"""
+import argparse
+import concurrent.futures
+import csv
+import itertools
+import os
+import sys
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(THIS_DIR, os.pardir, "Tools"))
+
+import stats_parser
+from gem5_runs import L2_PATTERNS, execute
+
+SCRIPTS = {
+    "mesi2": os.path.join(THIS_DIR, "x86-parsec-mesi2.py"),
+    "mesi3": os.path.join(THIS_DIR, "x86-parsec-mesi3.py"),
+}
+
+SUMMARY_FIELDS = [
+    "hierarchy",
+    "benchmark",
+    "size",
+    "num_cores",
+    "num_threads",
+    "status",
+    "wallclock",
+    "simTicks",
+    "simInsts",
+    "hostSeconds",
+    "l2_hits",
+    "l2_misses",
+    "l2_hit_rate",
+]
+
+GiB = 1024**3
+
+
+def host_memory_available():
+    """Available host memory in bytes (MemAvailable on Linux)."""
+    try:
+        with open("/proc/meminfo") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_AVPHYS_PAGES")
+
+
+def pool_size(mem_per_run, max_jobs=None):
+    """Number of concurrent runs the host can hold."""
+    by_cores = os.cpu_count() or 1
+    by_memory = max(1, int(host_memory_available() // mem_per_run))
+    size = min(by_cores, by_memory)
+    if max_jobs:
+        size = min(size, max_jobs)
+    return size
+
+
+def expand_matrix(args):
+    """One run description per point of the sweep matrix."""
+    runs = []
+    for hierarchy, benchmark, size, num_cores, num_threads in (
+        itertools.product(
+            args.hierarchy,
+            args.benchmark,
+            args.size,
+            args.num_cores,
+            args.num_threads or [None],
+        )
+    ):
+        num_threads = num_threads or num_cores
+        name = f"{benchmark}-{size}-{num_cores}c-{num_threads}t"
+        runs.append(
+            {
+                "hierarchy": hierarchy,
+                "benchmark": benchmark,
+                "size": size,
+                "num_cores": num_cores,
+                "num_threads": num_threads,
+                "outdir": os.path.join(args.sweep_dir, hierarchy, name),
+            }
+        )
+    return runs
+
+
+def run_command(run, gem5, script_args):
+    return [
+        gem5,
+        f"--outdir={run['outdir']}",
+        SCRIPTS[run["hierarchy"]],
+        "--benchmark",
+        run["benchmark"],
+        "--size",
+        run["size"],
+        "--num-cores",
+        str(run["num_cores"]),
+        "--num-threads",
+        str(run["num_threads"]),
+    ] + script_args
+
+
+def summarize(run, returncode, wallclock):
+    """Collapse the ROI stats dump of a run into one summary row."""
+    row = {field: run.get(field) for field in SUMMARY_FIELDS}
+    row["wallclock"] = round(wallclock, 2)
+    stats_path = os.path.join(run["outdir"], "stats.txt")
+    if returncode != 0 or not os.path.exists(stats_path):
+        row["status"] = f"failed ({returncode})"
+        return row
+
+    store = stats_parser.open_store(stats_path)
+    if len(store) == 0:
+        row["status"] = "no stats"
+        return row
+    # The ROI dump comes first; gem5 may append another one at exit.
+    row["status"] = "ok"
+    for name in ("simTicks", "simInsts", "hostSeconds"):
+        row[name] = store.get(0, name)
+    pattern = L2_PATTERNS[run["hierarchy"]]
+    hits = sum(store.query(0, pattern.format("hits")).values())
+    misses = sum(store.query(0, pattern.format("misses")).values())
+    row["l2_hits"], row["l2_misses"] = hits, misses
+    if hits + misses:
+        row["l2_hit_rate"] = round(hits / (hits + misses), 6)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run a PARSEC benchmark x size x cores x threads x "
+        "hierarchy matrix on a bounded pool of gem5 processes."
+    )
+    parser.add_argument("--benchmark", nargs="+", required=True)
+    parser.add_argument(
+        "--size", nargs="+", default=["simsmall"], help="Input sizes."
+    )
+    parser.add_argument(
+        "--num-cores", nargs="+", type=int, default=[2, 4, 8, 16]
+    )
+    parser.add_argument(
+        "--num-threads",
+        nargs="+",
+        type=int,
+        default=None,
+        help="PARSEC thread counts (default: the core count of each run).",
+    )
+    parser.add_argument(
+        "--hierarchy",
+        nargs="+",
+        default=["mesi2"],
+        choices=sorted(SCRIPTS),
+    )
+    parser.add_argument(
+        "--gem5-mesi2",
+        type=str,
+        default="build/X86_MESI_Two_Level/gem5.opt",
+        help="gem5 binary built with MESI_Two_Level.",
+    )
+    parser.add_argument(
+        "--gem5-mesi3",
+        type=str,
+        default="build/X86_MESI_Three_Level/gem5.opt",
+        help="gem5 binary built with MESI_Three_Level.",
+    )
+    parser.add_argument("--sweep-dir", type=str, default="sweep_out")
+    parser.add_argument(
+        "--mem-per-run",
+        type=float,
+        default=4.0,
+        help="Host memory reserved per run, in GiB.",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="Upper bound on concurrent runs (default: cores/memory).",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print the commands without running them.",
+    )
+    parser.add_argument(
+        "script_args",
+        nargs=argparse.REMAINDER,
+        help="Extra arguments after '--' are passed to every run script.",
+    )
+    args = parser.parse_args()
+    script_args = [a for a in args.script_args if a != "--"]
+
+    gem5_binaries = {"mesi2": args.gem5_mesi2, "mesi3": args.gem5_mesi3}
+    runs = expand_matrix(args)
+    commands = [
+        run_command(run, gem5_binaries[run["hierarchy"]], script_args)
+        for run in runs
+    ]
+    if args.dry_run:
+        for command in commands:
+            print(" ".join(command))
+        return
+
+    workers = pool_size(args.mem_per_run * GiB, args.jobs)
+    print(f"Running {len(runs)} simulations on {workers} worker(s)")
+
+    os.makedirs(args.sweep_dir, exist_ok=True)
+    summary_path = os.path.join(args.sweep_dir, "summary.csv")
+    with open(summary_path, "w", newline="") as summary_file:
+        writer = csv.DictWriter(summary_file, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            futures = {
+                pool.submit(execute, run, command): run
+                for run, command in zip(runs, commands)
+            }
+            for done, future in enumerate(
+                concurrent.futures.as_completed(futures), 1
+            ):
+                run = futures[future]
+                row = summarize(run, *future.result())
+                writer.writerow(row)
+                summary_file.flush()
+                print(
+                    f"[{done}/{len(runs)}] {run['hierarchy']} "
+                    f"{os.path.basename(run['outdir'])}: {row['status']} "
+                    f"in {row['wallclock']}s"
+                )
+
+    print(f"Summary written to {summary_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Replay the elastic traces of a PARSEC ROI (recorded with --record-etrace
+by x86-parsec-mesi2.py / x86-parsec-mesi3.py) on TraceCPU cores, through a
+MESI Two Level or Three Level cache hierarchy.
+
+Only the memory system is simulated in detail, so cache and DRAM variants
+can be evaluated without re-running the O3 pipeline. With --reference, the
+replayed simTicks and L2 hit rate are compared with those of a full O3 run
+of the same configuration, along with the wall-clock of both.
+
+Usage:
+------
+
+```
+build/X86_MESI_Two_Level/gem5.opt --outdir=replay_out \
+    Single_Chiplet_Multi_Core/x86-etrace-replay.py \
+    --etrace-dir record_out --hierarchy mesi2 --l2-size 512KiB \
+    --reference o3_out/stats.txt
+```
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import m5
+from m5.objects import Root, TraceCPU
+
+from gem5.coherence_protocol import CoherenceProtocol
+from gem5.components.boards.test_board import TestBoard
+from gem5.components.memory import DualChannelDDR4_2400
+from gem5.components.processors.base_cpu_core import BaseCPUCore
+from gem5.components.processors.base_cpu_processor import BaseCPUProcessor
+from gem5.isas import ISA
+from gem5.utils.requires import requires
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Tools")
+)
+import elastic_trace
+
+# Defaults of the matching run scripts.
+HIERARCHY_DEFAULTS = {
+    "mesi2": {"l1d_assoc": 8, "l1i_assoc": 8, "l2_assoc": 16},
+    "mesi3": {"l1d_assoc": 4, "l1i_assoc": 4, "l2_assoc": 4},
+}
+
+parser = argparse.ArgumentParser(
+    description="Replay recorded elastic traces through a MESI hierarchy."
+)
+parser.add_argument(
+    "--etrace-dir",
+    type=str,
+    required=True,
+    help="Outdir of the --record-etrace run.",
+)
+parser.add_argument(
+    "--hierarchy", type=str, default="mesi2", choices=["mesi2", "mesi3"]
+)
+parser.add_argument("--l1d-size", type=str, default="32KiB")
+parser.add_argument("--l1d-assoc", type=int, default=None)
+parser.add_argument("--l1i-size", type=str, default="32KiB")
+parser.add_argument("--l1i-assoc", type=int, default=None)
+parser.add_argument("--l2-size", type=str, default="256KiB")
+parser.add_argument("--l2-assoc", type=int, default=None)
+parser.add_argument("--num-l2-banks", type=int, default=2)
+parser.add_argument("--l3-size", type=str, default="4MiB")
+parser.add_argument("--l3-assoc", type=int, default=16)
+parser.add_argument("--num-l3-banks", type=int, default=1)
+parser.add_argument(
+    "--mem-size",
+    type=str,
+    default=None,
+    help="Memory size (default: that of the recorded run).",
+)
+parser.add_argument(
+    "--reference",
+    type=str,
+    default=None,
+    help="stats.txt of the full O3 run to compare the replay with.",
+)
+args = parser.parse_args()
+for name, value in HIERARCHY_DEFAULTS[args.hierarchy].items():
+    if getattr(args, name) is None:
+        setattr(args, name, value)
+
+requires(
+    isa_required=ISA.X86,
+    coherence_protocol_required=(
+        CoherenceProtocol.MESI_TWO_LEVEL
+        if args.hierarchy == "mesi2"
+        else CoherenceProtocol.MESI_THREE_LEVEL
+    ),
+)
+
+manifest = elastic_trace.load_manifest(args.etrace_dir)
+
+if args.hierarchy == "mesi2":
+    from gem5.components.cachehierarchies.ruby.mesi_two_level_cache_hierarchy import (
+        MESITwoLevelCacheHierarchy,
+    )
+
+    cache_hierarchy = MESITwoLevelCacheHierarchy(
+        l1d_size=args.l1d_size,
+        l1d_assoc=args.l1d_assoc,
+        l1i_size=args.l1i_size,
+        l1i_assoc=args.l1i_assoc,
+        l2_size=args.l2_size,
+        l2_assoc=args.l2_assoc,
+        num_l2_banks=args.num_l2_banks,
+    )
+else:
+    from gem5.components.cachehierarchies.ruby.mesi_three_level_cache_hierarchy import (
+        MESIThreeLevelCacheHierarchy,
+    )
+
+    cache_hierarchy = MESIThreeLevelCacheHierarchy(
+        l1d_size=args.l1d_size,
+        l1d_assoc=args.l1d_assoc,
+        l1i_size=args.l1i_size,
+        l1i_assoc=args.l1i_assoc,
+        l2_size=args.l2_size,
+        l2_assoc=args.l2_assoc,
+        l3_size=args.l3_size,
+        l3_assoc=args.l3_assoc,
+        num_l3_banks=args.num_l3_banks,
+    )
+
+# The traces hold physical addresses of the recorded system, so the memory
+# must be at least as large.
+memory = DualChannelDDR4_2400(size=args.mem_size or manifest["mem_size"])
+
+# One TraceCPU per recorded core, with the O3 queue sizes of the recording.
+# The simulation ends once every core has replayed its trace.
+cores = []
+for traces in manifest["cores"]:
+    cpu = TraceCPU(
+        instTraceFile=os.path.join(args.etrace_dir, traces["inst"]),
+        dataTraceFile=os.path.join(args.etrace_dir, traces["data"]),
+        sizeROB=traces["rob_entries"],
+        sizeLoadBuffer=traces["lq_entries"],
+        sizeStoreBuffer=traces["sq_entries"],
+        enableEarlyExit=False,
+    )
+    cores.append(BaseCPUCore(core=cpu, isa=ISA.X86))
+processor = BaseCPUProcessor(cores=cores)
+
+# The test board needs no workload, which TraceCPU does not run.
+board = TestBoard("3GHz", processor, memory, cache_hierarchy)
+
+root = Root(full_system=False, board=board)
+board._pre_instantiate()
+m5.instantiate()
+
+print(
+    f"Replaying {len(cores)} core(s) of {manifest['benchmark']} "
+    f"({manifest['size']}) through {args.hierarchy}"
+)
+start = time.time()
+exit_event = m5.simulate()
+wallclock = time.time() - start
+print(f"Exiting @ tick {m5.curTick()} because {exit_event.getCause()}")
+m5.stats.dump()
+print(f"Replay wall-clock: {wallclock:.1f}s")
+
+if args.reference:
+    report = elastic_trace.compare(
+        os.path.join(m5.options.outdir, "stats.txt"),
+        args.reference,
+        args.hierarchy,
+        replay_wallclock=wallclock,
+    )
+    elastic_trace.print_report(report)
+    with open(os.path.join(m5.options.outdir, "etrace_report.json"), "w") as f:
+        json.dump(report, f, indent=2)
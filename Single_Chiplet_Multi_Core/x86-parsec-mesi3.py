@@ -1,20 +1,48 @@
 import argparse
+import atexit
+import json
+import os
+import sys
 import time
 
 import m5
+from m5.defines import buildEnv
 from m5.objects import Root
 
 from gem5.coherence_protocol import CoherenceProtocol
 from gem5.components.boards.x86_board import X86Board
 from gem5.components.memory import DualChannelDDR4_2400
-from gem5.components.processors.cpu_types import CPUTypes
+from gem5.components.processors.cpu_types import (
+    CPUTypes,
+    get_cpu_type_from_str,
+    get_cpu_types_str_set,
+)
 from gem5.components.processors.simple_processor import SimpleProcessor
+from gem5.components.processors.simple_switchable_processor import (
+    SimpleSwitchableProcessor,
+)
 from gem5.isas import ISA
 from gem5.resources.resource import obtain_resource
 from gem5.simulate.exit_event import ExitEvent
 from gem5.simulate.simulator import Simulator
 from gem5.utils.requires import requires
 
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Tools")
+)
+from checkpoint_store import (
+    CheckpointStore,
+    checkpoint_key,
+    checkpoint_tick,
+    write_meta,
+)
+from result_cache import (
+    ResultCache,
+    config_key,
+    gem5_identity,
+    script_config,
+)
+
 # Check for the required gem5 build
 requires(
     isa_required=ISA.X86,
@@ -58,7 +86,132 @@ parser.add_argument(
     help="Simulation size of the benchmark program.",
     choices=size_choices,
 )
+parser.add_argument(
+    "--num-cores",
+    type=int,
+    default=4,
+    help="Number of CPU cores.",
+)
+parser.add_argument(
+    "--num-threads",
+    type=int,
+    default=2,
+    help="Number of PARSEC threads; two by default, whatever --num-cores.",
+)
+parser.add_argument(
+    "--cpu-type",
+    type=str,
+    default="o3",
+    help="CPU model used for the whole simulation.",
+    choices=get_cpu_types_str_set(),
+)
+parser.add_argument("--l1d-size", type=str, default="32KiB")
+parser.add_argument("--l1d-assoc", type=int, default=4)
+parser.add_argument("--l1i-size", type=str, default="32KiB")
+parser.add_argument("--l1i-assoc", type=int, default=4)
+parser.add_argument("--l2-size", type=str, default="256KiB")
+parser.add_argument("--l2-assoc", type=int, default=4)
+parser.add_argument("--l3-size", type=str, default="4MiB")
+parser.add_argument("--l3-assoc", type=int, default=16)
+parser.add_argument("--num-l3-banks", type=int, default=1)
+parser.add_argument(
+    "--mem-size",
+    type=str,
+    default="3GiB",
+    help="Guest memory size (the X86 board supports at most 3GiB).",
+)
+parser.add_argument(
+    "--fast-forward",
+    type=str,
+    default=None,
+    choices=["kvm", "timing"],
+    help="Boot on fast cores and switch to --cpu-type at WORKBEGIN. KVM "
+    "falls back to the Timing CPU when it is unavailable.",
+)
+parser.add_argument(
+    "--switch-back",
+    action="store_true",
+    help="With --fast-forward, switch back to the fast cores after WORKEND "
+    "and run the rest of the workload to completion.",
+)
+parser.add_argument(
+    "--checkpoint-store",
+    type=str,
+    default=None,
+    help="Directory of the shared post-boot checkpoint store. A checkpoint "
+    "taken at WORKBEGIN is restored when present, and saved otherwise.",
+)
+parser.add_argument(
+    "--sample-interval",
+    type=int,
+    default=None,
+    help="Sampling profile pass: dump stats every N instructions (of the "
+    "first core) during the ROI. Run it with a fast --cpu-type.",
+)
+parser.add_argument(
+    "--sample-checkpoints",
+    type=str,
+    default=None,
+    help="With --sample-interval, checkpoint the start of these intervals "
+    "('all' or a comma-separated list) into <outdir>/samples.",
+)
+parser.add_argument(
+    "--sample-restore",
+    type=str,
+    default=None,
+    help="Sample detail pass: restore this interval checkpoint, warm up "
+    "for --sample-warmup instructions and measure --sample-length.",
+)
+parser.add_argument("--sample-warmup", type=int, default=1000000)
+parser.add_argument("--sample-length", type=int, default=10000000)
+parser.add_argument(
+    "--result-cache",
+    type=str,
+    default=None,
+    help="Directory of the result cache. If this exact configuration has "
+    "already been simulated, its stats.txt is copied to the outdir instead.",
+)
+parser.add_argument(
+    "--force-rerun",
+    action="store_true",
+    help="Ignore and replace any cached result for this configuration.",
+)
+parser.add_argument(
+    "--capture-trace",
+    action="store_true",
+    help="Record the memory requests of every core into <outdir>/memtrace.* "
+    "and the ROI ticks into memtrace.json; convert them with "
+    "Tools/mem_trace.py.",
+)
+parser.add_argument(
+    "--record-etrace",
+    action="store_true",
+    help="Record elastic traces of the O3 cores during the ROI into the "
+    "outdir, for Single_Chiplet_Multi_Core/x86-etrace-replay.py.",
+)
+parser.add_argument(
+    "--record-coherence",
+    action="store_true",
+    help="Log the coherence messages of the ROI to <outdir>/coherence.log "
+    "(needs gem5.opt); convert it with Tools/coherence_trace.py.",
+)
 args = parser.parse_args()
+# Sample checkpoints must hold their state in the starting cores, which is
+# where the detail pass restores it.
+if args.sample_interval and args.fast_forward:
+    parser.error("--sample-interval cannot be combined with --fast-forward")
+# A cached result only restores stats.txt, not the probe files.
+if args.capture_trace and args.result_cache:
+    parser.error("--capture-trace cannot be combined with --result-cache")
+if args.record_etrace and args.result_cache:
+    parser.error("--record-etrace cannot be combined with --result-cache")
+if args.record_coherence and args.result_cache:
+    parser.error("--record-coherence cannot be combined with --result-cache")
+# Nor the profile.json and sample checkpoints of a profile pass.
+if args.sample_interval and args.result_cache:
+    parser.error("--sample-interval cannot be combined with --result-cache")
+if args.record_etrace and args.cpu_type != "o3":
+    parser.error("--record-etrace needs --cpu-type o3")
 
 # Set up cache hierarchy: MESI Three Level Cache Hierarchy
 from gem5.components.cachehierarchies.ruby.mesi_three_level_cache_hierarchy import (
@@ -66,26 +219,175 @@ from gem5.components.cachehierarchies.ruby.mesi_three_level_cache_hierarchy impo
 )
 
 cache_hierarchy = MESIThreeLevelCacheHierarchy(
-    l1d_size="32KiB",
-    l1d_assoc=4,
-    l1i_size="32KiB",
-    l1i_assoc=4,
-    l2_size="256KiB",
-    l2_assoc=4,
-    l3_size="4MiB",
-    l3_assoc=16,
-    num_l3_banks=1,
+    l1d_size=args.l1d_size,
+    l1d_assoc=args.l1d_assoc,
+    l1i_size=args.l1i_size,
+    l1i_assoc=args.l1i_assoc,
+    l2_size=args.l2_size,
+    l2_assoc=args.l2_assoc,
+    l3_size=args.l3_size,
+    l3_assoc=args.l3_assoc,
+    num_l3_banks=args.num_l3_banks,
 )
 
 # Memory: Dual Channel DDR4 2400 DRAM device
-memory = DualChannelDDR4_2400(size="3GiB")
+memory = DualChannelDDR4_2400(size=args.mem_size)
 
-# Set up the processor with O3 CPU
-processor = SimpleProcessor(
-    cpu_type=CPUTypes.O3,
-    isa=ISA.X86,
-    num_cores=4,
+# Set up the workload: PARSEC benchmark
+command = (
+    f"cd /home/gem5/parsec-benchmark;"
+    + "source env.sh;"
+    + f"parsecmgmt -a run -p {args.benchmark} -c gcc-hooks -i {args.size} -n {args.num_threads};"
+    + "sleep 5;"
+    + "m5 exit;"
 )
+kernel_resource = ("x86-linux-kernel-4.19.83", "1.0.0")
+disk_resource = ("x86-parsec", "1.0.0")
+
+# Skip the simulation entirely when this configuration was already run.
+# Checkpoint and cache options only change how a result is obtained, not
+# the result, so they are not part of the key.
+if args.result_cache:
+    result_cache = ResultCache(args.result_cache)
+    result_config = script_config(
+        __file__,
+        args,
+        exclude=("checkpoint_store", "result_cache", "force_rerun"),
+        sample_restore_tick=(
+            checkpoint_tick(args.sample_restore) if args.sample_restore else None
+        ),
+        command=command,
+        kernel=kernel_resource,
+        disk_image=disk_resource,
+        gem5=gem5_identity(),
+    )
+    result_key = config_key(result_config)
+    if args.force_rerun:
+        result_cache.invalidate(result_key)
+    elif result_cache.restore(result_key, m5.options.outdir):
+        print(f"Cached result {result_key} copied to {m5.options.outdir}")
+        sys.exit(0)
+
+# Pick the core used to fast-forward to the ROI. Ruby only supports timing
+# accesses (and KVM's non-caching mode), so Timing is the fallback when KVM
+# is not built in or /dev/kvm is not accessible.
+fast_cpu_type = None
+if args.fast_forward == "kvm":
+    if buildEnv.get("USE_KVM") and os.access("/dev/kvm", os.R_OK | os.W_OK):
+        fast_cpu_type = CPUTypes.KVM
+    else:
+        print("KVM is unavailable, fast-forwarding with the Timing CPU")
+        fast_cpu_type = CPUTypes.TIMING
+elif args.fast_forward == "timing":
+    fast_cpu_type = CPUTypes.TIMING
+detailed_cpu_type = get_cpu_type_from_str(args.cpu_type)
+
+# Post-boot checkpoints do not depend on the cache hierarchy, so they are
+# shared by every hierarchy variant of the same booted workload.
+checkpoint = None
+save_checkpoint = False
+if args.sample_restore:
+    checkpoint = args.sample_restore
+    print(f"Restoring sample checkpoint {checkpoint}")
+elif args.checkpoint_store:
+    checkpoint_store = CheckpointStore(args.checkpoint_store)
+    checkpoint_fields = {
+        "kernel": kernel_resource,
+        "disk_image": disk_resource,
+        "isa": "x86",
+        "num_cores": args.num_cores,
+        "mem_size": args.mem_size,
+        "command": command,
+    }
+    ckpt_key = checkpoint_key(**checkpoint_fields)
+    checkpoint = checkpoint_store.lookup(ckpt_key)
+    if checkpoint:
+        print(f"Restoring post-boot checkpoint {checkpoint}")
+    else:
+        # Only one concurrent run writes a given checkpoint; the others
+        # boot normally rather than wait for it.
+        save_checkpoint = checkpoint_store.try_lock(ckpt_key)
+
+# Set up the processor (O3 CPU by default). With --fast-forward the boot
+# runs on the fast cores and the processor switches to the detailed cores
+# at WORKBEGIN. A restored checkpoint is already at WORKBEGIN, so it starts
+# on the detailed cores directly. The checkpoint is always taken from the
+# starting cores, which every processor layout names the same way.
+switch_at_roi = fast_cpu_type is not None and not checkpoint
+switch_after_roi = args.switch_back and fast_cpu_type is not None
+if switch_at_roi:
+    processor = SimpleSwitchableProcessor(
+        starting_core_type=fast_cpu_type,
+        switch_core_type=detailed_cpu_type,
+        isa=ISA.X86,
+        num_cores=args.num_cores,
+    )
+elif switch_after_roi:
+    processor = SimpleSwitchableProcessor(
+        starting_core_type=detailed_cpu_type,
+        switch_core_type=fast_cpu_type,
+        isa=ISA.X86,
+        num_cores=args.num_cores,
+    )
+else:
+    processor = SimpleProcessor(
+        cpu_type=detailed_cpu_type,
+        isa=ISA.X86,
+        num_cores=args.num_cores,
+    )
+
+# Elastic traces are recorded from the first committed instruction, so the
+# O3 cores must not run the boot.
+if args.record_etrace:
+    if not (switch_at_roi or checkpoint):
+        parser.error(
+            "--record-etrace needs --fast-forward or a stored post-boot "
+            "checkpoint, so that only the ROI runs on the O3 cores"
+        )
+    import elastic_trace
+
+    if switch_at_roi:
+        # The switchable processor only exposes its current (fast) cores.
+        roi_cores = [
+            core
+            for core in processor._all_cores()
+            if core.get_type() == detailed_cpu_type
+        ]
+    else:
+        roi_cores = processor.get_cores()
+    elastic_trace.attach_recorders(
+        roi_cores,
+        m5.options.outdir,
+        benchmark=args.benchmark,
+        size=args.size,
+        num_cores=args.num_cores,
+        mem_size=args.mem_size,
+        script=os.path.basename(__file__),
+    )
+
+# Trace the cores' requests at the sequencers. The probes must be in place
+# before the board connects the cores; switched-in cores take over the
+# monitored ports.
+if args.capture_trace:
+    import mem_trace
+
+    trace_manifest = mem_trace.attach_probes(processor, m5.options.outdir)
+
+# Log the Ruby message buffer enqueues of the ROI; coherence_trace.py keeps
+# the messages sent into the network.
+if args.record_coherence:
+    import coherence_trace
+    from m5 import debug, trace
+
+    trace.output(coherence_trace.LOG_FILE)
+
+def record_coherence(enable):
+    if args.record_coherence:
+        flag = debug.flags[coherence_trace.DEBUG_FLAG]
+        if enable:
+            flag.enable()
+        else:
+            flag.disable()
 
 # Configure the X86 board for full-system simulation
 board = X86Board(
@@ -95,51 +397,204 @@ board = X86Board(
     cache_hierarchy=cache_hierarchy,
 )
 
-# Set up the workload: PARSEC benchmark
-command = (
-    f"cd /home/gem5/parsec-benchmark;"
-    + "source env.sh;"
-    + f"parsecmgmt -a run -p {args.benchmark} -c gcc-hooks -i {args.size} -n 2;"
-    + "sleep 5;"
-    + "m5 exit;"
-)
 board.set_kernel_disk_workload(
-    kernel=obtain_resource("x86-linux-kernel-4.19.83", resource_version="1.0.0"),
-    disk_image=obtain_resource("x86-parsec", resource_version="1.0.0"),
+    kernel=obtain_resource(kernel_resource[0], resource_version=kernel_resource[1]),
+    disk_image=obtain_resource(disk_resource[0], resource_version=disk_resource[1]),
     readfile_contents=command,
 )
 
+# Wall-clock and tick at the start of each phase, to report the speedup of
+# fast-forwarding.
+phases = []
+
+def start_phase(name, tick=None):
+    phases.append((name, time.time(), m5.curTick() if tick is None else tick))
+
+# Sampling profile pass: one stats dump per interval of the ROI, plus a
+# checkpoint at the start of the selected intervals.
+sample_index = 0
+if args.sample_checkpoints == "all":
+    sample_checkpoints = None
+elif args.sample_checkpoints:
+    sample_checkpoints = {int(i) for i in args.sample_checkpoints.split(",")}
+samples_dir = os.path.join(m5.options.outdir, "samples")
+
+def save_sample_checkpoint(index):
+    if not args.sample_checkpoints:
+        return
+    if sample_checkpoints is not None and index not in sample_checkpoints:
+        return
+    path = os.path.join(samples_dir, f"interval{index}")
+    if index == 0 and checkpoint:
+        # The restored post-boot checkpoint is the start of interval 0.
+        path = checkpoint
+    else:
+        print(f"Saving checkpoint of interval {index} to {path}")
+        simulator.save_checkpoint(path)
+        write_meta(path, m5.curTick(), interval=index)
+    manifest_path = os.path.join(samples_dir, "samples.json")
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    manifest[str(index)] = path
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+def schedule_sample_stop(insts, at_start=False):
+    # Simulator.schedule_max_insts arms every core, and each core raises
+    # its own MAX_INSTS exit, which would end an interval once per core.
+    # Only the first core counts.
+    processor.get_cores()[0]._set_inst_stop_any_thread(insts, at_start)
+
+def first_core_insts():
+    return processor.get_cores()[0].core.getCurrentInstCount(0)
+
+# Instructions of the first core when sampling started.
+sample_start_insts = 0
+
+def start_sampling(at_start=False):
+    global sample_start_insts
+    os.makedirs(samples_dir, exist_ok=True)
+    save_sample_checkpoint(0)
+    sample_start_insts = 0 if at_start else first_core_insts()
+    schedule_sample_stop(args.sample_interval, at_start)
+
+def handle_max_insts():
+    global sample_index
+    if args.sample_restore:
+        if args.sample_warmup:
+            print("Warm-up done, resetting stats for the sample")
+            m5.stats.reset()
+            schedule_sample_stop(args.sample_length)
+            yield False
+        print("Dump stats at the end of the sample!")
+        m5.stats.dump()
+        yield True
+    while True:
+        m5.stats.dump()
+        m5.stats.reset()
+        sample_index += 1
+        save_sample_checkpoint(sample_index)
+        schedule_sample_stop(args.sample_interval)
+        yield False
+
 # Handle different exit events during the simulation
 def handle_workbegin():
     print("Done booting Linux")
+    if save_checkpoint:
+        staging = checkpoint_store.staging_path(ckpt_key)
+        print(f"Saving post-boot checkpoint to {staging}")
+        simulator.save_checkpoint(staging)
+        checkpoint_store.commit(
+            ckpt_key, staging, checkpoint_fields, tick=m5.curTick()
+        )
+    if switch_at_roi:
+        print(f"Switching to {args.cpu_type} CPU for the ROI")
+        processor.switch()
+    start_phase(f"roi ({args.cpu_type})")
+    if args.capture_trace:
+        trace_manifest["roi_begin"] = m5.curTick()
+        mem_trace.write_manifest(m5.options.outdir, trace_manifest)
+    record_coherence(True)
     print("Resetting stats at the start of ROI!")
     m5.stats.reset()
+    if args.sample_interval:
+        start_sampling()
     yield False
 
 def handle_workend():
     print("Dump stats at the end of the ROI!")
     m5.stats.dump()
+    if args.capture_trace:
+        trace_manifest["roi_end"] = m5.curTick()
+        mem_trace.write_manifest(m5.options.outdir, trace_manifest)
+    record_coherence(False)
+    if args.sample_interval:
+        # gem5 may append a final dump at exit; only these are intervals.
+        roi_insts = first_core_insts() - sample_start_insts
+        expected = roi_insts // args.sample_interval + 1
+        if abs(sample_index + 1 - expected) > 1:
+            print(
+                f"Warning: {sample_index + 1} intervals for {roi_insts} "
+                f"instructions, expected {expected}"
+            )
+        with open(os.path.join(m5.options.outdir, "profile.json"), "w") as f:
+            json.dump(
+                {
+                    "num_intervals": sample_index + 1,
+                    "roi_insts": roi_insts,
+                    "expected_intervals": expected,
+                },
+                f,
+            )
+    if switch_after_roi:
+        print("Switching back to the fast CPU after the ROI")
+        processor.switch()
+        start_phase(f"post-roi ({args.fast_forward})")
+        yield False
     yield True
 
 simulator = Simulator(
     board=board,
+    checkpoint_path=checkpoint,
     on_exit_event={
         ExitEvent.WORKBEGIN: handle_workbegin(),
         ExitEvent.WORKEND: handle_workend(),
+        ExitEvent.MAX_INSTS: handle_max_insts(),
     },
 )
 
 # Start the simulation and track the wall clock time
 globalStart = time.time()
 
-print("Running the simulation with O3 CPU")
+if checkpoint:
+    # The ROI began when the checkpoint was taken.
+    roi_start = checkpoint_tick(checkpoint)
+    start_phase(f"roi ({args.cpu_type})", tick=roi_start)
+    if args.capture_trace:
+        trace_manifest["roi_begin"] = roi_start
+        mem_trace.write_manifest(m5.options.outdir, trace_manifest)
+    record_coherence(True)
+    if args.sample_restore:
+        schedule_sample_stop(
+            args.sample_warmup or args.sample_length, at_start=True
+        )
+    elif args.sample_interval:
+        start_sampling(at_start=True)
+elif switch_at_roi:
+    print(f"Fast-forwarding the boot with {fast_cpu_type.name} CPU")
+    start_phase(f"boot ({fast_cpu_type.name.lower()})", tick=0)
+else:
+    print(f"Running the simulation with {args.cpu_type} CPU")
+    start_phase(f"boot ({args.cpu_type})", tick=0)
 m5.stats.reset()
 
+# gem5 registers its final stats dump at exit when the simulation starts,
+# and exit handlers run in reverse order, so this one runs after it.
+simulation_completed = False
+
+def store_result():
+    if simulation_completed:
+        result_cache.store(result_key, m5.options.outdir, result_config)
+
+if args.result_cache:
+    atexit.register(store_result)
+
 simulator.run()
+simulation_completed = True
+phaseEnd = (time.time(), simulator.get_current_tick())
 
 print("All simulation events were successful.")
 print("Done with the simulation")
 print("Performance statistics:")
-print("Simulated time in ROI: " + str(simulator.get_roi_ticks()[0]))
+if checkpoint:
+    print("Simulated time in ROI: " + str(simulator.get_current_tick() - roi_start))
+else:
+    print("Simulated time in ROI: " + str(simulator.get_roi_ticks()[0]))
 print("Ran a total of", simulator.get_current_tick() / 1e12, "simulated seconds")
+print("Wallclock time per phase:")
+for i, (name, wall, tick) in enumerate(phases):
+    endWall, endTick = phases[i + 1][1:] if i + 1 < len(phases) else phaseEnd
+    print("  %-16s %10.2fs %16d ticks" % (name, endWall - wall, endTick - tick))
 print("Total wallclock time: %.2fs, %.2f min" % (time.time() - globalStart, (time.time() - globalStart) / 60))
@@ -0,0 +1,611 @@
+"""
+Trace-driven simulator of the MESI Two Level and MESI Three Level cache
+hierarchies used by the x86 PARSEC scripts, for exploring cache sizes
+without a gem5 run.
+
+The hierarchies take the same parameters as the run scripts:
+
+- ``mesi2``: private L1D/L1I per core, a shared L2 of ``num_l2_banks``
+  banks of ``l2_size`` each (as in MESITwoLevelCacheHierarchy).
+- ``mesi3``: private L1D/L1I and L2 per core, a shared L3 of
+  ``num_l3_banks`` banks of ``l3_size`` each.
+
+A ``mesi3`` hierarchy can be split into ``chiplets`` chiplets of
+consecutive cores, each with ``num_l3_banks`` L3 banks, under one of the
+L3 placement policies (``L3_POLICIES``) of the multi-chiplet system:
+
+- ``interleaved``: the banks of all chiplets form one L3, and line ``l``
+  lives in bank ``l mod banks``, on chiplet ``bank // num_l3_banks``.
+- ``local``: each chiplet's banks are a private L3 of its cores, kept
+  coherent like the private levels.
+- ``first-touch``: one L3 whose pages live on the chiplet of the core
+  that first misses on them in its L2 (page-coloring NUCA).
+
+L3 accesses are counted as local or remote to the requesting core's
+chiplet; remote ones cross the inter-chiplet network.
+
+Caches are set associative with LRU replacement. Private data caches keep
+MESI states: a store invalidates the line in the other cores' caches, a
+load miss downgrades an E/M copy elsewhere to S, and a store to an S line
+is an upgrade miss. Levels are simulated as filters: each level sees the
+demand misses of the level above in trace order. Back-invalidations
+caused by inclusion are not modelled.
+
+Vectorization: a chunk of the trace is split into independent sequences,
+one per set of each private copy, or one per set across all copies when
+the set holds a line used by several cores, so coherence stays in order.
+Round ``k`` replays the k-th access of every sequence at once. Re-accesses
+that LRU guarantees to hit (fewer than ``assoc`` accesses to the row since
+the previous one to the line, and no other core in between) are counted
+without a round. Throughput depends on how evenly the trace spreads over
+sets; sets shared by all cores' stacks are the usual limit.
+
+Traces are arrays of (core, address, type) with type 0 = load,
+1 = store, 2 = instruction fetch, streamed from ``.g5mt`` captures (see
+``mem_trace.py``) or read from ``.npz`` files (arrays ``core``,
+``address``, ``type``) or text files of ``core type address`` lines
+(type R, W or I; address in hex):
+
+```
+python3 Tools/cache_sim.py trace.npz --hierarchy mesi2 --num-cores 4 \
+    --l2-size 512KiB --reference m5out/stats.txt
+```
+
+With ``--reference`` the demand hit rates of the matching Ruby caches in a
+gem5 stats.txt are printed next to the simulated ones.
+
+Requires NumPy.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+import mem_trace
+import stats_parser
+
+LOAD, STORE, IFETCH = 0, 1, 2
+INVALID, SHARED, EXCLUSIVE, MODIFIED = 0, 1, 2, 3
+
+# Ruby caches matching each simulated level, per hierarchy.
+RUBY_PATTERNS = {
+    "mesi2": {
+        "l1d": "*.l1_controllers*.L1Dcache.m_demand_{}",
+        "l1i": "*.l1_controllers*.L1Icache.m_demand_{}",
+        "l2": "*.l2_controllers*.L2cache.m_demand_{}",
+    },
+    "mesi3": {
+        "l1d": "*.core_clusters*.l1_cache.Dcache.m_demand_{}",
+        "l1i": "*.core_clusters*.l1_cache.Icache.m_demand_{}",
+        "l2": "*.core_clusters*.l2_cache.cache.m_demand_{}",
+    },
+}
+
+L3_POLICIES = ("interleaved", "local", "first-touch")
+
+SIZE_UNITS = {"": 1, "b": 1, "k": 1024, "m": 1024**2, "g": 1024**3}
+
+
+def parse_size(size):
+    """Bytes in a gem5 size string ("32KiB", "256kB", "4MB")."""
+    if isinstance(size, int):
+        return size
+    match = re.fullmatch(r"\s*(\d+)\s*([kKmMgG]?)(i?B)?\s*", size)
+    if not match:
+        raise ValueError(f"invalid size {size!r}")
+    return int(match.group(1)) * SIZE_UNITS[match.group(2).lower()]
+
+
+class Cache:
+    """
+    One cache level: ``copies`` private caches (one per core), or a single
+    shared one, of ``size`` bytes each.
+
+    Tags, MESI states and LRU stamps are ``(copies * sets, assoc)`` arrays;
+    row ``copy * sets + set`` is one set of one copy.
+    """
+
+    def __init__(self, name, size, assoc, copies=1, coherent=False,
+                 banks=1, line_size=64):
+        self.name = name
+        self.assoc = assoc
+        self.copies = copies
+        self.coherent = coherent and copies > 1
+        self.banks = banks
+        self.num_sets = parse_size(size) // (assoc * line_size)
+        if self.num_sets < 1:
+            raise ValueError(f"{name}: smaller than one set")
+        shape = (copies * self.num_sets, assoc)
+        self.tags = np.full(shape, -1, dtype=np.int64)
+        self.state = np.zeros(shape, dtype=np.int8)
+        self.stamp = np.zeros(shape, dtype=np.int64)
+        # Trace position of the next access; stamps order LRU.
+        self.position = 1
+        self.hits = np.zeros(copies, dtype=np.int64)
+        self.misses = np.zeros(copies, dtype=np.int64)
+        self.bank_accesses = np.zeros(banks, dtype=np.int64)
+        self.writebacks = 0
+        self.invalidations = 0
+        self.downgrades = 0
+
+    def _shared_lines(self, copy, line, set_idx, tag):
+        """
+        Per access: whether its line is used by more than one copy, either
+        accessed by several copies in this chunk or held by another copy.
+        """
+        lines, inverse = np.unique(line, return_inverse=True)
+        holders = np.zeros((self.copies, lines.size), dtype=bool)
+        holders[copy, inverse] = True
+        line_sets, line_tags = lines % self.num_sets, lines // self.num_sets
+        for c in range(self.copies):
+            rows = c * self.num_sets + line_sets
+            holders[c] |= (
+                (self.tags[rows] == line_tags[:, None])
+                & (self.state[rows] != INVALID)
+            ).any(axis=1)
+        return (holders.sum(axis=0) > 1)[inverse]
+
+    def access(self, copy, line, write):
+        """Replay a chunk of accesses; returns the demand hit mask."""
+        n = line.size
+        hit = np.zeros(n, dtype=bool)
+        if n == 0:
+            return hit
+        set_idx = line % self.num_sets
+        tag = line // self.num_sets
+        row = copy * self.num_sets + set_idx
+
+        # Accesses that never meet in the same set can be replayed side by
+        # side. A set holding a line shared between copies is replayed as
+        # one sequence across all copies, so coherence stays ordered;
+        # every other set is independent in each copy.
+        shared = np.zeros(n, dtype=bool)
+        group = row
+        if self.coherent:
+            shared = self._shared_lines(copy, line, set_idx, tag)
+            coupled = np.zeros(self.num_sets, dtype=bool)
+            coupled[set_idx[shared]] = True
+            group = np.where(
+                coupled[set_idx], set_idx, self.num_sets + row
+            )
+
+        # Sequence order: by group, then trace order.
+        order = np.argsort(group, kind="stable")
+        sorted_group = group[order]
+        starts = np.ones(n, dtype=bool)
+        starts[1:] = sorted_group[1:] != sorted_group[:-1]
+        seq = np.empty(n, dtype=np.int64)
+        seq[order] = np.arange(n)
+
+        # Previous access to the same line in the same sequence.
+        by_line = np.lexsort((seq, line, group))
+        same = np.zeros(n, dtype=bool)
+        same[1:] = (group[by_line][1:] == group[by_line][:-1]) & (
+            line[by_line][1:] == line[by_line][:-1]
+        )
+        prev = np.full(n, -1, dtype=np.int64)
+        prev[by_line[1:][same[1:]]] = by_line[:-1][same[1:]]
+        has_prev = prev >= 0
+        prev_safe = np.where(has_prev, prev, 0)
+
+        # Position of each access among the accesses to its row; other
+        # copies never fill this row, they can only free ways in it.
+        row_seq = np.empty(n, dtype=np.int64)
+        row_seq[np.lexsort((seq, row))] = np.arange(n)
+
+        # An access is a hit that changes no state when the previous access
+        # to its line in the sequence came from the same copy less than
+        # ``assoc`` accesses to that row earlier (so no LRU eviction can
+        # have removed it, and no other copy touched the line), unless it
+        # is a store after a load, which may be an upgrade.
+        redundant = (
+            has_prev
+            & (row[prev_safe] == row)
+            & (row_seq - row_seq[prev_safe] <= self.assoc)
+            & (~write | write[prev_safe])
+        )
+        hit[redundant] = True
+
+        # A skipped hit still makes its line the most recent one: the
+        # last replayed access of each chain stamps the line with the
+        # latest position of the chain.
+        position = self.position + np.arange(n)
+        self.position += n
+        in_chain = ~same | ~redundant[by_line]
+        root = by_line[
+            np.maximum.accumulate(np.where(in_chain, np.arange(n), 0))
+        ]
+        stamp = position.copy()
+        np.maximum.at(stamp, root, position[by_line])
+
+        keep = ~redundant[order]
+        order = order[keep]
+        starts = starts[keep]
+
+        # Round k replays the k-th remaining access of every sequence.
+        m = order.size
+        if m:
+            first = np.maximum.accumulate(np.where(starts, np.arange(m), 0))
+            rank = np.arange(m) - first
+            by_rank = order[np.argsort(rank, kind="stable")]
+            bounds = np.searchsorted(
+                np.sort(rank), np.arange(rank.max() + 2), side="left"
+            )
+            for lo, hi in zip(bounds[:-1], bounds[1:]):
+                lanes = by_rank[lo:hi]
+                hit[lanes] = self._round(
+                    row[lanes],
+                    tag[lanes],
+                    write[lanes],
+                    shared[lanes],
+                    stamp[lanes],
+                )
+
+        self.hits += np.bincount(copy[hit], minlength=self.copies)
+        self.misses += np.bincount(copy[~hit], minlength=self.copies)
+        self.bank_accesses += np.bincount(
+            line % self.banks, minlength=self.banks
+        )
+        return hit
+
+    def _round(self, row, t, w, shared_line, stamp):
+        """One access per lane; lanes never touch the same row."""
+        lanes = np.arange(row.size)
+        tags = self.tags[row]
+        state = self.state[row]
+        valid = state != INVALID
+        match = (tags == t[:, None]) & valid
+        present = match.any(axis=1)
+        # Prefer an invalid way, then the least recently used one.
+        victim = np.argmin(np.where(valid, self.stamp[row], -1), axis=1)
+        way = np.where(present, match.argmax(axis=1), victim)
+        current = state[lanes, way]
+        hit = present & ~(w & (current == SHARED))
+        self.writebacks += int(
+            np.count_nonzero(~present & (current == MODIFIED))
+        )
+
+        shared = np.zeros(row.size, dtype=bool)
+        if shared_line.any():
+            sub = np.flatnonzero(shared_line)
+            set_idx = row[sub] % self.num_sets
+            own = row[sub] // self.num_sets
+            rows = (
+                np.arange(self.copies)[:, None] * self.num_sets
+                + set_idx[None, :]
+            )
+            others_state = self.state[rows]
+            other = (self.tags[rows] == t[sub][None, :, None]) & (
+                others_state != INVALID
+            )
+            other[own, np.arange(sub.size)] = False
+            sub_w = w[sub][None, :, None]
+            invalidate = other & sub_w
+            downgrade = (
+                other
+                & ~sub_w
+                & ~present[sub][None, :, None]
+                & (others_state >= EXCLUSIVE)
+            )
+            self.invalidations += int(np.count_nonzero(invalidate))
+            self.downgrades += int(np.count_nonzero(downgrade))
+            others_state[invalidate] = INVALID
+            others_state[downgrade] = SHARED
+            self.state[rows] = others_state
+            shared[sub] = (other & ~invalidate).any(axis=(0, 2))
+
+        new_state = np.where(
+            w,
+            MODIFIED,
+            np.where(present, current, np.where(shared, SHARED, EXCLUSIVE)),
+        )
+        self.tags[row, way] = t
+        self.state[row, way] = new_state
+        self.stamp[row, way] = stamp
+        return hit
+
+    def summary(self):
+        hits, misses = int(self.hits.sum()), int(self.misses.sum())
+        accesses = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / accesses if accesses else None,
+            "per_copy_hits": self.hits.tolist(),
+            "per_copy_misses": self.misses.tolist(),
+            "bank_accesses": self.bank_accesses.tolist(),
+            "writebacks": self.writebacks,
+            "invalidations": self.invalidations,
+            "downgrades": self.downgrades,
+        }
+
+
+class Hierarchy:
+    """The private and shared levels of a mesi2 or mesi3 hierarchy."""
+
+    def __init__(self, hierarchy, num_cores, l1d_size="32KiB", l1d_assoc=8,
+                 l1i_size="32KiB", l1i_assoc=8, l2_size="256KiB",
+                 l2_assoc=16, num_l2_banks=1, l3_size="4MiB", l3_assoc=16,
+                 num_l3_banks=1, line_size=64, chiplets=1,
+                 l3_policy="interleaved", page_size=4096):
+        self.hierarchy = hierarchy
+        self.line_bits = int(np.log2(line_size))
+        self.l1d = Cache("l1d", l1d_size, l1d_assoc, num_cores, True,
+                         line_size=line_size)
+        self.l1i = Cache("l1i", l1i_size, l1i_assoc, num_cores,
+                         line_size=line_size)
+        if hierarchy == "mesi2":
+            self.outer = [
+                Cache("l2", parse_size(l2_size) * num_l2_banks, l2_assoc,
+                      banks=num_l2_banks, line_size=line_size)
+            ]
+        elif hierarchy == "mesi3":
+            if num_cores % chiplets:
+                raise ValueError("cores do not split evenly into chiplets")
+            if l3_policy not in L3_POLICIES:
+                raise ValueError(f"unknown L3 policy {l3_policy!r}")
+            self.cores_per_chiplet = num_cores // chiplets
+            self.l3_banks = num_l3_banks
+            self.l3_policy = l3_policy
+            self.page_bits = int(np.log2(page_size)) - self.line_bits
+            l3_bytes = parse_size(l3_size) * num_l3_banks
+            if l3_policy == "local":
+                l3 = Cache("l3", l3_bytes, l3_assoc, chiplets, True,
+                           banks=num_l3_banks, line_size=line_size)
+            else:
+                l3 = Cache("l3", l3_bytes * chiplets, l3_assoc,
+                           banks=num_l3_banks * chiplets,
+                           line_size=line_size)
+            self.outer = [
+                Cache("l2", l2_size, l2_assoc, num_cores, True,
+                      line_size=line_size),
+                l3,
+            ]
+            # First-touch owner chiplet of every page seen, sorted by page.
+            self.pages = np.zeros(0, dtype=np.int64)
+            self.owners = np.zeros(0, dtype=np.int64)
+            self.l3_local = np.zeros(2, dtype=np.int64)  # misses, hits
+            self.l3_remote = np.zeros(2, dtype=np.int64)
+        else:
+            raise ValueError(f"unknown hierarchy {hierarchy!r}")
+        self.accesses = 0
+
+    @property
+    def levels(self):
+        return [self.l1d, self.l1i] + self.outer
+
+    def feed(self, core, address, kind):
+        """Replay one chunk of the trace."""
+        core = np.asarray(core, dtype=np.int64)
+        line = np.asarray(address, dtype=np.int64) >> self.line_bits
+        kind = np.asarray(kind)
+        write = kind == STORE
+        self.accesses += line.size
+
+        fetch = kind == IFETCH
+        miss = np.empty(line.size, dtype=bool)
+        miss[~fetch] = ~self.l1d.access(
+            core[~fetch], line[~fetch], write[~fetch]
+        )
+        miss[fetch] = ~self.l1i.access(
+            core[fetch], line[fetch], write[fetch]
+        )
+        # Every outer level sees the misses of the level above, in order.
+        for cache in self.outer:
+            core, line, write = core[miss], line[miss], write[miss]
+            if cache.name == "l3":
+                chiplet = core // self.cores_per_chiplet
+                copy = chiplet if cache.copies > 1 else np.zeros_like(core)
+            else:
+                copy = core if cache.copies > 1 else np.zeros_like(core)
+            miss = ~cache.access(copy, line, write)
+            if cache.name == "l3":
+                local = self._l3_home(chiplet, line) == chiplet
+                self.l3_local += np.bincount(~miss[local], minlength=2)
+                self.l3_remote += np.bincount(~miss[~local], minlength=2)
+
+    def _l3_home(self, chiplet, line):
+        """Chiplet holding the L3 bank of each access."""
+        if self.l3_policy == "local":
+            return chiplet
+        if self.l3_policy == "interleaved":
+            return (line % self.outer[-1].banks) // self.l3_banks
+        page = line >> self.page_bits
+        # Pages first seen in this chunk go to the chiplet of their first
+        # access; np.unique returns the first index of each page.
+        pages, first = np.unique(page, return_index=True)
+        new = ~np.isin(pages, self.pages, assume_unique=True)
+        self.pages = np.concatenate([self.pages, pages[new]])
+        self.owners = np.concatenate([self.owners, chiplet[first[new]]])
+        order = np.argsort(self.pages, kind="stable")
+        self.pages, self.owners = self.pages[order], self.owners[order]
+        return self.owners[np.searchsorted(self.pages, page)]
+
+    def summary(self):
+        summary = {cache.name: cache.summary() for cache in self.levels}
+        if self.hierarchy == "mesi3":
+            summary["l3"].update(
+                policy=self.l3_policy,
+                local_hits=int(self.l3_local[1]),
+                local_misses=int(self.l3_local[0]),
+                remote_hits=int(self.l3_remote[1]),
+                remote_misses=int(self.l3_remote[0]),
+            )
+        return summary
+
+
+def load_trace(path):
+    """``(core, address, type)`` arrays of a .npz or text trace."""
+    if path.endswith(".npz"):
+        with np.load(path) as trace:
+            return trace["core"], trace["address"], trace["type"]
+    types = {"R": LOAD, "W": STORE, "I": IFETCH}
+    core, address, kind = [], [], []
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 3 or fields[0].startswith("#"):
+                continue
+            core.append(int(fields[0]))
+            kind.append(types[fields[1].upper()])
+            address.append(int(fields[2], 16))
+    return (
+        np.array(core, dtype=np.int64),
+        np.array(address, dtype=np.int64),
+        np.array(kind, dtype=np.int8),
+    )
+
+
+def open_trace(path, chunk=1 << 20):
+    """
+    Core count and a ``(core, address, type)`` chunk iterator of a trace.
+    ``.g5mt`` traces (see mem_trace.py) are streamed; the others are read
+    whole.
+    """
+    if path.endswith(".g5mt"):
+        num_cores = mem_trace.TraceReader(path).meta.get("num_cores")
+        return num_cores, mem_trace.iter_arrays(path, chunk)
+    core, address, kind = load_trace(path)
+
+    def chunks():
+        for first in range(0, core.size, chunk):
+            part = slice(first, first + chunk)
+            yield core[part], address[part], kind[part]
+
+    return int(core.max(initial=0)) + 1, chunks()
+
+
+def ruby_hit_rates(stats_path, hierarchy):
+    """Demand hit rate of every level in the first dump of a stats.txt."""
+    store = stats_parser.open_store(stats_path)
+    rates = {}
+    for level, pattern in RUBY_PATTERNS[hierarchy].items():
+        hits = sum(store.query(0, pattern.format("hits")).values())
+        misses = sum(store.query(0, pattern.format("misses")).values())
+        if hits + misses:
+            rates[level] = hits / (hits + misses)
+    return rates
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replay a memory trace through a MESI cache hierarchy."
+    )
+    parser.add_argument("trace", type=str)
+    parser.add_argument(
+        "--hierarchy", type=str, default="mesi2", choices=["mesi2", "mesi3"]
+    )
+    parser.add_argument("--num-cores", type=int, default=None)
+    parser.add_argument("--l1d-size", type=str, default="32KiB")
+    parser.add_argument("--l1d-assoc", type=int, default=8)
+    parser.add_argument("--l1i-size", type=str, default="32KiB")
+    parser.add_argument("--l1i-assoc", type=int, default=8)
+    parser.add_argument("--l2-size", type=str, default="256KiB")
+    parser.add_argument("--l2-assoc", type=int, default=16)
+    parser.add_argument("--num-l2-banks", type=int, default=2)
+    parser.add_argument("--l3-size", type=str, default="4MiB")
+    parser.add_argument("--l3-assoc", type=int, default=16)
+    parser.add_argument("--num-l3-banks", type=int, default=1)
+    parser.add_argument("--line-size", type=int, default=64)
+    parser.add_argument(
+        "--chiplets",
+        type=int,
+        default=1,
+        help="mesi3: chiplets of consecutive cores, each with "
+        "--num-l3-banks L3 banks.",
+    )
+    parser.add_argument(
+        "--l3-policy", type=str, default="interleaved", choices=L3_POLICIES
+    )
+    parser.add_argument("--page-size", type=int, default=4096)
+    parser.add_argument(
+        "--chunk",
+        type=int,
+        default=1 << 20,
+        help="Accesses replayed per chunk.",
+    )
+    parser.add_argument(
+        "--reference",
+        type=str,
+        default=None,
+        help="gem5 stats.txt whose Ruby hit rates are shown alongside.",
+    )
+    parser.add_argument(
+        "--json", type=str, default=None, help="Write the summary here."
+    )
+    args = parser.parse_args(argv)
+
+    trace_cores, chunks = open_trace(args.trace, args.chunk)
+    num_cores = args.num_cores or trace_cores
+    hierarchy = Hierarchy(
+        args.hierarchy,
+        num_cores,
+        l1d_size=args.l1d_size,
+        l1d_assoc=args.l1d_assoc,
+        l1i_size=args.l1i_size,
+        l1i_assoc=args.l1i_assoc,
+        l2_size=args.l2_size,
+        l2_assoc=args.l2_assoc,
+        num_l2_banks=args.num_l2_banks,
+        l3_size=args.l3_size,
+        l3_assoc=args.l3_assoc,
+        num_l3_banks=args.num_l3_banks,
+        line_size=args.line_size,
+        chiplets=args.chiplets,
+        l3_policy=args.l3_policy,
+        page_size=args.page_size,
+    )
+    start = time.time()
+    for core, address, kind in chunks:
+        hierarchy.feed(core, address, kind)
+    elapsed = time.time() - start
+
+    summary = hierarchy.summary()
+    reference = {}
+    if args.reference:
+        reference = ruby_hit_rates(args.reference, args.hierarchy)
+    for level, stats in summary.items():
+        rate = stats["hit_rate"]
+        line = (
+            f"{level:4s} hits {stats['hits']:>12d}  "
+            f"misses {stats['misses']:>12d}  hit rate "
+            + (f"{rate:.4f}" if rate is not None else "   -  ")
+        )
+        if level in reference:
+            line += f"   ruby {reference[level]:.4f}"
+        print(line)
+    if args.hierarchy == "mesi3" and args.chiplets > 1:
+        l3 = summary["l3"]
+        remote = l3["remote_hits"] + l3["remote_misses"]
+        accesses = l3["hits"] + l3["misses"]
+        print(
+            f"l3 {args.l3_policy}: local hits {l3['local_hits']}, "
+            f"remote hits {l3['remote_hits']}, remote accesses "
+            f"{remote} ({remote / max(accesses, 1):.1%})"
+        )
+    print(
+        f"{hierarchy.accesses} accesses in {elapsed:.2f}s "
+        f"({hierarchy.accesses / max(elapsed, 1e-9) / 1e6:.2f} M/s)"
+    )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "trace": os.path.abspath(args.trace),
+                    "config": vars(args),
+                    "levels": summary,
+                    "reference": reference,
+                },
+                f,
+                indent=2,
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
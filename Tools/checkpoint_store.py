@@ -0,0 +1,166 @@
+"""
+Shared store of post-boot (WORKBEGIN) gem5 checkpoints.
+
+Booting Linux dominates the wall-clock of the PARSEC full-system runs, yet
+the booted state only depends on the kernel, disk image, ISA, core count,
+memory size and the workload command that was started. Checkpoints are
+therefore keyed by exactly those fields and shared across every cache
+hierarchy variant, so a sweep boots each configuration once.
+
+Layout of a store directory:
+
+- ``<key>/``        a complete checkpoint (gem5's m5.cpt and memory
+                    images) plus ``meta.json`` describing the key.
+- ``<key>.lock``    lock file held by the single process allowed to
+                    write ``<key>``. Other processes simply boot normally
+                    instead of waiting.
+- ``<key>.tmp*/``   checkpoint being written; renamed to ``<key>`` only
+                    once complete, so readers never see partial data.
+
+The store is plain Python and is used both from gem5 run scripts and from
+the command line:
+
+```
+python3 Tools/checkpoint_store.py --store ckpt list
+python3 Tools/checkpoint_store.py --store ckpt invalidate <key>
+python3 Tools/checkpoint_store.py --store ckpt invalidate --all
+```
+"""
+
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+
+def write_meta(checkpoint_path, tick=None, **fields):
+    """Describe a checkpoint directory; ``tick`` is where it was taken."""
+    with open(os.path.join(checkpoint_path, "meta.json"), "w") as meta:
+        json.dump(
+            {"created": time.time(), "tick": tick, "fields": fields},
+            meta,
+            indent=2,
+            default=str,
+        )
+
+
+def checkpoint_tick(checkpoint_path):
+    """Tick a checkpoint described by `write_meta()` was taken at."""
+    with open(os.path.join(checkpoint_path, "meta.json")) as meta:
+        return json.load(meta)["tick"]
+
+
+def checkpoint_key(**fields):
+    """Stable short hash of the fields that determine the booted state."""
+    encoded = json.dumps(fields, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()[:16]
+
+
+class CheckpointStore:
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+        self._lock_files = {}
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def lookup(self, key):
+        """Path of the complete checkpoint for ``key``, or None."""
+        path = self.path(key)
+        if os.path.exists(os.path.join(path, "meta.json")):
+            return path
+        return None
+
+    def try_lock(self, key):
+        """
+        Try to become the writer of ``key`` without blocking.
+
+        The lock is an flock() on ``<key>.lock`` and is released by
+        `release()` or when the process exits, so a crashed writer never
+        blocks later runs.
+        """
+        lock_file = open(os.path.join(self.root, key + ".lock"), "w")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_files[key] = lock_file
+        return True
+
+    def release(self, key):
+        lock_file = self._lock_files.pop(key, None)
+        if lock_file is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def staging_path(self, key):
+        """Directory the writer should save the checkpoint into."""
+        path = f"{self.path(key)}.tmp{os.getpid()}"
+        shutil.rmtree(path, ignore_errors=True)
+        return path
+
+    def meta(self, key):
+        with open(os.path.join(self.path(key), "meta.json")) as meta:
+            return json.load(meta)
+
+    def commit(self, key, staging_path, fields, tick=None):
+        """
+        Publish a checkpoint written to ``staging_path``. ``tick`` is the
+        simulated tick the checkpoint was taken at.
+        """
+        write_meta(staging_path, tick, **fields)
+        shutil.rmtree(self.path(key), ignore_errors=True)
+        os.rename(staging_path, self.path(key))
+        self.release(key)
+
+    def invalidate(self, key):
+        """Remove the checkpoint for ``key``; waits for an active writer."""
+        with open(os.path.join(self.root, key + ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            shutil.rmtree(self.path(key), ignore_errors=True)
+
+    def entries(self):
+        """``(key, meta)`` for every complete checkpoint in the store."""
+        for name in sorted(os.listdir(self.root)):
+            meta_path = os.path.join(self.root, name, "meta.json")
+            if os.path.exists(meta_path):
+                with open(meta_path) as meta:
+                    yield name, json.load(meta)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Inspect or invalidate the post-boot checkpoint store."
+    )
+    parser.add_argument("--store", type=str, required=True)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="List complete checkpoints.")
+    invalidate = subparsers.add_parser(
+        "invalidate", help="Delete checkpoints."
+    )
+    invalidate.add_argument("keys", nargs="*")
+    invalidate.add_argument("--all", action="store_true")
+    args = parser.parse_args()
+
+    store = CheckpointStore(args.store)
+    if args.command == "list":
+        for key, meta in store.entries():
+            fields = " ".join(f"{k}={v}" for k, v in meta["fields"].items())
+            print(f"{key}  {fields}")
+        return 0
+
+    keys = [key for key, _ in store.entries()] if args.all else args.keys
+    for key in keys:
+        store.invalidate(key)
+        print(f"Invalidated {key}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,317 @@
+"""
+Traces of the coherence messages of Ruby runs, for trace-driven Garnet
+traffic.
+
+Recording: ``--record-coherence`` on the x86 PARSEC scripts (for the ROI)
+and on multi_core_multi_chiplet.py (for the whole run) turns on gem5's
+RubyQueue debug flag, which logs every Ruby MessageBuffer enqueue to
+``coherence.log`` in the outdir. Debug output needs a
+``gem5.opt`` or ``gem5.debug`` binary, and the log is large: expect a few
+hundred bytes per message.
+
+Conversion keeps the enqueues into the network, i.e. the messages the
+controllers send each other, using the outdir's ``config.ini`` to tell
+those buffers apart and to name their controllers. Every message becomes
+one record per destination controller:
+
+- ``tick``: when the message was sent,
+- ``source``, ``destination``: controllers as ``<machine>:<version>``,
+  e.g. ``L1Cache:3`` or ``Directory:0``,
+- ``vnet``: the garnet_synth_traffic.py virtual network of its kind,
+  2 for data, 0 for requests, 1 for other control messages,
+- ``bytes``: the message size, control or control plus a cache block.
+
+The records are written as a gzipped CSV behind a ``#`` line with the
+metadata in JSON:
+
+```
+python3 Tools/coherence_trace.py convert m5out --out bodytrack.csv.gz
+python3 Tools/coherence_trace.py flows bodytrack.csv.gz --num-nodes 16
+```
+
+Replay: ``garnet_synth_traffic.py --trace bodytrack.csv.gz`` maps every
+controller onto node ``version % --num-cpus`` (destinations onto
+``version % --num-dirs``), and injects each (source, destination, vnet)
+flow of the trace from one tester at the flow's average rate, scaled by
+``--time-scale``. The replay keeps the spatial distribution, message mix
+and load of the recorded traffic, not its burstiness: Garnet's testers
+inject at a fixed rate.
+
+This module is plain Python, so that the gem5 scripts can import it.
+"""
+
+import argparse
+import collections
+import csv
+import gzip
+import json
+import os
+import re
+import sys
+
+FIELDS = ["tick", "source", "destination", "vnet", "bytes"]
+
+LOG_FILE = "coherence.log"
+
+# Debug flag of the MessageBuffer enqueue messages.
+DEBUG_FLAG = "RubyQueue"
+
+# Machine types in the order SLICC numbers them for the MESI protocols;
+# a protocol's NetDest has one group per machine type, the last ones of
+# this list.
+MACHINE_ORDER = ["L0Cache", "L1Cache", "L2Cache", "Directory", "DMA"]
+
+# Bytes of a control message; data messages carry a cache block as well.
+CONTROL_BYTES = 8
+
+ENQUEUE = re.compile(
+    r"^\s*(\d+): (\S+): Enqueue arrival_time: \d+, Message: (.*)$"
+)
+DESTINATION = re.compile(r"Destination = \[NetDest \(\d+\) (.*?)\]")
+MESSAGE_SIZE = re.compile(r"MessageSize = (\w+)")
+
+
+def read_config(path):
+    """Sections of a gem5 config.ini, as dicts of their keys."""
+    sections = {}
+    section = None
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("[") and line.endswith("]"):
+                section = sections.setdefault(line[1:-1], {})
+            elif section is not None and "=" in line:
+                key, _, value = line.partition("=")
+                section[key] = value
+    return sections
+
+
+class Network:
+    """Controllers and network buffers of a run, from its config.ini."""
+
+    def __init__(self, config):
+        # Controller path -> "<machine>:<version>".
+        self.controllers = {}
+        self.block_bytes = 64
+        clocks = {}
+        for name, section in config.items():
+            kind = section.get("type", "")
+            if kind.endswith("_Controller") and "version" in section:
+                machine = kind[: -len("_Controller")]
+                self.controllers[name] = f"{machine}:{section['version']}"
+            elif kind == "RubySystem":
+                self.block_bytes = int(section.get("block_size_bytes", 64))
+            elif kind == "SrcClockDomain":
+                clocks[name] = int(section["clock"].split()[0])
+        # Ruby's own clock domain if it has one, else the system's.
+        ruby = [name for name in clocks if "ruby" in name]
+        top = [name for name in clocks if name.count(".") == 1]
+        self.cycle_ticks = next(
+            (clocks[name] for name in ruby + top), None
+        )
+        # Buffers the controllers send into the network through, and the
+        # ones the network delivers into.
+        self.buffers = self._network_buffers(config, "out_port", "in_port")
+        self.inputs = self._network_buffers(config, "in_port", "out_port")
+
+    def _network_buffers(self, config, port, network_port):
+        """Buffer -> controller of the buffers whose ``port`` is wired
+        to the network's ``network_port``."""
+        return {
+            name: self.controllers[name.rsplit(".", 1)[0]]
+            for name, section in config.items()
+            if section.get("type") == "MessageBuffer"
+            and f"network.{network_port}" in section.get(port, "")
+            and name.rsplit(".", 1)[0] in self.controllers
+        }
+
+    def destinations(self, netdest):
+        """
+        Controllers of a printed NetDest: the bits of every machine type,
+        each group followed by a ``-``.
+        """
+        groups = [[]]
+        for token in netdest.split():
+            if token == "-":
+                groups.append([])
+            else:
+                groups[-1].append(token)
+        groups.pop()
+        machines = MACHINE_ORDER[len(MACHINE_ORDER) - len(groups):]
+        return [
+            f"{machine}:{version}"
+            for machine, bits in zip(machines, groups)
+            for version, bit in enumerate(bits)
+            if bit == "1"
+        ]
+
+
+def message_vnet(buffer, size):
+    if "Data" in size:
+        return 2
+    return 0 if buffer.rsplit(".", 1)[-1].startswith("request") else 1
+
+
+def convert(outdir, out_path):
+    """Write the trace of a run's coherence.log; returns its metadata."""
+    network = Network(read_config(os.path.join(outdir, "config.ini")))
+    log_path = os.path.join(outdir, LOG_FILE)
+    opener = open
+    if not os.path.exists(log_path):
+        # gem5 compresses debug files named *.gz.
+        log_path += ".gz"
+        opener = gzip.open
+    records = 0
+    first = last = None
+    with opener(log_path, "rt") as log, gzip.open(out_path, "wt") as out:
+        metadata = {
+            "source": os.path.abspath(outdir),
+            "cycle_ticks": network.cycle_ticks,
+            "block_bytes": network.block_bytes,
+        }
+        out.write("# " + json.dumps(metadata) + "\n")
+        writer = csv.writer(out)
+        writer.writerow(FIELDS)
+        for line in log:
+            match = ENQUEUE.match(line)
+            if not match or match.group(2) not in network.buffers:
+                continue
+            tick, buffer, message = match.groups()
+            destination = DESTINATION.search(message)
+            size = MESSAGE_SIZE.search(message)
+            if not destination or not size:
+                continue
+            size = size.group(1)
+            vnet = message_vnet(buffer, size)
+            length = CONTROL_BYTES
+            if "Data" in size:
+                length += network.block_bytes
+            for target in network.destinations(destination.group(1)):
+                writer.writerow(
+                    [tick, network.buffers[buffer], target, vnet, length]
+                )
+                records += 1
+            tick = int(tick)
+            first = tick if first is None else first
+            last = tick
+    metadata.update(records=records, first_tick=first, last_tick=last)
+    return metadata
+
+
+def read_trace(path):
+    """Metadata and an iterator of the records of a trace."""
+    f = gzip.open(path, "rt")
+    header = f.readline()
+    metadata = json.loads(header[1:]) if header.startswith("#") else {}
+
+    def records():
+        with f:
+            for row in csv.DictReader(f):
+                yield (
+                    int(row["tick"]),
+                    row["source"],
+                    row["destination"],
+                    int(row["vnet"]),
+                    int(row["bytes"]),
+                )
+
+    return metadata, records()
+
+
+def node_of(controller, num_nodes):
+    return int(controller.rsplit(":", 1)[1]) % num_nodes
+
+
+def flows(path, num_sources, num_destinations, time_scale=1.0,
+          cycle_ticks=None):
+    """
+    Packets per cycle of every (source node, destination node, vnet)
+    flow of a trace, replayed ``time_scale`` times as fast, and the
+    trace's length in cycles. A cycle is ``cycle_ticks`` ticks, the clock
+    period of whatever injects the flows, which defaults to the recorded
+    run's Ruby clock.
+    """
+    metadata, records = read_trace(path)
+    cycle_ticks = cycle_ticks or metadata.get("cycle_ticks") or 1000
+    counts = collections.Counter()
+    first = last = None
+    for tick, source, destination, vnet, _ in records:
+        counts[
+            (
+                node_of(source, num_sources),
+                node_of(destination, num_destinations),
+                vnet,
+            )
+        ] += 1
+        first = tick if first is None else min(first, tick)
+        last = tick if last is None else max(last, tick)
+    if first is None:
+        return {}, 0
+    cycles = max(1, (last - first) // cycle_ticks)
+    return {
+        flow: count * time_scale / cycles for flow, count in counts.items()
+    }, cycles
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Coherence-message traces for Garnet replay."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser(
+        "convert", help="Trace the network messages of a recorded run."
+    )
+    convert_parser.add_argument("outdir", type=str)
+    convert_parser.add_argument(
+        "--out", type=str, default="coherence.csv.gz"
+    )
+    flows_parser = subparsers.add_parser(
+        "flows", help="Node-to-node flows of a trace, as replayed."
+    )
+    flows_parser.add_argument("trace", type=str)
+    flows_parser.add_argument("--num-nodes", type=int, default=16)
+    flows_parser.add_argument(
+        "--num-dirs",
+        type=int,
+        default=None,
+        help="Destination nodes (default: --num-nodes).",
+    )
+    flows_parser.add_argument("--time-scale", type=float, default=1.0)
+    flows_parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if args.command == "convert":
+        metadata = convert(args.outdir, args.out)
+        print(
+            f"{metadata['records']} message deliveries between ticks "
+            f"{metadata['first_tick']} and {metadata['last_tick']} "
+            f"written to {args.out}"
+        )
+        return 0
+
+    rates, cycles = flows(
+        args.trace,
+        args.num_nodes,
+        args.num_dirs or args.num_nodes,
+        args.time_scale,
+    )
+    total = sum(rates.values())
+    per_vnet = collections.Counter()
+    for (_, _, vnet), rate in rates.items():
+        per_vnet[vnet] += rate
+    print(
+        f"{len(rates)} flows over {cycles} cycles, "
+        f"{total / args.num_nodes:.4f} packets/node/cycle"
+    )
+    for vnet in sorted(per_vnet):
+        print(f"  vnet {vnet}: {per_vnet[vnet] / total:.1%} of the packets")
+    print("Busiest flows (source, destination, vnet: packets/cycle):")
+    for flow, rate in sorted(rates.items(), key=lambda item: -item[1])[
+        : args.top
+    ]:
+        print(f"  {flow[0]:3d} -> {flow[1]:3d}, vnet {flow[2]}: {rate:.5f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,183 @@
+"""
+Elastic-trace record and replay for the PARSEC ROI.
+
+Recording (``--record-etrace`` on the x86 PARSEC scripts) attaches gem5's
+ElasticTrace probe to every O3 core that runs the ROI. Each core writes an
+instruction fetch trace and a data dependency trace
+(``etrace.core<N>.{inst,data}.pb.gz``); ``etrace.json`` in the outdir lists
+them with the O3 queue sizes to replay with. Only the ROI must run on the
+O3 cores, so recording needs ``--fast-forward`` or a stored post-boot
+checkpoint.
+
+Replay (``Single_Chiplet_Multi_Core/x86-etrace-replay.py``) drives TraceCPU
+cores with the traces through any MESI Two Level or Three Level hierarchy,
+without modelling the O3 pipeline again. The cores replay independently,
+so dependencies between threads are only kept as the recorded timing.
+
+The comparison with a full O3 run of the same configuration is printed at
+the end of a replay, and can be redone from the command line:
+
+```
+python3 Tools/elastic_trace.py compare replay_out/stats.txt \
+    o3_out/stats.txt --hierarchy mesi2 --replay-wallclock 812
+```
+
+This module only needs plain Python, inside gem5 or on the host.
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import stats_parser
+from gem5_runs import L2_PATTERNS
+
+MANIFEST = "etrace.json"
+
+REPORT_FIELDS = ["simTicks", "l2_hit_rate", "hostSeconds"]
+
+
+def attach_recorders(cores, outdir, **fields):
+    """
+    Record elastic traces of ``cores`` (stdlib O3 cores; gem5 side, before
+    instantiation). ``fields`` are stored in the manifest.
+    """
+    from m5.objects import ElasticTrace
+
+    manifest = dict(fields, cores=[])
+    for core_id, core in enumerate(cores):
+        cpu = core.core
+        inst = f"etrace.core{core_id}.inst.pb.gz"
+        data = f"etrace.core{core_id}.data.pb.gz"
+        manifest["cores"].append(
+            {
+                "inst": inst,
+                "data": data,
+                "rob_entries": int(cpu.numROBEntries),
+                "lq_entries": int(cpu.LQEntries),
+                "sq_entries": int(cpu.SQEntries),
+            }
+        )
+        # Trace from the first committed instruction; the cores only run
+        # the ROI.
+        cpu.traceListener = ElasticTrace(
+            instFetchTraceFile=inst,
+            dataDepTraceFile=data,
+            depWindowSize=3 * int(cpu.numROBEntries),
+            startTraceInst=0,
+        )
+        # As in gem5's CpuConfig.config_etrace: stalls on these queues
+        # would be recorded as compute delay, and TraceCPU models them at
+        # replay instead.
+        cpu.numROBEntries = 512
+        cpu.LQEntries = 128
+        cpu.SQEntries = 128
+    write_manifest(outdir, manifest)
+    return manifest
+
+
+def write_manifest(outdir, manifest):
+    with open(os.path.join(outdir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def load_manifest(etrace_dir):
+    with open(os.path.join(etrace_dir, MANIFEST)) as f:
+        return json.load(f)
+
+
+def roi_metrics(stats_path, hierarchy):
+    """simTicks, L2 hit rate and hostSeconds of the first dump."""
+    store = stats_parser.open_store(stats_path)
+    if len(store) == 0:
+        raise ValueError(f"{stats_path}: no stats dump")
+    metrics = {
+        name: store.get(0, name) for name in ("simTicks", "hostSeconds")
+    }
+    pattern = L2_PATTERNS[hierarchy]
+    hits = sum(store.query(0, pattern.format("hits")).values())
+    misses = sum(store.query(0, pattern.format("misses")).values())
+    metrics["l2_hit_rate"] = hits / (hits + misses) if hits + misses else None
+    return metrics
+
+
+def compare(replay_stats, reference_stats, hierarchy, replay_wallclock=None):
+    """
+    Replay metrics against the full O3 run: the relative error of simTicks,
+    the absolute difference of the L2 hit rate and the wall-clock speedup.
+    """
+    replay = roi_metrics(replay_stats, hierarchy)
+    reference = roi_metrics(reference_stats, hierarchy)
+    if replay_wallclock is not None:
+        replay["hostSeconds"] = replay_wallclock
+    report = {"replay": replay, "reference": reference}
+    if reference["simTicks"]:
+        report["simTicks_error"] = (
+            replay["simTicks"] - reference["simTicks"]
+        ) / reference["simTicks"]
+    if None not in (replay["l2_hit_rate"], reference["l2_hit_rate"]):
+        report["l2_hit_rate_delta"] = (
+            replay["l2_hit_rate"] - reference["l2_hit_rate"]
+        )
+    if replay["hostSeconds"] and reference["hostSeconds"]:
+        report["speedup"] = reference["hostSeconds"] / replay["hostSeconds"]
+    return report
+
+
+def print_report(report):
+    print(f"{'':14s}{'O3 run':>16s}{'replay':>16s}")
+    for field in REPORT_FIELDS:
+        values = [report["reference"][field], report["replay"][field]]
+        print(
+            f"{field:14s}"
+            + "".join(
+                f"{value:>16.6g}" if value is not None else f"{'-':>16s}"
+                for value in values
+            )
+        )
+    if "simTicks_error" in report:
+        print(f"simTicks error:    {report['simTicks_error']:+.2%}")
+    if "l2_hit_rate_delta" in report:
+        print(f"L2 hit rate delta: {report['l2_hit_rate_delta']:+.4f}")
+    if "speedup" in report:
+        print(f"Wall-clock speedup over O3: {report['speedup']:.1f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Elastic-trace replay accuracy against a full O3 run."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compare_parser = subparsers.add_parser(
+        "compare", help="Compare a replay stats.txt with an O3 stats.txt."
+    )
+    compare_parser.add_argument("replay_stats", type=str)
+    compare_parser.add_argument("reference_stats", type=str)
+    compare_parser.add_argument(
+        "--hierarchy", type=str, default="mesi2", choices=sorted(L2_PATTERNS)
+    )
+    compare_parser.add_argument(
+        "--replay-wallclock",
+        type=float,
+        default=None,
+        help="Replay wall-clock in seconds (default: its hostSeconds).",
+    )
+    compare_parser.add_argument("--json", type=str, default=None)
+    args = parser.parse_args(argv)
+
+    report = compare(
+        args.replay_stats,
+        args.reference_stats,
+        args.hierarchy,
+        args.replay_wallclock,
+    )
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
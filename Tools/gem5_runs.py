@@ -0,0 +1,45 @@
+"""
+Running gem5 from the host-side sweep drivers (parsec_sweep.py,
+parsec_sampling.py, garnet_saturation.py, garnet_tuner.py), and the stat
+names they read.
+
+A run is a dict that describes one gem5 process and holds at least its
+``outdir``. ``execute`` runs the process with its output in
+``<outdir>/gem5.log`` and records the run, its command, return code and
+wall-clock time in ``<outdir>/run.json``.
+
+This module is plain Python.
+"""
+
+import json
+import os
+import subprocess
+import time
+
+# Demand hits/misses of the L2 of each x86 PARSEC hierarchy. MESI Two
+# Level has one L2 shared by all cores, in banks. MESI Three Level gives
+# every core a private L2, which the protocol names "L1Cache" (its L1 is
+# "L0Cache"), under a different path.
+L2_PATTERNS = {
+    "mesi2": "*.l2_controllers*.L2cache.m_demand_{}",
+    "mesi3": "*.core_clusters*.l2_cache.cache.m_demand_{}",
+}
+
+
+def execute(run, command):
+    """Run one gem5 process; gem5's stdout/stderr go to the outdir."""
+    os.makedirs(run["outdir"], exist_ok=True)
+    start = time.time()
+    with open(os.path.join(run["outdir"], "gem5.log"), "w") as log:
+        returncode = subprocess.call(
+            command, stdout=log, stderr=subprocess.STDOUT
+        )
+    wallclock = time.time() - start
+    with open(os.path.join(run["outdir"], "run.json"), "w") as manifest:
+        json.dump(
+            dict(run, command=command, returncode=returncode,
+                 wallclock=wallclock),
+            manifest,
+            indent=2,
+        )
+    return returncode, wallclock
@@ -0,0 +1,423 @@
+"""
+Tail-latency histograms of the packets of a Garnet (or any Ruby network)
+run.
+
+Recording: ``--record-coherence`` on garnet_synth_traffic.py (or on the
+other run scripts) logs every Ruby MessageBuffer enqueue to
+``coherence.log`` in the outdir (see coherence_trace.py; needs a
+``gem5.opt`` binary). A message is sent when it is enqueued into a buffer
+that feeds the network and received when the network enqueues it into the
+destination's buffer. The latency of each delivery is the time between
+the two, queueing at the source included, as in Garnet's
+``average_packet_latency``. Sends and deliveries of identical messages
+between the same controllers are matched first in, first out.
+
+The log is streamed once into fixed-memory histograms with HDR-style
+logarithmic buckets (``LogHistogram``): exact up to 2^``sub_bucket_bits``
+cycles, then ``2^(sub_bucket_bits - 1)`` buckets per power of two, so any
+percentile is within ``2^(1 - sub_bucket_bits)`` of the true value (about
+3% by default), with a bounded number of buckets. There is one histogram
+per vnet, per source/destination controller pair, and per router hop
+count. Hop counts follow the shortest weighted routes through the links
+of the outdir's ``config.ini``, like the table-based routing.
+
+The report prints p50/p95/p99/p99.9 per vnet and per hop count and the
+source x destination matrix of a percentile, and writes the histograms
+as a gem5 stats dump, ``latency_stats.txt`` in the outdir, which
+stats_parser.py reads like stats.txt:
+
+```
+python3 Tools/latency_hist.py m5out
+python3 Tools/latency_hist.py m5out --matrix p99.9 --json latency.json
+```
+
+This module is plain Python.
+"""
+
+import argparse
+import collections
+import gzip
+import json
+import math
+import os
+import sys
+
+import coherence_trace
+import noc_topologies
+import stats_parser
+
+PERCENTILES = [50, 95, 99, 99.9]
+
+STATS_FILE = "latency_stats.txt"
+
+# Names of the histograms in latency_stats.txt.
+STATS_PREFIX = "system.ruby.network.latency_hist"
+
+NETWORK = "system.ruby.network."
+
+
+class LogHistogram:
+    """
+    Counts of non-negative integer values in logarithmic buckets. Values
+    below ``2**sub_bucket_bits`` get a bucket each; above, each power of
+    two is split into ``2**(sub_bucket_bits - 1)`` equal buckets.
+    """
+
+    def __init__(self, sub_bucket_bits=6):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_buckets = 1 << sub_bucket_bits
+        # Bucket index -> count; at most a few hundred buckets.
+        self.counts = collections.Counter()
+        self.samples = 0
+        self.total = 0
+        self.max = 0
+
+    def index(self, value):
+        if value < self.sub_buckets:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits
+        half = self.sub_buckets // 2
+        return self.sub_buckets + (shift - 1) * half + (value >> shift) - half
+
+    def bounds(self, index):
+        """Smallest and largest value of a bucket."""
+        if index < self.sub_buckets:
+            return index, index
+        half = self.sub_buckets // 2
+        shift, offset = divmod(index - self.sub_buckets, half)
+        shift += 1
+        low = (half + offset) << shift
+        return low, low + (1 << shift) - 1
+
+    def record(self, value, count=1):
+        value = max(0, int(value))
+        self.counts[self.index(value)] += count
+        self.samples += count
+        self.total += value * count
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        self.samples += other.samples
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    @property
+    def mean(self):
+        return self.total / self.samples if self.samples else math.nan
+
+    def percentile(self, percent):
+        """Largest value of the bucket that holds the percentile."""
+        if not self.samples:
+            return math.nan
+        rank = max(1, math.ceil(self.samples * percent / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self.bounds(index)[1], self.max)
+        return self.max
+
+    def summary(self):
+        summary = {
+            "samples": self.samples,
+            "mean": self.mean,
+            "max": self.max,
+        }
+        for percent in PERCENTILES:
+            summary[f"p{percent:g}"] = self.percentile(percent)
+        return summary
+
+    def stats_lines(self, name, buckets=True):
+        """The histogram as gem5 distribution stat lines."""
+        lines = [
+            f"{name}::{key} {value}" for key, value in self.summary().items()
+        ]
+        if buckets:
+            for index in sorted(self.counts):
+                low, high = self.bounds(index)
+                lines.append(f"{name}::{low}-{high} {self.counts[index]}")
+        return lines
+
+
+def read_links(config):
+    """
+    Router ids by router name, (link, src, dst, weight) of the links
+    between routers, and the router of every controller, from the network
+    of a config.ini. Routers are numbered by their ``router_id`` (Garnet's
+    stats index them by it), else in order of appearance.
+    """
+    routers = {
+        name: int(section["router_id"])
+        for name, section in config.items()
+        if "router_id" in section
+    }
+    links = []
+    attached = {}
+
+    def router(name):
+        return routers.setdefault(name, len(routers))
+
+    for name, section in config.items():
+        if {"src_node", "dst_node"} <= section.keys():
+            links.append(
+                (
+                    name,
+                    router(section["src_node"]),
+                    router(section["dst_node"]),
+                    int(section.get("weight", 1)),
+                )
+            )
+        elif {"ext_node", "int_node"} <= section.keys():
+            attached[section["ext_node"]] = router(section["int_node"])
+    return routers, links, attached
+
+
+class HopCounts:
+    """Router hops between controllers along the routing table."""
+
+    def __init__(self, config, network):
+        routers, links, attached = read_links(config)
+        self.table = noc_topologies.routing_table(
+            len(routers), [link[1:] for link in links]
+        )
+        self.routers = {
+            network.controllers[name]: router
+            for name, router in attached.items()
+            if name in network.controllers
+        }
+        self.cache = {}
+
+    def __call__(self, source, destination):
+        key = source, destination
+        if key not in self.cache:
+            src = self.routers.get(source)
+            dst = self.routers.get(destination)
+            hops = None
+            if src is not None and dst is not None:
+                try:
+                    hops = sum(
+                        1 for _ in noc_topologies.route(self.table, src, dst)
+                    )
+                except ValueError:
+                    pass
+            self.cache[key] = hops
+        return self.cache[key]
+
+
+def latencies(outdir):
+    """
+    Stream (source, destination, vnet, latency in cycles) of every
+    delivery in the coherence.log of a run.
+    """
+    config = coherence_trace.read_config(os.path.join(outdir, "config.ini"))
+    network = coherence_trace.Network(config)
+    cycle_ticks = network.cycle_ticks or 1000
+    log_path = os.path.join(outdir, coherence_trace.LOG_FILE)
+    opener = open
+    if not os.path.exists(log_path):
+        log_path += ".gz"
+        opener = gzip.open
+    # (message without its destinations, destination) -> sends in flight.
+    in_flight = collections.defaultdict(collections.deque)
+    with opener(log_path, "rt") as log:
+        for line in log:
+            match = coherence_trace.ENQUEUE.match(line)
+            if not match:
+                continue
+            tick, buffer, message = match.groups()
+            if buffer in network.buffers:
+                destination = coherence_trace.DESTINATION.search(message)
+                size = coherence_trace.MESSAGE_SIZE.search(message)
+                if not destination or not size:
+                    continue
+                vnet = coherence_trace.message_vnet(buffer, size.group(1))
+                key = coherence_trace.DESTINATION.sub("", message)
+                for target in network.destinations(destination.group(1)):
+                    in_flight[key, target].append(
+                        (int(tick), network.buffers[buffer], vnet)
+                    )
+            elif buffer in network.inputs:
+                target = network.inputs[buffer]
+                key = coherence_trace.DESTINATION.sub("", message), target
+                if not in_flight.get(key):
+                    # Sent before the log started.
+                    continue
+                sent, source, vnet = in_flight[key].popleft()
+                if not in_flight[key]:
+                    del in_flight[key]
+                yield source, target, vnet, (int(tick) - sent) / cycle_ticks
+
+
+def collect(outdir, sub_bucket_bits=6):
+    config = coherence_trace.read_config(os.path.join(outdir, "config.ini"))
+    hop_counts = HopCounts(config, coherence_trace.Network(config))
+    histograms = {
+        "all": LogHistogram(sub_bucket_bits),
+        "vnet": collections.defaultdict(lambda: LogHistogram(sub_bucket_bits)),
+        "hops": collections.defaultdict(lambda: LogHistogram(sub_bucket_bits)),
+        "pair": collections.defaultdict(lambda: LogHistogram(sub_bucket_bits)),
+    }
+    for source, destination, vnet, latency in latencies(outdir):
+        latency = round(latency)
+        histograms["all"].record(latency)
+        histograms["vnet"][vnet].record(latency)
+        histograms["pair"][source, destination].record(latency)
+        hops = hop_counts(source, destination)
+        if hops is not None:
+            histograms["hops"][hops].record(latency)
+    return histograms
+
+
+def garnet_latency(outdir):
+    """
+    Garnet's average_packet_latency of the last stats dump of a run, in
+    cycles, or None.
+    """
+    stats_path = os.path.join(outdir, "stats.txt")
+    if not os.path.exists(stats_path):
+        return None
+    dump = None
+    for dump in stats_parser.iter_dumps(stats_path):
+        pass
+    if not dump or NETWORK + "average_packet_latency" not in dump:
+        return None
+    config = coherence_trace.read_config(os.path.join(outdir, "config.ini"))
+    cycle_ticks = coherence_trace.Network(config).cycle_ticks or 1000
+    return dump[NETWORK + "average_packet_latency"] / cycle_ticks
+
+
+def write_stats(path, histograms):
+    lines = histograms["all"].stats_lines(STATS_PREFIX)
+    for vnet, histogram in sorted(histograms["vnet"].items()):
+        lines += histogram.stats_lines(f"{STATS_PREFIX}.vnet{vnet}")
+    for hops, histogram in sorted(histograms["hops"].items()):
+        lines += histogram.stats_lines(f"{STATS_PREFIX}.hops{hops}")
+    for (source, destination), histogram in sorted(
+        histograms["pair"].items()
+    ):
+        # Controllers are named <machine>:<version>.
+        name = f"{source}.{destination}".replace(":", "")
+        lines += histogram.stats_lines(
+            f"{STATS_PREFIX}.pair.{name}", buckets=False
+        )
+    with open(path, "w") as f:
+        f.write("\n---------- Begin Simulation Statistics ----------\n")
+        f.write("\n".join(lines) + "\n")
+        f.write("\n---------- End Simulation Statistics   ----------\n")
+
+
+def controller_key(controller):
+    machine, _, version = controller.rpartition(":")
+    return machine, int(version)
+
+
+def print_report(histograms, matrix_stat):
+    columns = ["samples", "mean"] + [f"p{p:g}" for p in PERCENTILES] + [
+        "max"
+    ]
+    header = f"{'':12s}" + "".join(f"{column:>10s}" for column in columns)
+
+    def row(label, histogram):
+        summary = histogram.summary()
+        cells = [f"{summary['samples']:10d}", f"{summary['mean']:10.2f}"]
+        cells += [f"{summary[column]:10.0f}" for column in columns[2:]]
+        return f"{label:12s}" + "".join(cells)
+
+    print("Packet latency (cycles)")
+    print(header)
+    print(row("all", histograms["all"]))
+    for vnet, histogram in sorted(histograms["vnet"].items()):
+        print(row(f"vnet {vnet}", histogram))
+    for hops, histogram in sorted(histograms["hops"].items()):
+        print(row(f"{hops} hops", histogram))
+
+    sources = sorted({s for s, _ in histograms["pair"]}, key=controller_key)
+    destinations = sorted(
+        {d for _, d in histograms["pair"]}, key=controller_key
+    )
+    width = max(len(name) for name in sources + destinations) + 1
+    print(f"\n{matrix_stat} latency, source (rows) x destination (columns)")
+    print(" " * width + "".join(f"{d:>{width}s}" for d in destinations))
+    for source in sources:
+        cells = []
+        for destination in destinations:
+            histogram = histograms["pair"].get((source, destination))
+            if histogram is None:
+                cells.append(f"{'-':>{width}s}")
+            else:
+                value = histogram.summary()[matrix_stat]
+                cells.append(f"{value:{width}.0f}")
+        print(f"{source:{width}s}" + "".join(cells))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Packet latency percentiles of a recorded Ruby run."
+    )
+    parser.add_argument(
+        "outdir",
+        type=str,
+        help="Outdir of a --record-coherence run (coherence.log and "
+        "config.ini).",
+    )
+    parser.add_argument(
+        "--matrix",
+        type=str,
+        default="p99",
+        choices=["samples", "mean", "max"]
+        + [f"p{p:g}" for p in PERCENTILES],
+        help="Statistic of the source x destination matrix.",
+    )
+    parser.add_argument(
+        "--sub-bucket-bits",
+        type=int,
+        default=6,
+        help="Histogram precision: percentiles are within "
+        "2^(1 - bits) of the exact value.",
+    )
+    parser.add_argument("--json", type=str, default=None)
+    args = parser.parse_args(argv)
+
+    histograms = collect(args.outdir, args.sub_bucket_bits)
+    if not histograms["all"].samples:
+        print(f"No deliveries in {args.outdir}")
+        return 1
+    print_report(histograms, args.matrix)
+    reference = garnet_latency(args.outdir)
+    if reference is not None:
+        print(
+            f"\nMean {histograms['all'].mean:.2f} cycles, Garnet's "
+            f"average_packet_latency {reference:.2f} cycles"
+        )
+    stats_path = os.path.join(args.outdir, STATS_FILE)
+    write_stats(stats_path, histograms)
+    print(f"\nHistograms written to {stats_path}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "all": histograms["all"].summary(),
+                    "vnet": {
+                        str(vnet): histogram.summary()
+                        for vnet, histogram in histograms["vnet"].items()
+                    },
+                    "hops": {
+                        str(hops): histogram.summary()
+                        for hops, histogram in histograms["hops"].items()
+                    },
+                    "pair": {
+                        f"{source}->{destination}": histogram.summary()
+                        for (source, destination), histogram in histograms[
+                            "pair"
+                        ].items()
+                    },
+                },
+                f,
+                indent=2,
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,529 @@
+"""
+Compact binary memory-access traces of gem5 runs.
+
+Capture: ``--capture-trace`` on the x86 PARSEC scripts puts a CommMonitor
+between every core's instruction and data ports and its Ruby sequencer,
+with a MemTraceProbe that writes the requests as gzipped gem5 packet
+traces (``memtrace.core<N>.<port>.trc.gz``). The ports of switched-in
+cores are taken over with their monitors, so the ROI cores are traced
+whichever processor layout is used. ``memtrace.json`` in the outdir lists
+the probe files and the ROI ticks. Fast-forwarding with KVM, or restoring
+a post-boot checkpoint, keeps the boot out of the probe files.
+
+Conversion merges the probe files by tick, keeps the ROI and writes one
+``.g5mt`` file:
+
+```
+python3 Tools/mem_trace.py convert m5out --out roi.g5mt
+python3 Tools/mem_trace.py info roi.g5mt
+python3 Tools/mem_trace.py pack trace.npz --out trace.g5mt
+```
+
+Format: a fixed header, a JSON metadata block, then chunks of fixed-width
+little-endian records (``RECORD``), and an index of the chunks at the end.
+Chunks are zlib-compressed independently, or stored raw with
+``--no-compress``, in which case all records form one contiguous array
+that ``TraceReader.memmap`` maps without reading. ``TraceReader.chunks``
+streams NumPy arrays a chunk at a time either way; ``select`` skips the
+chunks outside a tick range using the index.
+
+The access types are those of ``cache_sim.py`` (0 load, 1 store,
+2 instruction fetch).
+
+Requires NumPy.
+"""
+
+import argparse
+import glob
+import gzip
+import json
+import os
+import re
+import struct
+import sys
+import zlib
+
+import numpy as np
+
+RECORD = np.dtype(
+    [
+        ("tick", "<u8"),
+        ("address", "<u8"),
+        ("core", "<u2"),
+        ("type", "u1"),
+        ("size", "u1"),
+    ]
+)
+
+MAGIC = b"G5MTRACE"
+VERSION = 1
+# magic, version, record size, chunk records, compressed, metadata bytes
+HEADER = struct.Struct("<8sIIIIQ")
+# offset, stored bytes, records, first tick, last tick
+INDEX_ENTRY = struct.Struct("<QQQQQ")
+# index offset, chunk count, record count, magic
+FOOTER = struct.Struct("<QQQ8s")
+FOOTER_MAGIC = b"G5MTINDX"
+
+LOAD, STORE, IFETCH = 0, 1, 2
+
+# gem5 MemCmd values (src/mem/packet.hh) of the requests that write:
+# WriteReq, WriteLineReq and StoreCondReq. Everything else from a data
+# port is a load.
+STORE_COMMANDS = (4, 16, 27)
+
+MANIFEST = "memtrace.json"
+
+
+class TraceWriter:
+    """Appends records to a ``.g5mt`` file; use as a context manager."""
+
+    def __init__(self, path, compress=True, chunk_records=1 << 20,
+                 level=1, **meta):
+        self.path = path
+        self.compress = compress
+        self.chunk_records = chunk_records
+        self.level = level
+        self.pending = []
+        self.pending_records = 0
+        self.index = []
+        self.records = 0
+        self.file = open(path, "wb")
+        metadata = json.dumps(meta, sort_keys=True).encode()
+        self.file.write(
+            HEADER.pack(MAGIC, VERSION, RECORD.itemsize, chunk_records,
+                        int(compress), len(metadata))
+        )
+        self.file.write(metadata)
+        # Raw records start on a record boundary, so they can be mapped.
+        self.file.write(b"\0" * (-self.file.tell() % RECORD.itemsize))
+
+    def write(self, records):
+        """Append a RECORD array (or anything convertible to one)."""
+        records = np.asarray(records, dtype=RECORD)
+        self.pending.append(records)
+        self.pending_records += records.size
+        while self.pending_records >= self.chunk_records:
+            self._flush(self.chunk_records)
+
+    def write_arrays(self, core, address, kind, tick=None, size=None):
+        records = np.zeros(np.size(core), dtype=RECORD)
+        records["core"] = core
+        records["address"] = address
+        records["type"] = kind
+        records["tick"] = np.arange(records.size) if tick is None else tick
+        records["size"] = 8 if size is None else size
+        self.write(records)
+
+    def _flush(self, count):
+        records = np.concatenate(self.pending)
+        chunk, rest = records[:count], records[count:]
+        self.pending = [rest]
+        self.pending_records = rest.size
+        if not chunk.size:
+            return
+        data = chunk.tobytes()
+        if self.compress:
+            data = zlib.compress(data, self.level)
+        self.index.append(
+            (self.file.tell(), len(data), chunk.size,
+             int(chunk["tick"][0]), int(chunk["tick"][-1]))
+        )
+        self.file.write(data)
+        self.records += chunk.size
+
+    def close(self):
+        if self.file.closed:
+            return
+        self._flush(self.pending_records)
+        index_offset = self.file.tell()
+        for entry in self.index:
+            self.file.write(INDEX_ENTRY.pack(*entry))
+        self.file.write(
+            FOOTER.pack(index_offset, len(self.index), self.records,
+                        FOOTER_MAGIC)
+        )
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TraceReader:
+    """Streams the records of a ``.g5mt`` file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            (magic, version, record_size, self.chunk_records,
+             compressed, meta_size) = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path}: not a memory trace")
+            if version != VERSION or record_size != RECORD.itemsize:
+                raise ValueError(f"{path}: unsupported trace version")
+            self.compressed = bool(compressed)
+            self.meta = json.loads(f.read(meta_size) or b"{}")
+            f.seek(-FOOTER.size, os.SEEK_END)
+            index_offset, num_chunks, self.records, magic = FOOTER.unpack(
+                f.read(FOOTER.size)
+            )
+            if magic != FOOTER_MAGIC:
+                raise ValueError(f"{path}: truncated trace (no index)")
+            f.seek(index_offset)
+            self.index = [
+                INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))
+                for _ in range(num_chunks)
+            ]
+
+    def __len__(self):
+        return self.records
+
+    def chunk(self, i):
+        offset, stored, records, _, _ = self.index[i]
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            data = f.read(stored)
+        if self.compressed:
+            data = zlib.decompress(data)
+        return np.frombuffer(data, dtype=RECORD, count=records)
+
+    def chunks(self):
+        """Every chunk in order, one RECORD array at a time."""
+        for i in range(len(self.index)):
+            yield self.chunk(i)
+
+    def select(self, start=0, end=None):
+        """Chunks of the records with ``start <= tick < end``."""
+        for i, (_, _, _, first, last) in enumerate(self.index):
+            if last < start or (end is not None and first >= end):
+                continue
+            records = self.chunk(i)
+            keep = records["tick"] >= start
+            if end is not None:
+                keep &= records["tick"] < end
+            yield records[keep]
+
+    def memmap(self):
+        """All records as one read-only array mapped from the file."""
+        if self.compressed:
+            raise ValueError(f"{self.path}: compressed traces can't be mapped")
+        if not self.index:
+            return np.zeros(0, dtype=RECORD)
+        return np.memmap(self.path, dtype=RECORD, mode="r",
+                         offset=self.index[0][0], shape=(self.records,))
+
+    def read(self):
+        """All records in memory."""
+        return np.concatenate(list(self.chunks()) or [np.zeros(0, RECORD)])
+
+
+def parse_varints(data):
+    """
+    Values and end offsets of the back-to-back varints in ``data``;
+    bytes after the last complete varint are left out.
+    """
+    raw = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(raw < 0x80)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    values = np.zeros(ends.size, dtype=np.uint64)
+    length = ends - starts + 1
+    for k in range(int(length.max(initial=0))):
+        has = length > k
+        values[has] |= (
+            raw[starts[has] + k].astype(np.uint64) & np.uint64(0x7F)
+        ) << np.uint64(7 * k)
+    return values, ends + 1
+
+
+def read_packet_trace(path, block=1 << 26):
+    """
+    Stream a gzipped gem5 packet trace (MemTraceProbe output) as arrays of
+    ``(tick, cmd, addr, size)``.
+
+    After the header every Packet field is a varint, so each block is
+    decoded as one varint sequence; only the message boundaries are
+    walked in Python.
+    """
+    with gzip.open(path, "rb") as f:
+        if f.read(4) != b"gem5":
+            raise ValueError(f"{path}: not a gem5 packet trace")
+        buffer = f.read(block)
+        # Skip the PacketHeader message (it holds strings).
+        values, ends = parse_varints(buffer[:10])
+        buffer = buffer[int(ends[0]) + int(values[0]):]
+        eof = False
+        while buffer:
+            values, ends = parse_varints(buffer)
+            starts = np.concatenate([[0], ends[:-1]])
+            # Walk the length prefixes to find complete messages. A Packet
+            # has at least its four required fields, and every field is a
+            # key and a value varint.
+            message_start = []
+            message_end = []
+            ends_list = ends.tolist()
+            lengths = values.tolist()
+            count, size = len(ends_list), len(buffer)
+            i = 0
+            while i < count:
+                end = ends_list[i] + lengths[i]
+                if end > size:
+                    break
+                message_start.append(i)
+                message_end.append(end)
+                i += 9
+                while i <= count and ends_list[i - 1] < end:
+                    i += 2
+            used = message_end[-1] if message_end else 0
+            if message_start:
+                yield decode_packets(values, ends, message_start, used)
+            buffer = buffer[used:]
+            if not eof:
+                more = f.read(block)
+                eof = not more
+                buffer += more
+            elif not message_start:
+                break
+
+
+def decode_packets(values, ends, message_start, used):
+    """Field arrays of the Packet messages starting at ``message_start``."""
+    count = int(np.searchsorted(ends, used, side="right"))
+    values = values[:count]
+    is_start = np.zeros(count, dtype=bool)
+    is_start[message_start] = True
+    message = np.cumsum(is_start) - 1
+    first = np.asarray(message_start)[message]
+    position = np.arange(count) - first
+    key = (position % 2 == 1) & (position > 0)
+    field = np.zeros(count, dtype=np.int64)
+    field[key] = values[key] >> np.uint64(3)
+    value_of = np.flatnonzero(key) + 1
+    fields = {}
+    for number, name in ((1, "tick"), (2, "cmd"), (3, "addr"), (4, "size")):
+        column = np.zeros(len(message_start), dtype=np.uint64)
+        sel = value_of[field[value_of - 1] == number]
+        column[message[sel]] = values[sel]
+        fields[name] = column
+    return fields
+
+
+def probe_records(path, core, port):
+    """RECORD arrays of one probe file."""
+    for packets in read_packet_trace(path):
+        records = np.zeros(packets["tick"].size, dtype=RECORD)
+        records["tick"] = packets["tick"]
+        records["address"] = packets["addr"]
+        records["core"] = core
+        records["size"] = np.minimum(packets["size"], 255)
+        if port == "inst":
+            records["type"] = IFETCH
+        else:
+            records["type"] = np.where(
+                np.isin(packets["cmd"], STORE_COMMANDS), STORE, LOAD
+            )
+        yield records
+
+
+def merge_by_tick(streams):
+    """Merge per-port RECORD streams, each in tick order, by tick."""
+    streams = [iter(stream) for stream in streams]
+    buffers = [np.zeros(0, dtype=RECORD) for _ in streams]
+    live = [True] * len(streams)
+    while any(live) or any(b.size for b in buffers):
+        for i, stream in enumerate(streams):
+            while live[i] and not buffers[i].size:
+                buffers[i] = next(stream, None)
+                if buffers[i] is None:
+                    live[i] = False
+                    buffers[i] = np.zeros(0, dtype=RECORD)
+        # Everything up to the earliest last tick of the live streams is
+        # final.
+        watermark = min(
+            (int(b["tick"][-1]) for b, alive in zip(buffers, live) if alive),
+            default=None,
+        )
+        out = []
+        for i, records in enumerate(buffers):
+            if watermark is None:
+                cut = records.size
+            else:
+                cut = np.searchsorted(records["tick"], watermark, "right")
+            out.append(records[:cut])
+            buffers[i] = records[cut:]
+        merged = np.concatenate(out)
+        yield merged[np.argsort(merged["tick"], kind="stable")]
+
+
+def capture_ports(outdir):
+    """The probe files of a captured run: ``(path, core, port)``."""
+    ports = []
+    for path in sorted(glob.glob(os.path.join(outdir, "memtrace.*.trc*"))):
+        match = re.search(r"memtrace\.core(\d+)\.(inst|data)\.", path)
+        if match:
+            ports.append((path, int(match.group(1)), match.group(2)))
+    return ports
+
+
+def convert(outdir, out, compress=True, chunk_records=1 << 20,
+            roi_only=True):
+    """Merge the probe files of a captured run into one ``.g5mt`` file."""
+    manifest = {}
+    manifest_path = os.path.join(outdir, MANIFEST)
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    ports = capture_ports(outdir)
+    if not ports:
+        raise ValueError(f"{outdir}: no memtrace probe files")
+    begin = manifest.get("roi_begin") if roi_only else None
+    end = manifest.get("roi_end") if roi_only else None
+    num_cores = max(core for _, core, _ in ports) + 1
+    with TraceWriter(out, compress, chunk_records, num_cores=num_cores,
+                     roi=[begin, end], source=os.path.abspath(outdir),
+                     **{k: v for k, v in manifest.items()
+                        if k not in ("roi_begin", "roi_end")}) as writer:
+        streams = [probe_records(*port) for port in ports]
+        for records in merge_by_tick(streams):
+            keep = np.ones(records.size, dtype=bool)
+            if begin is not None:
+                keep &= records["tick"] >= begin
+            if end is not None:
+                keep &= records["tick"] < end
+            writer.write(records[keep])
+    return writer.records
+
+
+def attach_probes(processor, outdir):
+    """
+    Trace every core of ``processor`` (gem5 side; call before the board is
+    built). Returns the manifest that ``write_manifest`` keeps up to date.
+    """
+    manifest = {"ports": [], "roi_begin": None, "roi_end": None}
+    for core_id, core in enumerate(processor.get_cores()):
+        for port in ("inst", "data"):
+            name = f"memtrace.core{core_id}.{port}.trc"
+            connect = getattr(
+                core, "connect_icache" if port == "inst" else "connect_dcache"
+            )
+            # Cores are SimObjects, which only accept parameters and
+            # children as attributes, hence object.__setattr__.
+            object.__setattr__(
+                core,
+                connect.__name__,
+                monitored(core, connect, port, name),
+            )
+            manifest["ports"].append(
+                {"file": name + ".gz", "core": core_id, "port": port}
+            )
+    write_manifest(outdir, manifest)
+    return manifest
+
+
+def monitored(core, connect, port, trace_file):
+    from m5.objects import CommMonitor, MemTraceProbe
+
+    def connect_monitored(sequencer_port):
+        monitor = CommMonitor()
+        monitor.trace = MemTraceProbe(
+            trace_file=trace_file, trace_compress=True
+        )
+        setattr(core.core, f"{port}_monitor", monitor)
+        monitor.mem_side_port = sequencer_port
+        connect(monitor.cpu_side_port)
+
+    return connect_monitored
+
+
+def write_manifest(outdir, manifest):
+    with open(os.path.join(outdir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def iter_arrays(path, chunk=1 << 20):
+    """``(core, address, type)`` arrays of a ``.g5mt`` file, by chunk."""
+    reader = TraceReader(path)
+    records = []
+    count = 0
+    for part in reader.chunks():
+        records.append(part)
+        count += part.size
+        if count >= chunk:
+            merged = np.concatenate(records)
+            for first in range(0, merged.size - chunk + 1, chunk):
+                part = merged[first:first + chunk]
+                yield part["core"], part["address"], part["type"]
+            rest = merged[merged.size - merged.size % chunk:]
+            records, count = [rest], rest.size
+    if count:
+        merged = np.concatenate(records)
+        yield merged["core"], merged["address"], merged["type"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Convert and inspect binary memory-access traces."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = subparsers.add_parser(
+        "convert", help="Merge the probe files of a --capture-trace run."
+    )
+    convert_parser.add_argument("outdir", type=str)
+    convert_parser.add_argument("--out", type=str, default=None)
+    convert_parser.add_argument(
+        "--whole-run",
+        action="store_true",
+        help="Keep the records outside the ROI.",
+    )
+
+    pack_parser = subparsers.add_parser(
+        "pack", help="Write an .npz or text trace as .g5mt."
+    )
+    pack_parser.add_argument("trace", type=str)
+    pack_parser.add_argument("--out", type=str, required=True)
+
+    for sub in (convert_parser, pack_parser):
+        sub.add_argument(
+            "--no-compress",
+            action="store_true",
+            help="Store raw chunks, so the file can be memory-mapped.",
+        )
+        sub.add_argument("--chunk-records", type=int, default=1 << 20)
+
+    info_parser = subparsers.add_parser("info", help="Describe a trace.")
+    info_parser.add_argument("trace", type=str)
+    args = parser.parse_args(argv)
+
+    if args.command == "convert":
+        out = args.out or os.path.join(args.outdir, "memtrace.g5mt")
+        records = convert(args.outdir, out, not args.no_compress,
+                          args.chunk_records, not args.whole_run)
+        print(f"{records} records written to {out}")
+    elif args.command == "pack":
+        from cache_sim import load_trace
+
+        core, address, kind = load_trace(args.trace)
+        with TraceWriter(args.out, not args.no_compress, args.chunk_records,
+                         num_cores=int(core.max(initial=0)) + 1,
+                         source=os.path.abspath(args.trace)) as writer:
+            writer.write_arrays(core, address, kind)
+        print(f"{writer.records} records written to {args.out}")
+    else:
+        reader = TraceReader(args.trace)
+        stored = sum(entry[1] for entry in reader.index)
+        print(f"{args.trace}: {len(reader)} records in "
+              f"{len(reader.index)} chunks, {stored} bytes "
+              f"({'zlib' if reader.compressed else 'raw'})")
+        if reader.index:
+            print(f"ticks {reader.index[0][3]} - {reader.index[-1][4]}")
+        for key, value in sorted(reader.meta.items()):
+            if key != "ports":
+                print(f"{key}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
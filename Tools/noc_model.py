@@ -0,0 +1,655 @@
+"""
+Analytical latency model of mesh and multi-chiplet networks, for screening
+configurations before running garnet_synth_traffic.py.
+
+The model follows a packet through Garnet: the injection link, one router
+per hop plus the destination router, the links between them and the
+ejection link, plus the serialization of its flits. Queueing on every
+link is modelled as an M/D/1 queue whose load comes from routing the
+synthetic traffic matrix over the topology:
+
+- zero-load latency of a pair:
+  ``(hops + 1) * router_latency + intra_hops * link_latency
+  + inter_hops * inter_link_latency + 2 * link_latency + flits - 1``
+- link utilization: ``rate * share * flits``, where ``share`` is the
+  fraction of one node's injected packets that cross the link;
+- waiting time of a link (M/D/1): ``rho * flits / (2 * (1 - rho))``;
+- saturation rate: the rate at which the busiest link reaches ``rho = 1``.
+
+Everything that depends on the topology and pattern is reduced once to a
+few numbers (mean hop counts and per-link shares), so a grid of latency
+parameters and rates is evaluated with plain array arithmetic.
+
+Raw model latencies are mapped to Garnet latencies by a linear
+calibration ``alpha + beta * zero_load + gamma * waiting``. The
+coefficients are fitted by least squares on the unsaturated points of a
+``curves.csv`` written by Garnet_Standalone/garnet_saturation.py:
+
+```
+python3 Tools/noc_model.py calibrate saturation_out/curves.csv \
+    --rows 4 --cols 4 --output calibration.json
+python3 Tools/noc_model.py predict --rows 8 --cols 8 \
+    --synthetic tornado --rates 0.02 0.05 0.1 --calibration calibration.json
+python3 Tools/noc_model.py screen --rows 4 8 --chiplets 1 2 \
+    --router-latency 1 2 --inter-link-latency 1 12 \
+    --synthetic uniform_random transpose --output screen.csv
+python3 Tools/noc_model.py compare --endpoints 16 64 256 \
+    --topology mesh cmesh express fbfly --output topologies.csv
+```
+
+Topologies are square-addressed like gem5's Mesh_XY: node ``i`` sits at
+router ``i``, at column ``i % cols`` and row ``i // cols``, with XY
+routing. A multi-chiplet network is a grid of chiplets that are meshes of
+their own. Its links that cross a chiplet boundary take the inter-chiplet
+latency. ``compare`` instead models the mesh, concentrated mesh, express
+mesh and flattened butterfly of noc_topologies.py, routed by their routing
+tables, and reports hop counts and latencies for every pattern.
+
+Requires NumPy.
+"""
+
+import argparse
+import csv
+import functools
+import itertools
+import json
+import sys
+
+import numpy as np
+
+import noc_topologies
+
+PATTERNS = [
+    "uniform_random",
+    "tornado",
+    "bit_complement",
+    "bit_reverse",
+    "bit_rotation",
+    "neighbor",
+    "shuffle",
+    "transpose",
+]
+
+# garnet_synth_traffic.py injects into a random vnet by default: vnets 0
+# and 1 carry 1-flit packets, vnet 2 carries 5-flit packets.
+DEFAULT_FLITS = (1 + 1 + 5) / 3
+
+DEFAULT_CALIBRATION = {"alpha": 0.0, "beta": 1.0, "gamma": 1.0}
+
+# gem5 topology names accepted in curves.csv.
+MESH_TOPOLOGIES = {"Mesh_XY", "Mesh_westfirst", "mesh"}
+
+
+def pattern_destinations(pattern, num_nodes):
+    """Destination of every source for a deterministic pattern."""
+    source = np.arange(num_nodes)
+    radix = int(np.sqrt(num_nodes))
+    src_x, src_y = source % radix, source // radix
+    if pattern == "bit_complement":
+        return (radix - src_y - 1) * radix + (radix - src_x - 1)
+    if pattern == "bit_reverse":
+        num_bits = int(np.log2(num_nodes))
+        reverse = np.zeros_like(source)
+        for bit in range(num_bits):
+            reverse |= ((source >> bit) & 1) << (num_bits - 1 - bit)
+        return reverse
+    if pattern == "bit_rotation":
+        return np.where(
+            source % 2 == 0, source // 2, source // 2 + num_nodes // 2
+        )
+    if pattern == "neighbor":
+        return src_y * radix + (src_x + 1) % radix
+    if pattern == "shuffle":
+        return np.where(
+            source < num_nodes // 2,
+            source * 2,
+            source * 2 - num_nodes + 1,
+        )
+    if pattern == "transpose":
+        return src_x * radix + src_y
+    if pattern == "tornado":
+        return src_y * radix + (src_x + radix // 2 - 1) % radix
+    raise ValueError(f"unknown synthetic pattern {pattern!r}")
+
+
+def traffic_matrix(pattern, num_nodes):
+    """``T[s, d]``: probability that a packet injected at s goes to d."""
+    if pattern == "uniform_random":
+        return np.full((num_nodes, num_nodes), 1.0 / num_nodes)
+    matrix = np.zeros((num_nodes, num_nodes))
+    destinations = pattern_destinations(pattern, num_nodes)
+    matrix[np.arange(num_nodes), destinations % num_nodes] = 1.0
+    return matrix
+
+
+class Topology:
+    """
+    Directed links and XY routes of a grid of ``chiplets x chiplets``
+    chiplets, each a ``rows x cols`` mesh of routers.
+
+    Link ``l`` is internal when ``link_inter[l]`` is False. Every node also
+    has an injection and an ejection link, numbered after the router links.
+    """
+
+    def __init__(self, rows, cols, chiplets=1):
+        self.rows, self.cols, self.chiplets = rows, cols, chiplets
+        self.grid_rows, self.grid_cols = rows * chiplets, cols * chiplets
+        self.num_nodes = self.grid_rows * self.grid_cols
+
+        link_ids = {}
+        inter = []
+        for y, x in itertools.product(
+            range(self.grid_rows), range(self.grid_cols)
+        ):
+            for nx, ny in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+                if 0 <= nx < self.grid_cols and 0 <= ny < self.grid_rows:
+                    link_ids[(self.node(x, y), self.node(nx, ny))] = len(inter)
+                    inter.append(
+                        x // cols != nx // cols or y // rows != ny // rows
+                    )
+        self.num_router_links = len(inter)
+        self.num_links = self.num_router_links + 2 * self.num_nodes
+        self.link_inter = np.array(
+            inter + [False] * 2 * self.num_nodes, dtype=bool
+        )
+
+        self.set_routes(
+            lambda src, dst: [link_ids[hop] for hop in self.xy_route(src, dst)]
+        )
+
+    def set_routes(self, router_links):
+        """
+        Flatten the routes of all node pairs; ``router_links(src, dst)``
+        gives the router links of the route from node src to node dst.
+        """
+        # Flattened routes: route_pair[k] uses link route_link[k].
+        pairs, links = [], []
+        hops = np.zeros((self.num_nodes, self.num_nodes), dtype=np.int64)
+        inter_hops = np.zeros_like(hops)
+        for src, dst in itertools.product(range(self.num_nodes), repeat=2):
+            pair = src * self.num_nodes + dst
+            route = (
+                [self.injection_link(src)]
+                + router_links(src, dst)
+                + [self.ejection_link(dst)]
+            )
+            pairs.extend([pair] * len(route))
+            links.extend(route)
+            hops[src, dst] = len(route) - 2
+            inter_hops[src, dst] = sum(self.link_inter[l] for l in route)
+        self.route_pair = np.array(pairs, dtype=np.int64)
+        self.route_link = np.array(links, dtype=np.int64)
+        self.hops = hops
+        self.inter_hops = inter_hops
+
+    def node(self, x, y):
+        return y * self.grid_cols + x
+
+    def injection_link(self, node):
+        return self.num_router_links + node
+
+    def ejection_link(self, node):
+        return self.num_router_links + self.num_nodes + node
+
+    def xy_route(self, src, dst):
+        """Router-to-router hops of the XY route from src to dst."""
+        x, y = src % self.grid_cols, src // self.grid_cols
+        dst_x, dst_y = dst % self.grid_cols, dst // self.grid_cols
+        while x != dst_x:
+            nx = x + (1 if dst_x > x else -1)
+            yield self.node(x, y), self.node(nx, y)
+            x = nx
+        while y != dst_y:
+            ny = y + (1 if dst_y > y else -1)
+            yield self.node(x, y), self.node(x, ny)
+            y = ny
+
+    def link_shares(self, traffic):
+        """Packets per link per packet injected by each node."""
+        return np.bincount(
+            self.route_link,
+            weights=traffic.ravel()[self.route_pair],
+            minlength=self.num_links,
+        )
+
+
+class GridTopology(Topology):
+    """
+    Directed links and table routes of a ``noc_topologies`` grid (mesh,
+    cmesh, express or fbfly) with ``num_nodes`` endpoints. Nodes that
+    share a router go through that router only.
+    """
+
+    def __init__(self, num_nodes, kind):
+        grid = noc_topologies.Grid(num_nodes, kind)
+        table = grid.routing_table()
+        link_ids = {
+            (src, dst): i for i, (src, dst, _) in enumerate(grid.links)
+        }
+        self.grid = grid
+        self.num_nodes = num_nodes
+        self.num_router_links = len(grid.links)
+        self.num_links = self.num_router_links + 2 * num_nodes
+        self.link_inter = np.zeros(self.num_links, dtype=bool)
+        self.set_routes(
+            lambda src, dst: [
+                link_ids[hop]
+                for hop in noc_topologies.route(
+                    table, grid.endpoint_router(src), grid.endpoint_router(dst)
+                )
+            ]
+        )
+
+
+@functools.lru_cache(maxsize=None)
+def topology(rows, cols, chiplets=1):
+    return Topology(rows, cols, chiplets)
+
+
+@functools.lru_cache(maxsize=None)
+def grid_topology(num_nodes, kind):
+    return GridTopology(num_nodes, kind)
+
+
+@functools.lru_cache(maxsize=None)
+def pattern_profile(rows, cols, chiplets, pattern):
+    """
+    Everything the model needs from a topology and pattern: mean internal
+    and inter-chiplet hops per packet, and per-link shares.
+    """
+    topo = topology(rows, cols, chiplets)
+    traffic = traffic_matrix(pattern, topo.num_nodes)
+    weight = traffic / topo.num_nodes
+    return {
+        "num_nodes": topo.num_nodes,
+        "hops": float((weight * topo.hops).sum()),
+        "inter_hops": float((weight * topo.inter_hops).sum()),
+        "shares": topo.link_shares(traffic),
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def grid_profile(num_nodes, kind, pattern):
+    """pattern_profile of a noc_topologies grid."""
+    topo = grid_topology(num_nodes, kind)
+    traffic = traffic_matrix(pattern, num_nodes)
+    weight = traffic / num_nodes
+    return {
+        "num_nodes": num_nodes,
+        "hops": float((weight * topo.hops).sum()),
+        "max_hops": int(topo.hops[traffic > 0].max()),
+        "inter_hops": 0.0,
+        "shares": topo.link_shares(traffic),
+    }
+
+
+def zero_load_latency(
+    profile, router_latency=1, link_latency=1, inter_link_latency=None,
+    flits=DEFAULT_FLITS,
+):
+    """Mean zero-load latency in cycles; broadcasts over array arguments."""
+    if inter_link_latency is None:
+        inter_link_latency = link_latency
+    intra_hops = profile["hops"] - profile["inter_hops"]
+    return (
+        (profile["hops"] + 1) * router_latency
+        + intra_hops * link_latency
+        + profile["inter_hops"] * inter_link_latency
+        + 2 * link_latency
+        + np.asarray(flits) - 1
+    )
+
+
+def waiting_time(profile, rates, flits=DEFAULT_FLITS):
+    """
+    Mean queueing delay per packet at each rate (M/D/1 per link); inf once
+    any link is saturated.
+    """
+    rates = np.asarray(rates, dtype=float)[..., None]
+    shares = profile["shares"]
+    rho = rates * shares * flits
+    with np.errstate(divide="ignore", invalid="ignore"):
+        wait = np.where(rho < 1, rho * flits / (2 * (1 - rho)), np.inf)
+        # Weight every link's delay by the packets that cross it.
+        per_packet = (wait * shares).sum(axis=-1) / profile["num_nodes"]
+    return np.where(np.isnan(per_packet), np.inf, per_packet)
+
+
+def saturation_rate(profile, flits=DEFAULT_FLITS):
+    """Injection rate (packets/node/cycle) at which a link saturates."""
+    return 1.0 / (flits * profile["shares"].max())
+
+
+def predict(profile, rates, calibration=None, **latencies):
+    """Calibrated mean packet latency in cycles at every rate."""
+    calibration = calibration or DEFAULT_CALIBRATION
+    flits = latencies.get("flits", DEFAULT_FLITS)
+    return (
+        calibration["alpha"]
+        + calibration["beta"] * zero_load_latency(profile, **latencies)
+        + calibration["gamma"] * waiting_time(profile, rates, flits)
+    )
+
+
+def fit(zero_load, waiting, measured):
+    """Least-squares ``alpha, beta, gamma`` and the mean relative error."""
+    features = np.column_stack(
+        [np.ones_like(zero_load), zero_load, waiting]
+    )
+    (alpha, beta, gamma), *_ = np.linalg.lstsq(features, measured, rcond=None)
+    calibration = {"alpha": alpha, "beta": beta, "gamma": gamma}
+    error = np.abs(features @ [alpha, beta, gamma] - measured) / measured
+    return {k: float(v) for k, v in calibration.items()}, float(error.mean())
+
+
+def load_calibration(path):
+    if not path:
+        return DEFAULT_CALIBRATION
+    with open(path) as f:
+        return json.load(f)["calibration"]
+
+
+def calibrate(args):
+    zero_load, waiting, measured = [], [], []
+    with open(args.curves) as f:
+        for row in csv.DictReader(f):
+            if row["status"] != "ok" or row["saturated"] == "True":
+                continue
+            if row["topology"] not in MESH_TOPOLOGIES:
+                continue
+            profile = pattern_profile(
+                args.rows, args.cols, args.chiplets, row["synthetic"]
+            )
+            rate = float(row["injection_rate"])
+            zero_load.append(
+                zero_load_latency(
+                    profile,
+                    args.router_latency,
+                    args.link_latency,
+                    args.inter_link_latency,
+                    args.flits,
+                )
+            )
+            waiting.append(waiting_time(profile, rate, args.flits))
+            measured.append(float(row["latency"]))
+    if len(measured) < 3:
+        print("Need at least 3 unsaturated points to calibrate")
+        return 1
+    calibration, error = fit(
+        np.array(zero_load), np.array(waiting), np.array(measured)
+    )
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "calibration": calibration,
+                "mean_relative_error": error,
+                "points": len(measured),
+                "source": args.curves,
+            },
+            f,
+            indent=2,
+        )
+    print(
+        f"alpha {calibration['alpha']:.3f}  beta {calibration['beta']:.3f}  "
+        f"gamma {calibration['gamma']:.3f}  over {len(measured)} points, "
+        f"mean error {100 * error:.1f}%"
+    )
+    return 0
+
+
+def screen(args):
+    """Evaluate the whole parameter grid, one row per point."""
+    calibration = load_calibration(args.calibration)
+    rates = np.asarray(args.rates or [0.0])
+    fields = [
+        "rows",
+        "cols",
+        "chiplets",
+        "synthetic",
+        "router_latency",
+        "link_latency",
+        "inter_link_latency",
+        "zero_load_latency",
+        "saturation_rate",
+    ] + [f"latency@{rate:g}" for rate in rates]
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    writer = csv.writer(output)
+    writer.writerow(fields)
+    count = 0
+    for rows, cols, chiplets, synthetic in itertools.product(
+        args.rows, args.cols or [None], args.chiplets, args.synthetic
+    ):
+        cols = cols or rows
+        profile = pattern_profile(rows, cols, chiplets, synthetic)
+        waiting = waiting_time(profile, rates, args.flits)
+        saturation = saturation_rate(profile, args.flits)
+        # The latency parameters only enter the zero-load term, so the
+        # whole parameter grid is one broadcast expression.
+        router, link, inter = np.meshgrid(
+            args.router_latency,
+            args.link_latency,
+            args.inter_link_latency or args.link_latency,
+            indexing="ij",
+        )
+        if not args.inter_link_latency:
+            inter = link
+        zero_load = zero_load_latency(
+            profile, router.ravel(), link.ravel(), inter.ravel(), args.flits
+        )
+        latency = (
+            calibration["alpha"]
+            + calibration["beta"] * zero_load[:, None]
+            + calibration["gamma"] * waiting[None, :]
+        )
+        for i in range(zero_load.size):
+            writer.writerow(
+                [rows, cols, chiplets, synthetic,
+                 router.ravel()[i], link.ravel()[i], inter.ravel()[i],
+                 f"{zero_load[i]:.3f}", f"{saturation:.4f}"]
+                + [f"{value:.3f}" for value in latency[i]]
+            )
+        count += zero_load.size
+    if args.output:
+        output.close()
+    print(f"{count} configuration(s) screened", file=sys.stderr)
+    return 0
+
+
+def compare(args):
+    """Hop counts and latencies of the grid topologies, per pattern."""
+    calibration = load_calibration(args.calibration)
+    rates = np.asarray(args.rates or [], dtype=float)
+    fields = [
+        "endpoints",
+        "topology",
+        "routers",
+        "links",
+        "synthetic",
+        "mean_hops",
+        "max_hops",
+        "zero_load_latency",
+        "saturation_rate",
+    ] + [f"latency@{rate:g}" for rate in rates]
+    rows = []
+    for endpoints, synthetic, kind in itertools.product(
+        args.endpoints, args.synthetic, args.topology
+    ):
+        grid = grid_topology(endpoints, kind).grid
+        profile = grid_profile(endpoints, kind, synthetic)
+        latencies = {
+            "router_latency": args.router_latency,
+            "link_latency": args.link_latency,
+            "flits": args.flits,
+        }
+        latency = predict(profile, rates, calibration, **latencies)
+        rows.append(
+            [endpoints, kind, grid.num_routers, len(grid.links), synthetic,
+             f"{profile['hops']:.3f}", profile["max_hops"],
+             f"{zero_load_latency(profile, **latencies):.3f}",
+             f"{saturation_rate(profile, args.flits):.4f}"]
+            + [f"{value:.3f}" for value in latency]
+        )
+
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(fields)
+            writer.writerows(rows)
+    previous = None
+    for row in rows:
+        # One table per endpoint count and pattern.
+        if (row[0], row[4]) != previous:
+            previous = row[0], row[4]
+            print(
+                f"\n{row[0]} endpoints, {row[4]}\n"
+                f"{'topology':10s}{'routers':>8s}{'links':>7s}"
+                f"{'hops':>8s}{'max':>5s}{'zero-load':>11s}{'sat. rate':>11s}"
+                + "".join(f"{'@' + format(rate, 'g'):>10s}" for rate in rates)
+            )
+        print(
+            f"{row[1]:10s}{row[2]:8d}{row[3]:7d}{row[5]:>8s}{row[6]:5d}"
+            f"{row[7]:>11s}{row[8]:>11s}"
+            + "".join(f"{value:>10s}" for value in row[9:])
+        )
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Analytical NoC latency model for mesh and "
+        "multi-chiplet topologies."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_model_args(sub, many):
+        nargs = "+" if many else None
+        wrap = (lambda v: [v]) if many else (lambda v: v)
+        sub.add_argument("--rows", type=int, nargs=nargs, default=wrap(4))
+        sub.add_argument(
+            "--cols",
+            type=int,
+            nargs=nargs,
+            default=None,
+            help="Routers per row of a chiplet (default: --rows).",
+        )
+        sub.add_argument(
+            "--chiplets",
+            type=int,
+            nargs=nargs,
+            default=wrap(1),
+            help="Chiplets per side of the chiplet grid.",
+        )
+        sub.add_argument(
+            "--router-latency", type=int, nargs=nargs, default=wrap(1)
+        )
+        sub.add_argument(
+            "--link-latency", type=int, nargs=nargs, default=wrap(1)
+        )
+        sub.add_argument(
+            "--inter-link-latency",
+            type=int,
+            nargs=nargs,
+            default=None,
+            help="Latency of links between chiplets (default: "
+            "--link-latency).",
+        )
+        sub.add_argument(
+            "--flits",
+            type=float,
+            default=DEFAULT_FLITS,
+            help="Mean flits per packet.",
+        )
+
+    predict_parser = subparsers.add_parser(
+        "predict", help="Latency-vs-load curve of one configuration."
+    )
+    add_model_args(predict_parser, many=False)
+    predict_parser.add_argument(
+        "--synthetic", type=str, default="uniform_random", choices=PATTERNS
+    )
+    predict_parser.add_argument("--rates", type=float, nargs="+",
+                                default=[0.01, 0.05, 0.1, 0.2, 0.3])
+    predict_parser.add_argument("--calibration", type=str, default=None)
+
+    calibrate_parser = subparsers.add_parser(
+        "calibrate", help="Fit the model to Garnet curves.csv results."
+    )
+    add_model_args(calibrate_parser, many=False)
+    calibrate_parser.add_argument("curves", type=str)
+    calibrate_parser.add_argument(
+        "--output", type=str, default="calibration.json"
+    )
+
+    screen_parser = subparsers.add_parser(
+        "screen", help="Evaluate a grid of configurations."
+    )
+    add_model_args(screen_parser, many=True)
+    screen_parser.add_argument(
+        "--synthetic", nargs="+", default=["uniform_random"], choices=PATTERNS
+    )
+    screen_parser.add_argument("--rates", type=float, nargs="+", default=None)
+    screen_parser.add_argument("--calibration", type=str, default=None)
+    screen_parser.add_argument(
+        "--output", type=str, default=None, help="CSV file (default: stdout)."
+    )
+    compare_parser = subparsers.add_parser(
+        "compare",
+        help="Compare the noc_topologies grids at several endpoint counts.",
+    )
+    compare_parser.add_argument(
+        "--endpoints", type=int, nargs="+", default=[16, 64, 256]
+    )
+    compare_parser.add_argument(
+        "--topology",
+        nargs="+",
+        default=list(noc_topologies.TOPOLOGIES),
+        choices=noc_topologies.TOPOLOGIES,
+    )
+    compare_parser.add_argument(
+        "--synthetic", nargs="+", default=PATTERNS, choices=PATTERNS
+    )
+    compare_parser.add_argument("--router-latency", type=int, default=1)
+    compare_parser.add_argument("--link-latency", type=int, default=1)
+    compare_parser.add_argument(
+        "--flits",
+        type=float,
+        default=DEFAULT_FLITS,
+        help="Mean flits per packet.",
+    )
+    compare_parser.add_argument(
+        "--rates", type=float, nargs="+", default=[0.02, 0.1]
+    )
+    compare_parser.add_argument("--calibration", type=str, default=None)
+    compare_parser.add_argument(
+        "--output", type=str, default=None, help="CSV file."
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        return compare(args)
+    if args.command == "calibrate":
+        args.cols = args.cols or args.rows
+        return calibrate(args)
+    if args.command == "screen":
+        return screen(args)
+
+    cols = args.cols or args.rows
+    profile = pattern_profile(args.rows, cols, args.chiplets, args.synthetic)
+    latencies = {
+        "router_latency": args.router_latency,
+        "link_latency": args.link_latency,
+        "inter_link_latency": args.inter_link_latency,
+        "flits": args.flits,
+    }
+    curve = predict(
+        profile, args.rates, load_calibration(args.calibration), **latencies
+    )
+    print(f"zero-load latency {zero_load_latency(profile, **latencies):.2f}")
+    print(f"saturation rate   {saturation_rate(profile, args.flits):.4f}")
+    for rate, latency in zip(args.rates, curve):
+        print(f"rate {rate:<8g} latency {latency:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
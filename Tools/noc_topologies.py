@@ -0,0 +1,252 @@
+"""
+Router graphs and routing tables of grid network topologies.
+
+The same graphs are used by the Garnet topologies in
+Garnet_Standalone/topologies/ (for garnet_synth_traffic.py), by the
+multi-chiplet ChipletTopology, and by ``noc_model.py compare``.
+
+A topology connects ``num_endpoints`` endpoints (cores, or the gateways of
+chiplets) through routers on the most square grid, ``ceil(sqrt(routers))``
+routers per row, the last row possibly incomplete:
+
+- ``mesh``: one router per endpoint, linked to its grid neighbours.
+- ``cmesh``: concentrated mesh. ``concentration`` consecutive endpoints
+  share one router, and the routers form a mesh.
+- ``express``: mesh with express channels. Along every row and column,
+  every ``interval``-th router is also linked to the router ``interval``
+  positions further on, so long routes skip the routers in between.
+- ``fbfly``: flattened butterfly. Concentrated like ``cmesh``, with every
+  router linked to all routers of its row and of its column, so that any
+  two routers are at most two hops apart.
+
+Links are unidirectional, in pairs, each with a routing weight: 1 for
+horizontal and 2 for vertical links, as in gem5's Mesh_XY, so that
+shortest routes go along X before Y. An express channel weighs one less
+than the local hops it spans, and the vertical hops of ``express`` weigh
+at least ``interval``, more than any horizontal link. Routes therefore go
+along X before Y and never move away from their destination, which keeps
+them free of deadlock; ``dependency_cycle`` checks this, and
+``python3 noc_topologies.py check`` checks it for every topology.
+``routing_table`` gives the next hop of these routes, which gem5's
+table-based routing (routing_algorithm 0) follows as well.
+
+This module is plain Python.
+"""
+
+import argparse
+import heapq
+import math
+import sys
+
+TOPOLOGIES = ("mesh", "cmesh", "express", "fbfly")
+
+# Endpoints per router of the concentrated topologies.
+CONCENTRATION = 4
+
+X_WEIGHT, Y_WEIGHT = 1, 2
+
+
+class Grid:
+    def __init__(self, num_endpoints, topology="mesh",
+                 concentration=CONCENTRATION, interval=None):
+        if topology not in TOPOLOGIES:
+            raise ValueError(f"unknown topology {topology!r}")
+        self.num_endpoints = num_endpoints
+        self.topology = topology
+        if topology not in ("cmesh", "fbfly"):
+            concentration = 1
+        self.concentration = concentration
+        self.num_routers = math.ceil(num_endpoints / concentration)
+        self.cols = math.ceil(math.sqrt(self.num_routers))
+        self.rows = math.ceil(self.num_routers / self.cols)
+        # Express channels span about sqrt(cols) routers: 2 on a 4-wide
+        # grid, 4 on a 16-wide one.
+        self.interval = interval or max(2, math.ceil(math.sqrt(self.cols)))
+        # Weight of one hop along X and along Y. An express channel weighs
+        # one less than the local hops it spans, so routes take it but
+        # never overshoot their destination and come back, and vertical
+        # hops are heavier than any express channel along X, so routes
+        # still go along X before Y.
+        x_unit, y_unit = X_WEIGHT, Y_WEIGHT
+        if topology == "express":
+            y_unit = max(Y_WEIGHT, self.interval * X_WEIGHT)
+        express_x = self.interval * x_unit - 1
+        express_y = self.interval * y_unit - 1
+        # (src, dst, weight) per unidirectional link between routers.
+        self.links = []
+        for router in range(self.num_routers):
+            x, y = router % self.cols, router // self.cols
+            if topology == "fbfly":
+                east = [(nx, x_unit) for nx in range(x + 1, self.cols)]
+                south = [(ny, y_unit) for ny in range(y + 1, self.rows)]
+            else:
+                east, south = [(x + 1, x_unit)], [(y + 1, y_unit)]
+                if topology == "express":
+                    if x % self.interval == 0:
+                        east.append((x + self.interval, express_x))
+                    if y % self.interval == 0:
+                        south.append((y + self.interval, express_y))
+            for nx, weight in east:
+                self._link(router, self.router_at(nx, y), weight)
+            for ny, weight in south:
+                self._link(router, self.router_at(x, ny), weight)
+
+    def router_at(self, x, y):
+        """Router at column x of row y, or None outside the grid."""
+        router = y * self.cols + x
+        if x < self.cols and router < self.num_routers:
+            return router
+        return None
+
+    def endpoint_router(self, endpoint):
+        return endpoint // self.concentration
+
+    def _link(self, a, b, weight):
+        if b is None:
+            return
+        self.links.append((a, b, weight))
+        self.links.append((b, a, weight))
+
+    def routing_table(self):
+        return routing_table(self.num_routers, self.links)
+
+
+def next_hops(num_routers, links):
+    """
+    ``hops[router][destination]``: the routers gem5's table-based routing
+    may forward to, empty at the destination itself. gem5 keeps the links
+    on every shortest weighted route and picks one of the lightest of them
+    at random, per packet.
+    """
+    outgoing = [[] for _ in range(num_routers)]
+    incoming = [[] for _ in range(num_routers)]
+    for src, dst, weight in links:
+        outgoing[src].append((weight, dst))
+        incoming[dst].append((weight, src))
+    hops = [[[] for _ in range(num_routers)] for _ in range(num_routers)]
+    for destination in range(num_routers):
+        # Dijkstra towards the destination, over the incoming links.
+        distance = [math.inf] * num_routers
+        distance[destination] = 0
+        heap = [(0, destination)]
+        while heap:
+            dist, router = heapq.heappop(heap)
+            if dist > distance[router]:
+                continue
+            for weight, src in incoming[router]:
+                if dist + weight < distance[src]:
+                    distance[src] = dist + weight
+                    heapq.heappush(heap, (dist + weight, src))
+        for router in range(num_routers):
+            if router == destination or distance[router] == math.inf:
+                continue
+            shortest = [
+                (weight, dst)
+                for weight, dst in outgoing[router]
+                if weight + distance[dst] == distance[router]
+            ]
+            lightest = min(weight for weight, _ in shortest)
+            hops[router][destination] = sorted(
+                dst for weight, dst in shortest if weight == lightest
+            )
+    return hops
+
+
+def routing_table(num_routers, links):
+    """
+    ``table[router][destination]``: next router on the shortest weighted
+    route, None at the destination itself. Of equally short routes the one
+    whose first link is lightest is taken, then the one through the lowest
+    router id, so tables are deterministic.
+    """
+    return [
+        [candidates[0] if candidates else None for candidates in row]
+        for row in next_hops(num_routers, links)
+    ]
+
+
+def dependency_cycle(num_routers, links):
+    """
+    A cycle of the channel dependency graph of the routes gem5 may take
+    (``next_hops``), as the routers it passes through, or None when the
+    routes cannot deadlock. Every router is taken to have endpoints, so
+    link (a, b) leads to link (b, c) for every destination d that a may
+    route via b and b via c.
+    """
+    hops = next_hops(num_routers, links)
+    following = {}
+    for a in range(num_routers):
+        for d in range(num_routers):
+            for b in hops[a][d]:
+                if b != d:
+                    following.setdefault((a, b), set()).update(
+                        (b, c) for c in hops[b][d]
+                    )
+    # Iterative depth-first search; a link met again on the stack closes
+    # a cycle.
+    state = {}
+    for start in following:
+        if start in state:
+            continue
+        stack = [(start, iter(following.get(start, ())))]
+        state[start] = "open"
+        while stack:
+            link, successors = stack[-1]
+            for successor in successors:
+                if state.get(successor) == "open":
+                    path = [entry for entry, _ in stack]
+                    cycle = path[path.index(successor):]
+                    return [src for src, _ in cycle] + [successor[0]]
+                if successor not in state:
+                    state[successor] = "open"
+                    stack.append(
+                        (successor, iter(following.get(successor, ())))
+                    )
+                    break
+            else:
+                state[link] = "done"
+                stack.pop()
+    return None
+
+
+def route(table, src, dst):
+    """(router, next router) hops from src to dst along ``table``."""
+    while src != dst:
+        following = table[src][dst]
+        if following is None:
+            raise ValueError(f"router {dst} is unreachable")
+        yield src, following
+        src = following
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Router graphs of grid network topologies."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    check_parser = subparsers.add_parser(
+        "check", help="Check the routes of every topology for deadlock."
+    )
+    check_parser.add_argument(
+        "--endpoints", type=int, nargs="+", default=[16, 64, 256]
+    )
+    args = parser.parse_args(argv)
+
+    failures = 0
+    for num_endpoints in args.endpoints:
+        for topology in TOPOLOGIES:
+            grid = Grid(num_endpoints, topology)
+            cycle = dependency_cycle(grid.num_routers, grid.links)
+            if cycle is None:
+                print(f"{topology:8s} {num_endpoints:5d} endpoints: acyclic")
+            else:
+                failures += 1
+                print(
+                    f"{topology:8s} {num_endpoints:5d} endpoints: "
+                    f"dependency cycle {' -> '.join(map(str, cycle))}"
+                )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
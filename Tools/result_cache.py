@@ -0,0 +1,189 @@
+"""
+Content-addressed cache of simulation results.
+
+A run is identified by a hash of its resolved configuration: the run
+script (name and contents), every resolved command-line parameter (cache
+hierarchy, processor, memory, workload, network options, ...) and the
+identity of the gem5 binary. When a stats.txt is already cached for that
+hash the run script copies it into its output directory and exits without
+instantiating the system.
+
+Layout of a cache directory:
+
+- ``<key>/stats.txt``    the stats of the completed run.
+- ``<key>/config.json``  the configuration the key was computed from.
+- ``<key>/phases.json``  etc.: the other ``OUTPUT_FILES`` the run wrote,
+  which tools read next to stats.txt.
+
+Entries are written to a temporary directory and renamed into place, so
+concurrent sweeps can share a cache. The run scripts take
+``--result-cache DIR`` and ``--force-rerun``; the cache can also be
+managed from the command line:
+
+```
+python3 Tools/result_cache.py --cache results list
+python3 Tools/result_cache.py --cache results invalidate <key>
+python3 Tools/result_cache.py --cache results invalidate --all
+```
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+CACHED_FILES = ["stats.txt", "config.json"]
+
+# Outputs of a run that are cached along with its stats.txt when the run
+# wrote them: the rates of the dumps of a phased Garnet run, and gem5's
+# config.ini, which link_heatmap.py routes the link loads over.
+OUTPUT_FILES = ["phases.json", "config.ini"]
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def gem5_identity():
+    """Identity of the running gem5 binary; only callable inside gem5."""
+    import _m5.core
+    from m5.defines import buildEnv
+
+    binary = os.path.realpath("/proc/self/exe")
+    if not os.path.exists(binary):
+        binary = os.path.realpath(sys.executable)
+    st = os.stat(binary)
+    return {
+        "version": _m5.core.gem5Version,
+        "compiled": _m5.core.compileDate,
+        "protocol": buildEnv.get("PROTOCOL"),
+        "binary": binary,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+    }
+
+
+def script_config(script_path, args, exclude=(), **extra):
+    """
+    Resolved configuration of a run script: the script itself, its parsed
+    arguments (minus ``exclude``, which should list options that do not
+    change results) and any ``extra`` fields.
+    """
+    config = {
+        "script": os.path.basename(script_path),
+        "script_digest": file_digest(script_path),
+        "args": {k: v for k, v in vars(args).items() if k not in exclude},
+    }
+    config.update(extra)
+    return config
+
+
+def config_key(config):
+    """Hash of a configuration; key order and value types are normalized."""
+    encoded = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()[:24]
+
+
+class ResultCache:
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def lookup(self, key):
+        """Path of the cached stats.txt for ``key``, or None."""
+        stats = os.path.join(self.path(key), "stats.txt")
+        return stats if os.path.exists(stats) else None
+
+    def restore(self, key, outdir, required=()):
+        """
+        Copy a cached result into ``outdir``; False on a cache miss, which
+        includes an entry without one of the ``required`` output files.
+        """
+        if self.lookup(key) is None:
+            return False
+        for name in required:
+            if not os.path.exists(os.path.join(self.path(key), name)):
+                return False
+        os.makedirs(outdir, exist_ok=True)
+        for name in CACHED_FILES + OUTPUT_FILES:
+            src = os.path.join(self.path(key), name)
+            if os.path.exists(src):
+                shutil.copyfile(src, os.path.join(outdir, name))
+        return True
+
+    def store(self, key, outdir, config):
+        """Cache ``outdir/stats.txt`` and its ``OUTPUT_FILES`` under
+        ``key``."""
+        stats = os.path.join(outdir, "stats.txt")
+        if not os.path.exists(stats) or os.path.getsize(stats) == 0:
+            return False
+        staging = f"{self.path(key)}.tmp{os.getpid()}"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        shutil.copyfile(stats, os.path.join(staging, "stats.txt"))
+        for name in OUTPUT_FILES:
+            output = os.path.join(outdir, name)
+            if os.path.exists(output):
+                shutil.copyfile(output, os.path.join(staging, name))
+        with open(os.path.join(staging, "config.json"), "w") as f:
+            json.dump(
+                {"key": key, "created": time.time(), "config": config},
+                f,
+                indent=2,
+                default=str,
+            )
+        shutil.rmtree(self.path(key), ignore_errors=True)
+        os.rename(staging, self.path(key))
+        return True
+
+    def invalidate(self, key):
+        shutil.rmtree(self.path(key), ignore_errors=True)
+
+    def entries(self):
+        """``(key, config)`` for every cached result."""
+        for name in sorted(os.listdir(self.root)):
+            config_path = os.path.join(self.root, name, "config.json")
+            if os.path.exists(config_path):
+                with open(config_path) as f:
+                    yield name, json.load(f)["config"]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Inspect or invalidate the simulation result cache."
+    )
+    parser.add_argument("--cache", type=str, required=True)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="List cached results.")
+    invalidate = subparsers.add_parser(
+        "invalidate", help="Delete cached results."
+    )
+    invalidate.add_argument("keys", nargs="*")
+    invalidate.add_argument("--all", action="store_true")
+    args = parser.parse_args()
+
+    cache = ResultCache(args.cache)
+    if args.command == "list":
+        for key, config in cache.entries():
+            print(f"{key}  {config['script']}  {config['args']}")
+        return 0
+
+    keys = [key for key, _ in cache.entries()] if args.all else args.keys
+    for key in keys:
+        cache.invalidate(key)
+        print(f"Invalidated {key}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,312 @@
+"""
+Single-pass LRU stack-distance profiler: miss-ratio curves for every cache
+capacity and associativity from one read of a memory trace.
+
+The stack distance of an access is the number of distinct lines touched
+since the previous access to its line. An LRU cache of ``A`` lines per set
+misses exactly the accesses whose distance within their set is ``A`` or
+more (or that touch the line for the first time), so one histogram of
+distances gives the miss ratio of every associativity at a given number of
+sets, and the fully associative histogram gives every capacity.
+
+Distances are counted in bulk with NumPy. Within a chunk the distance of
+access ``i`` whose line was last accessed at ``p`` is
+``#{j < i : prev(j) < p} - p - 1``, an offline dominance count done
+level by level of a merge tree (log N vectorized merges). Chunks are
+streamed: the LRU stack left by the previous chunk, truncated to the
+largest capacity of interest, is replayed in front of the next one, which
+keeps every distance exact and memory bounded by that capacity.
+
+Curves are profiled for the shared cache (all cores) and for each core's
+private cache. Traces are read like ``cache_sim.py`` does (``.g5mt``
+captures are streamed); instruction fetches are skipped unless
+``--ifetch`` is given.
+
+```
+python3 Tools/reuse_distance.py trace.npz --num-sets 256 1024 4096 \
+    --max-assoc 16 --max-size 64MiB --out mrc.csv
+```
+
+``mrc.csv`` has one row per (scope, sets, associativity). Rows with
+``sets`` = 1 are the fully associative curve at power-of-two capacities.
+The capacities where the shared curve drops the most are printed as the
+sizes worth simulating in gem5.
+
+Requires NumPy.
+"""
+
+import argparse
+import csv
+import sys
+import time
+
+import numpy as np
+
+from cache_sim import IFETCH, open_trace, parse_size
+
+CURVE_FIELDS = [
+    "scope",
+    "sets",
+    "assoc",
+    "size",
+    "accesses",
+    "misses",
+    "miss_ratio",
+]
+
+
+def stack_distances(line):
+    """
+    LRU stack distance of every access of ``line``; -1 for first accesses.
+    """
+    line = np.asarray(line, dtype=np.int64)
+    n = line.size
+    by_line = np.argsort(line, kind="stable")
+    same = line[by_line][1:] == line[by_line][:-1]
+    prev = np.full(n, -1, dtype=np.int64)
+    prev[by_line[1:][same]] = by_line[:-1][same]
+
+    # Count j < i with prev(j) < prev(i), split by the merge-tree level
+    # at which j and i part: j in the left half of a block, i in the right.
+    # ``order`` keeps each block sorted by prev, so every level's stable
+    # sort only merges two sorted runs.
+    count = np.zeros(n, dtype=np.int64)
+    order = np.arange(n)
+    level = 0
+    while (1 << level) < n:
+        half = 1 << level
+        block = order >> (level + 1)
+        order = order[
+            np.argsort(block * (n + 1) + prev[order], kind="stable")
+        ]
+        block = order >> (level + 1)
+        left = (order & half) == 0
+        # Left-half accesses sorted before each one, in its own block.
+        before = np.cumsum(left) - block * half
+        count[order[~left]] += before[~left]
+        level += 1
+
+    distance = count - prev - 1
+    distance[prev < 0] = -1
+    return distance
+
+
+class Profile:
+    """
+    Stack-distance histogram of one access stream for caches of
+    ``num_sets`` sets, up to ``cap`` lines per set.
+    """
+
+    def __init__(self, num_sets, cap):
+        self.num_sets = num_sets
+        self.cap = cap
+        self.histogram = np.zeros(cap, dtype=np.int64)
+        self.accesses = 0
+        # Lines still within ``cap`` of the top of their set's LRU stack,
+        # least recently used first.
+        self.stack = np.zeros(0, dtype=np.int64)
+
+    def feed(self, line):
+        carried = self.stack.size
+        sequence = np.concatenate([self.stack, line])
+        set_idx = sequence % self.num_sets
+        order = np.argsort(set_idx, kind="stable")
+        distance = np.empty(sequence.size, dtype=np.int64)
+        distance[order] = stack_distances(sequence[order])
+        distance = distance[carried:]
+        self.accesses += line.size
+        self.histogram += np.bincount(
+            distance[(distance >= 0) & (distance < self.cap)],
+            minlength=self.cap,
+        )
+
+        # New stack: the last access of every line, ordered by time and
+        # cut to the ``cap`` most recent lines of each set.
+        reverse = sequence[::-1]
+        lines, last = np.unique(reverse, return_index=True)
+        last = sequence.size - 1 - last
+        by_time = np.argsort(last)
+        lines = lines[by_time]
+        sets = lines % self.num_sets
+        newest_first = np.lexsort((-last[by_time], sets))
+        starts = np.ones(lines.size, dtype=bool)
+        starts[1:] = sets[newest_first][1:] != sets[newest_first][:-1]
+        first = np.maximum.accumulate(
+            np.where(starts, np.arange(lines.size), 0)
+        )
+        depth = np.empty(lines.size, dtype=np.int64)
+        depth[newest_first] = np.arange(lines.size) - first
+        self.stack = lines[depth < self.cap]
+
+    def misses(self, assoc):
+        """Misses of an LRU cache of ``assoc`` lines per set."""
+        return int(self.accesses - self.histogram[:assoc].sum())
+
+
+def profile_trace(chunks, num_cores, num_sets, max_assoc, max_lines):
+    """
+    Profiles of ``(core, line)`` chunks keyed by ``(scope, sets)``; scope
+    is "shared" or "coreN". ``sets`` = 1 is the fully associative profile
+    up to ``max_lines``.
+    """
+    scopes = ["shared"] + [f"core{c}" for c in range(num_cores)]
+    profiles = {}
+    for scope in scopes:
+        profiles[scope, 1] = Profile(1, max_lines)
+        for sets in num_sets:
+            profiles[scope, sets] = Profile(sets, max_assoc)
+    for chunk_core, chunk_line in chunks:
+        for (scope, sets), profile in profiles.items():
+            if scope == "shared":
+                profile.feed(chunk_line)
+            else:
+                profile.feed(chunk_line[chunk_core == int(scope[4:])])
+    return profiles
+
+
+def curves(profiles, max_assoc, line_size):
+    """Miss-ratio rows for every profile."""
+    rows = []
+    for (scope, sets), profile in profiles.items():
+        if sets == 1:
+            assocs = [1 << k for k in range(profile.cap.bit_length())]
+        else:
+            assocs = range(1, max_assoc + 1)
+        for assoc in assocs:
+            misses = profile.misses(assoc)
+            rows.append(
+                {
+                    "scope": scope,
+                    "sets": sets,
+                    "assoc": assoc,
+                    "size": sets * assoc * line_size,
+                    "accesses": profile.accesses,
+                    "misses": misses,
+                    "miss_ratio": round(misses / profile.accesses, 6)
+                    if profile.accesses
+                    else None,
+                }
+            )
+    return rows
+
+
+def knees(rows, count, min_size=0):
+    """
+    Capacities of at least ``min_size`` where the shared fully associative
+    curve drops most from the previous (half as large) capacity.
+    """
+    curve = [
+        row for row in rows if row["scope"] == "shared" and row["sets"] == 1
+    ]
+    drops = [
+        (before["miss_ratio"] - after["miss_ratio"], after["size"])
+        for before, after in zip(curve, curve[1:])
+        if before["miss_ratio"] is not None and after["size"] >= min_size
+    ]
+    return sorted(size for drop, size in sorted(drops)[::-1][:count])
+
+
+def format_size(size):
+    for unit, scale in (("MiB", 1024**2), ("KiB", 1024)):
+        if size >= scale and size % scale == 0:
+            return f"{size // scale}{unit}"
+    return f"{size}B"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Miss-ratio curves of a memory trace for every cache "
+        "size and associativity."
+    )
+    parser.add_argument("trace", type=str)
+    parser.add_argument(
+        "--num-sets",
+        nargs="*",
+        type=int,
+        default=[256, 1024, 4096],
+        help="Set counts of the set-associative curves.",
+    )
+    parser.add_argument("--max-assoc", type=int, default=16)
+    parser.add_argument(
+        "--max-size",
+        type=str,
+        default="64MiB",
+        help="Largest fully associative capacity profiled.",
+    )
+    parser.add_argument("--line-size", type=int, default=64)
+    parser.add_argument("--num-cores", type=int, default=None)
+    parser.add_argument(
+        "--ifetch",
+        action="store_true",
+        help="Include instruction fetches.",
+    )
+    parser.add_argument(
+        "--chunk",
+        type=int,
+        default=1 << 20,
+        help="Accesses profiled per chunk.",
+    )
+    parser.add_argument(
+        "--suggest",
+        type=int,
+        default=4,
+        help="Number of capacities to suggest for gem5 runs.",
+    )
+    parser.add_argument(
+        "--min-suggest-size",
+        type=str,
+        default="64KiB",
+        help="Smallest capacity suggested (the L1s are not swept).",
+    )
+    parser.add_argument("--out", type=str, default="mrc.csv")
+    args = parser.parse_args(argv)
+
+    for sets in args.num_sets:
+        if sets < 1 or sets & (sets - 1):
+            parser.error("--num-sets must be powers of two")
+    trace_cores, chunks = open_trace(args.trace, args.chunk)
+    max_lines = parse_size(args.max_size) // args.line_size
+
+    def lines():
+        for core, address, kind in chunks:
+            if not args.ifetch:
+                data = kind != IFETCH
+                core, address = core[data], address[data]
+            yield (
+                np.asarray(core, dtype=np.int64),
+                np.asarray(address, dtype=np.int64) // args.line_size,
+            )
+
+    start = time.time()
+    profiles = profile_trace(
+        lines(),
+        args.num_cores or trace_cores,
+        args.num_sets,
+        args.max_assoc,
+        max_lines,
+    )
+    elapsed = time.time() - start
+    rows = curves(profiles, args.max_assoc, args.line_size)
+    with open(args.out, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CURVE_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    accesses = profiles["shared", 1].accesses
+    print(
+        f"{accesses} accesses profiled in {elapsed:.2f}s, "
+        f"curves written to {args.out}"
+    )
+    if args.suggest:
+        sizes = ", ".join(
+            format_size(size)
+            for size in knees(
+                rows, args.suggest, parse_size(args.min_suggest_size)
+            )
+        )
+        print(f"Largest shared miss-ratio drops at: {sizes}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
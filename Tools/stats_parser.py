@@ -0,0 +1,411 @@
+"""
+Streaming parser and indexed on-disk store for gem5 stats.txt dumps.
+
+A stats.txt file holds one or more blocks delimited by the
+"Begin Simulation Statistics" / "End Simulation Statistics" markers. The
+parser reads one block at a time, so memory use is bounded by the size of
+a single dump, no matter how many periodic dumps the file contains.
+
+Every stat line is flattened to a key exactly as gem5 prints it:
+
+- scalars:        ``simTicks``
+- vector entries: ``...transDist::ReadReq``, ``...::0``, ``...::total``
+- distributions:  ``...delayHistogram::samples``, ``...::mean``,
+                  ``...::0-3``, ``...::bucket_size``
+- histogram rows: ``...delayHistogram |  c  p%  cum% | ...`` is stored
+                  under the bare name as the list of bucket counts.
+
+`build_store()` writes a columnar store next to the stats file (or in a
+given directory) and `StatsStore` answers queries from it without
+re-reading the text:
+
+```
+python3 Tools/stats_parser.py build m5out/stats.txt
+python3 Tools/stats_parser.py query m5out/stats.txt --dump 3 \
+    'board.cache_hierarchy.ruby_system.*'
+```
+
+Store layout (all little endian):
+
+- ``names``      one stat name per line; the line number is the name id.
+- ``entries.bin`` per dump, records of (name id, value count, flags,
+                  value offset) sorted by name id, so a name is found in
+                  a dump by bisecting its slice of the file.
+- ``values.bin`` float64 values referenced by the entries.
+- ``dumps.json`` entry range of every dump plus the identity (size,
+                  mtime) of the source file, used to detect stale stores.
+"""
+
+import argparse
+import bisect
+import fnmatch
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+
+BEGIN_MARKER = "Begin Simulation Statistics"
+END_MARKER = "End Simulation Statistics"
+
+STORE_VERSION = 1
+STORE_SUFFIX = ".statsdb"
+
+# name id, number of values, flags, index of the first value in values.bin
+ENTRY = struct.Struct("<IIIQ")
+FLAG_LIST = 1
+VALUE = struct.Struct("<d")
+
+
+def parse_value(token):
+    """Convert a gem5 number token ("12", "0.5", "nan", "-inf") to float."""
+    try:
+        return float(token)
+    except ValueError:
+        # Older gem5 versions print "no_value" for empty formulas.
+        return math.nan
+
+
+def parse_line(line):
+    """
+    Parse a single stat line into ``(name, value)``.
+
+    ``value`` is a float for scalar-like lines and a list of bucket counts
+    for histogram rows. Returns None for blank or non-stat lines.
+    """
+    tokens = line.split()
+    if len(tokens) < 2 or tokens[0].startswith("-"):
+        return None
+    name = tokens[0]
+    if tokens[1] != "|":
+        return name, parse_value(tokens[1])
+
+    # Histogram row: "| count pct cum | count pct cum | ... # desc (unit)"
+    counts = []
+    expect_count = True
+    for token in tokens[1:]:
+        if token.startswith("#") or token.startswith("("):
+            break
+        if token == "|":
+            expect_count = True
+        elif expect_count:
+            counts.append(parse_value(token))
+            expect_count = False
+    return name, counts
+
+
+def iter_dumps(path):
+    """
+    Yield one ``{name: value}`` dict per stats dump in ``path``.
+
+    Only the current block is held in memory.
+    """
+    with open(path) as stats_file:
+        dump = None
+        for line in stats_file:
+            if BEGIN_MARKER in line:
+                dump = {}
+            elif END_MARKER in line:
+                if dump is not None:
+                    yield dump
+                dump = None
+            elif dump is not None:
+                parsed = parse_line(line)
+                if parsed is not None:
+                    dump[parsed[0]] = parsed[1]
+        # A dump truncated by a killed simulation is still worth keeping.
+        if dump:
+            yield dump
+
+
+def split_name(key):
+    """Split ``a.b.stat::sub`` into ``("a.b.stat", "sub")``."""
+    base, sep, sub = key.partition("::")
+    return base, (sub if sep else None)
+
+
+def group_stat(stats, name):
+    """
+    Collect a vector or distribution from a flat ``{key: value}`` mapping.
+
+    Returns ``{sub: value}`` for every ``name::sub`` key, plus the
+    histogram row under the key ``"|"`` when one is present. A scalar
+    returns ``{None: value}``.
+    """
+    grouped = {}
+    prefix = name + "::"
+    for key, value in stats.items():
+        if key == name:
+            grouped["|" if isinstance(value, list) else None] = value
+        elif key.startswith(prefix):
+            grouped[key[len(prefix) :]] = value
+    return grouped
+
+
+def stat_kind(grouped):
+    """Classify the output of `group_stat()`."""
+    if "|" in grouped:
+        return "histogram"
+    if "samples" in grouped or "bucket_size" in grouped:
+        return "distribution"
+    if set(grouped) == {None}:
+        return "scalar"
+    return "vector"
+
+
+def source_identity(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def default_store_dir(stats_path):
+    return stats_path + STORE_SUFFIX
+
+
+def build_store(stats_path, store_dir=None):
+    """
+    Parse ``stats_path`` once and write the columnar store.
+
+    The store is written to a temporary directory and renamed into place
+    so readers never observe a half-written store.
+    """
+    store_dir = store_dir or default_store_dir(stats_path)
+    tmp_dir = f"{store_dir}.tmp{os.getpid()}"
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    name_ids = {}
+    dumps = []
+    num_entries = 0
+    num_values = 0
+    with open(os.path.join(tmp_dir, "names"), "w") as names_file, open(
+        os.path.join(tmp_dir, "entries.bin"), "wb"
+    ) as entries_file, open(
+        os.path.join(tmp_dir, "values.bin"), "wb"
+    ) as values_file:
+        for dump in iter_dumps(stats_path):
+            records = []
+            for name, value in dump.items():
+                name_id = name_ids.get(name)
+                if name_id is None:
+                    name_id = name_ids[name] = len(name_ids)
+                    names_file.write(name + "\n")
+                records.append((name_id, value))
+            records.sort(key=lambda record: record[0])
+
+            first_entry = num_entries
+            for name_id, value in records:
+                if isinstance(value, list):
+                    flags, values = FLAG_LIST, value
+                else:
+                    flags, values = 0, [value]
+                entries_file.write(
+                    ENTRY.pack(name_id, len(values), flags, num_values)
+                )
+                values_file.write(
+                    struct.pack(f"<{len(values)}d", *values)
+                )
+                num_values += len(values)
+            num_entries += len(records)
+            dumps.append({"first": first_entry, "count": len(records)})
+
+    with open(os.path.join(tmp_dir, "dumps.json"), "w") as meta_file:
+        json.dump(
+            {
+                "version": STORE_VERSION,
+                "source": os.path.abspath(stats_path),
+                "identity": source_identity(stats_path),
+                "dumps": dumps,
+            },
+            meta_file,
+        )
+
+    if os.path.isdir(store_dir):
+        for entry in os.listdir(store_dir):
+            os.remove(os.path.join(store_dir, entry))
+        os.rmdir(store_dir)
+    os.rename(tmp_dir, store_dir)
+    return store_dir
+
+
+def store_is_current(stats_path, store_dir):
+    meta_path = os.path.join(store_dir, "dumps.json")
+    if not os.path.exists(meta_path):
+        return False
+    with open(meta_path) as meta_file:
+        meta = json.load(meta_file)
+    return meta.get("version") == STORE_VERSION and meta.get(
+        "identity"
+    ) == source_identity(stats_path)
+
+
+class StatsStore:
+    """Read-only view of a store written by `build_store()`."""
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, "dumps.json")) as meta_file:
+            meta = json.load(meta_file)
+        if meta.get("version") != STORE_VERSION:
+            raise ValueError(f"{store_dir}: unsupported store version")
+        self.source = meta["source"]
+        self.dumps = meta["dumps"]
+
+        with open(os.path.join(store_dir, "names")) as names_file:
+            self.names = names_file.read().splitlines()
+        self.name_ids = {name: i for i, name in enumerate(self.names)}
+        self.sorted_names = sorted(self.names)
+
+        self._entries = self._map("entries.bin")
+        self._values = self._map("values.bin")
+
+    def _map(self, filename):
+        with open(os.path.join(self.store_dir, filename), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self.dumps)
+
+    def _entry(self, index):
+        return ENTRY.unpack_from(self._entries, index * ENTRY.size)
+
+    def _find(self, dump, name_id):
+        """Bisect the sorted entry slice of ``dump`` for ``name_id``."""
+        first = self.dumps[dump]["first"]
+        lo, hi = first, first + self.dumps[dump]["count"]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entry(mid)[0] < name_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < first + self.dumps[dump]["count"]:
+            entry = self._entry(lo)
+            if entry[0] == name_id:
+                return entry
+        return None
+
+    def _read(self, entry):
+        _, count, flags, offset = entry
+        values = struct.unpack_from(
+            f"<{count}d", self._values, offset * VALUE.size
+        )
+        return list(values) if flags & FLAG_LIST else values[0]
+
+    def get(self, dump, name, default=None):
+        """Value of ``name`` in ``dump`` (float, or list for histograms)."""
+        name_id = self.name_ids.get(name)
+        if name_id is None:
+            return default
+        entry = self._find(dump, name_id)
+        if entry is None:
+            return default
+        return self._read(entry)
+
+    def match(self, pattern):
+        """
+        Names matching a glob ``pattern``. A trailing ``*`` after a plain
+        prefix is answered by bisecting the sorted name list.
+        """
+        prefix = pattern.rstrip("*")
+        if pattern.endswith("*") and not any(c in prefix for c in "*?["):
+            start = bisect.bisect_left(self.sorted_names, prefix)
+            names = []
+            for name in self.sorted_names[start:]:
+                if not name.startswith(prefix):
+                    break
+                names.append(name)
+            return names
+        if not any(c in pattern for c in "*?["):
+            return [pattern] if pattern in self.name_ids else []
+        return [n for n in self.sorted_names if fnmatch.fnmatchcase(n, pattern)]
+
+    def query(self, dump, pattern):
+        """``{name: value}`` for every name matching ``pattern`` in ``dump``."""
+        result = {}
+        for name in self.match(pattern):
+            value = self.get(dump, name)
+            if value is not None:
+                result[name] = value
+        return result
+
+    def series(self, name):
+        """Value of ``name`` across all dumps (None where absent)."""
+        return [self.get(dump, name) for dump in range(len(self))]
+
+    def dump(self, index):
+        """Materialize a whole dump as a ``{name: value}`` dict."""
+        first = self.dumps[index]["first"]
+        stats = {}
+        for i in range(first, first + self.dumps[index]["count"]):
+            entry = self._entry(i)
+            stats[self.names[entry[0]]] = self._read(entry)
+        return stats
+
+
+def open_store(stats_path, store_dir=None, rebuild=False):
+    """Open the store for ``stats_path``, (re)building it when stale."""
+    store_dir = store_dir or default_store_dir(stats_path)
+    if rebuild or not store_is_current(stats_path, store_dir):
+        build_store(stats_path, store_dir)
+    return StatsStore(store_dir)
+
+
+def format_value(value):
+    if isinstance(value, list):
+        return " ".join(f"{v:g}" for v in value)
+    return f"{value:g}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Index gem5 stats.txt dumps and query them."
+    )
+    parser.add_argument(
+        "--store",
+        type=str,
+        default=None,
+        help="Store directory (default: <stats.txt>" + STORE_SUFFIX + ").",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="(Re)build the store.")
+    build.add_argument("stats", nargs="+", help="stats.txt files to index.")
+
+    query = subparsers.add_parser("query", help="Print matching stats.")
+    query.add_argument("stats", help="stats.txt file to query.")
+    query.add_argument("pattern", help="Stat name or glob pattern.")
+    query.add_argument(
+        "--dump",
+        type=int,
+        default=None,
+        help="Dump index, starting at 0 (default: all dumps).",
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        for stats_path in args.stats:
+            store = open_store(stats_path, args.store, rebuild=True)
+            print(
+                f"{stats_path}: {len(store)} dump(s), "
+                f"{len(store.names)} stat names -> {store.store_dir}"
+            )
+        return 0
+
+    store = open_store(args.stats, args.store)
+    if args.dump is not None and not 0 <= args.dump < len(store):
+        parser.error(
+            f"--dump {args.dump} is out of range: {args.stats} has "
+            f"{len(store)} dump(s)"
+        )
+    dumps = range(len(store)) if args.dump is None else [args.dump]
+    for dump in dumps:
+        for name, value in store.query(dump, args.pattern).items():
+            print(f"{dump}\t{name}\t{format_value(value)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())